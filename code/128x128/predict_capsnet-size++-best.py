@@ -10,25 +10,12 @@ from tensorflow.keras.optimizers import Adam
 import seaborn as sns
 from matplotlib import pyplot as plt
 from keras.utils.layer_utils import count_params
+import os
+import sys
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from capsnet import Capsule, Length, margin_loss  # noqa: E402
 
 
-def squash(x, axis=-1):
-    s_squared_norm = tf.reduce_sum(
-        tf.square(x), axis, keepdims=True) + tf.keras.backend.epsilon()
-    scale = tf.sqrt(s_squared_norm) / (0.5 + s_squared_norm)
-    return scale * x
-
-
-def softmax(x, axis=-1):
-    ex = tf.exp(x - tf.reduce_max(x, axis=axis, keepdims=True))
-    return ex / tf.reduce_sum(ex, axis=axis, keepdims=True)
-
-
-def margin_loss(y_true, y_pred):
-    lamb, margin = 0.5, 0.1
-    return tf.reduce_sum(y_true * tf.square(tf.keras.backend.relu(1 - margin - y_pred)) + lamb * (
-        1 - y_true) * tf.square(tf.keras.backend.relu(y_pred - margin)), axis=-1)
-
 def train_generator(generator, batch_size, shift_fraction=0.):
 
     while True:
@@ -54,83 +41,6 @@ def specificity_score(y_true, y_pred, labels=None, pos_label=1, average='binary'
     return specificity
 
 
-class Capsule(layers.Layer):
-
-    def __init__(self,
-                 num_capsule,
-                 dim_capsule,
-                 routings=3,
-                 share_weights=True,
-                 activation='squash',
-                 **kwargs):
-        super(Capsule, self).__init__(**kwargs)
-        self.num_capsule = num_capsule
-        self.dim_capsule = dim_capsule
-        self.routings = routings
-        self.share_weights = share_weights
-        if activation == 'squash':
-            self.activation = squash
-        else:
-            self.activation = activations.get(activation)
-
-    def build(self, input_shape):
-        input_dim_capsule = input_shape[-1]
-        if self.share_weights:
-            self.kernel = self.add_weight(
-                name='capsule_kernel',
-                shape=(1, input_dim_capsule,
-                       self.num_capsule * self.dim_capsule),
-                initializer='glorot_uniform',
-                trainable=True)
-        else:
-            input_num_capsule = input_shape[-2]
-            self.kernel = self.add_weight(
-                name='capsule_kernel',
-                shape=(input_num_capsule, input_dim_capsule,
-                       self.num_capsule * self.dim_capsule),
-                initializer='glorot_uniform',
-                trainable=True)
-
-    def call(self, inputs):
-
-        if self.share_weights:
-            hat_inputs = tf.keras.backend.conv1d(inputs, self.kernel)
-        else:
-            hat_inputs = tf.keras.backend.local_conv1d(
-                inputs, self.kernel, [1], [1])
-
-        batch_size = tf.shape(inputs)[0]
-        input_num_capsule = tf.shape(inputs)[1]
-        hat_inputs = tf.reshape(hat_inputs,
-                                (batch_size, input_num_capsule,
-                                 self.num_capsule, self.dim_capsule))
-        hat_inputs = tf.transpose(hat_inputs, (0, 2, 1, 3))
-
-        b = tf.zeros_like(hat_inputs[:, :, :, 0])
-        for i in range(self.routings):
-            c = softmax(b, 1)
-            o = self.activation(
-                tf.keras.backend.batch_dot(c, hat_inputs, [2, 2]))
-            if i < self.routings - 1:
-                b = tf.keras.backend.batch_dot(o, hat_inputs, [2, 3])
-                if tf.keras.backend.backend() == 'theano':
-                    o = tf.reduce_sum(o, axis=1)
-
-        return o
-
-    def compute_output_shape(self, input_shape):
-        return input_shape[:-1]
-
-    def get_config(self):
-        config = super(Capsule, self).get_config()
-        config.update({'num_capsule': self.num_capsule,
-                       'dim_capsule': self.dim_capsule,
-                       'routings': self.routings,
-                       'share_weights': self.share_weights,
-                       'activation': activations.serialize(self.activation)})
-        return config
-
-
 def add_commas(num):
     num_str = str(num)
     if len(num_str) <= 3:
@@ -209,7 +119,7 @@ x = layers.Reshape((-1, 128))(x)
 x = Capsule(32, 8, 3, True)(x)
 x = Capsule(32, 8, 3, True)(x)
 capsule = Capsule(num_classes, 16, 5, True)(x) 
-output = layers.Lambda(lambda z: K.sqrt(K.sum(K.square(z), 2)))(capsule)
+output = Length(epsilon=0.)(capsule)
 model = models.Model(inputs=input_image, outputs=output)
 
 # 使用 margin loss
@@ -287,7 +197,7 @@ x = layers.Reshape((-1, 128))(x)
 x = Capsule(32, 8, 3, True)(x)
 x = Capsule(32, 8, 3, True)(x)
 capsule = Capsule(num_classes, 16, 5, True)(x) 
-output = layers.Lambda(lambda z: K.sqrt(K.sum(K.square(z), 2)))(capsule)
+output = Length(epsilon=0.)(capsule)
 model = models.Model(inputs=input_image, outputs=output)
 model.load_weights('weights-capsnet-latest-15-200-183.h5')
 
@@ -364,7 +274,7 @@ x = layers.Conv2D(256, (9, 9), activation='relu')(input_image)
 x = layers.Conv2D(256, (9, 9), activation='relu', strides=2)(x)
 x = layers.Reshape((-1, 128))(x)
 capsule = Capsule(num_classes, 16, 3, True)(x)
-output = layers.Lambda(lambda z: K.sqrt(K.sum(K.square(z), 2)))(capsule)
+output = Length(epsilon=0.)(capsule)
 model = models.Model(inputs=input_image, outputs=output)
 
 # 使用 margin loss
@@ -20,33 +20,10 @@ from matplotlib import pyplot as plt
 import time
 from keras.utils.layer_utils import count_params
 from sklearn.metrics import accuracy_score, classification_report, confusion_matrix
-from tensorflow.python.util.tf_export import keras_export
-from tensorflow.keras.callbacks import Callback
-
-
-def squash(x, axis=-1):
-    s_squared_norm = K.sum(K.square(x), axis, keepdims=True) + K.epsilon()
-    scale = K.sqrt(s_squared_norm) / (0.5 + s_squared_norm)
-    return scale * x
-
-
-def softmax(x, axis=-1):
-    ex = K.exp(x - K.max(x, axis=axis, keepdims=True))
-    return ex / K.sum(ex, axis=axis, keepdims=True)
-
-
-def margin_loss(y_true, y_pred):
-    lamb, margin = 0.5, 0.1
-    return K.sum(y_true * K.square(K.relu(1 - margin - y_pred)) + lamb * (
-        1 - y_true) * K.square(K.relu(y_pred - margin)), axis=-1)
-
-
-def caps_batch_dot(x, y):
-    x = K.expand_dims(x, 2)
-    if K.int_shape(x)[3] is not None:
-        y = K.permute_dimensions(y, (0, 1, 3, 2))
-    o = tf.matmul(x, y)
-    return K.squeeze(o, 2)
+import sys
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from capsnet import Capsule, Length, margin_loss  # noqa: E402
+from capsnet.optimizers import WeightDecayScheduler  # noqa: E402
 
 
 def specificity_score(y_true, y_pred, labels=None, pos_label=1, average='binary'):
@@ -81,125 +58,6 @@ def add_commas(num):
         return add_commas(num_str[:-3]) + ',' + num_str[-3:]
 
 
-class Capsule(Layer):
-    """ A Capsule Implement with Pure Keras
-    There are two vesions of Capsule.
-    One is like dense layer (for the fixed-shape input),
-    and the other is like timedistributed dense (for various length input).
-    The input shape of Capsule must be (batch_size,
-                                        input_num_capsule,
-                                        input_dim_capsule
-                                       )
-    and the output shape is (batch_size,
-                             num_capsule,
-                             dim_capsule
-                            )
-    Capsule Implement is from https://github.com/bojone/Capsule/
-    Capsule Paper: https://arxiv.org/abs/1710.09829
-    """
-    def __init__(self,
-                 num_capsule,
-                 dim_capsule,
-                 routings=3,
-                 share_weights=True,
-                 activation='squash',
-                 **kwargs):
-        super(Capsule, self).__init__(**kwargs)
-        self.num_capsule = num_capsule
-        self.dim_capsule = dim_capsule
-        self.routings = routings
-        self.share_weights = share_weights
-        if activation == 'squash':
-            self.activation = squash
-        else:
-            self.activation = activations.get(activation)
-
-    def build(self, input_shape):
-        input_dim_capsule = input_shape[-1]
-        if self.share_weights:
-            self.kernel = self.add_weight(
-                name='capsule_kernel',
-                shape=(1, input_dim_capsule,
-                       self.num_capsule * self.dim_capsule),
-                initializer='glorot_uniform',
-                trainable=True)
-        else:
-            if input_shape[-2] is None:
-                raise ValueError("Input Shape must be defied if weights not shared.")
-            input_num_capsule = input_shape[-2]
-            self.kernel = self.add_weight(
-                name='capsule_kernel',
-                shape=(input_num_capsule, input_dim_capsule,
-                       self.num_capsule * self.dim_capsule),
-                initializer='glorot_uniform',
-                trainable=True)
-
-    def call(self, inputs):
-        """Following the routing algorithm from Hinton's paper,
-        but replace b = b + <u,v> with b = <u,v>.
-        This change can improve the feature representation of Capsule.
-        However, you can replace
-            b = K.batch_dot(outputs, hat_inputs, [2, 3])
-        with
-            b += K.batch_dot(outputs, hat_inputs, [2, 3])
-        to realize a standard routing.
-        """
-
-        if self.share_weights:
-            hat_inputs = K.conv1d(inputs, self.kernel)
-        else:
-            hat_inputs = K.local_conv1d(inputs, self.kernel, [1], [1])
-
-        batch_size = K.shape(inputs)[0]
-        input_num_capsule = K.shape(inputs)[1]
-        hat_inputs = K.reshape(hat_inputs,
-                               (batch_size, input_num_capsule,
-                                self.num_capsule, self.dim_capsule))
-        hat_inputs = K.permute_dimensions(hat_inputs, (0, 2, 1, 3))
-
-        b = K.zeros_like(hat_inputs[:, :, :, 0])
-        for i in range(self.routings):
-            c = softmax(b, 1)
-            o = self.activation(caps_batch_dot(c, hat_inputs))
-            if i < self.routings - 1:
-                b = caps_batch_dot(o, hat_inputs)
-                if K.backend() == 'theano':
-                    o = K.sum(o, axis=1)
-
-        return o
-
-    def compute_output_shape(self, input_shape):
-        return (None, self.num_capsule, self.dim_capsule)
-
-    def get_config(self):
-        config = {
-            'num_capsule': self.num_capsule,
-            'dim_capsule': self.dim_capsule,
-            'routings': self.routings
-        }
-        base_config = super(Capsule, self).get_config()
-        return dict(list(base_config.items()) + list(config.items()))
-
-
-class Length(Layer):
-    """
-    Compute the length of vectors. This is used to compute a Tensor that has the
-    same shape with y_true in margin_loss. Using this layer as model's output can
-    directly predict labels by using `y_pred = np.argmax(model.predict(x), 1)`
-    inputs: shape=[None, num_vectors, dim_vector]
-    output: shape=[None, num_vectors]
-    source: https://github.com/XifengGuo/CapsNet-Keras/
-    """
-    def call(self, inputs, **kwargs):
-        return K.sqrt(K.sum(K.square(inputs), -1) + K.epsilon())
-
-    def compute_output_shape(self, input_shape):
-        return input_shape[:-1]
-
-    def get_config(self):
-        config = super(Length, self).get_config()
-        return config
-    
 def lr_schedule(epoch):
     """Learning Rate Schedule
     Learning rate is scheduled to be reduced after 20, 30 epochs.
@@ -233,58 +91,7 @@ def wd_schedule(epoch):
     print('Weight decay: ', wd)
     return wd
 
-# just copy the implement of LearningRateScheduler, and then change the lr with weight_decay
-@keras_export('keras.callbacks.WeightDecayScheduler')
-class WeightDecayScheduler(Callback):
-    """Weight Decay Scheduler.
-
-    Arguments:
-        schedule: a function that takes an epoch index as input
-            (integer, indexed from 0) and returns a new
-            weight decay as output (float).
-        verbose: int. 0: quiet, 1: update messages.
-
-    ```python
-    # This function keeps the weight decay at 0.001 for the first ten epochs
-    # and decreases it exponentially after that.
-    def scheduler(epoch):
-      if epoch < 10:
-        return 0.001
-      else:
-        return 0.001 * tf.math.exp(0.1 * (10 - epoch))
-
-    callback = WeightDecayScheduler(scheduler)
-    model.fit(data, labels, epochs=100, callbacks=[callback],
-              validation_data=(val_data, val_labels))
-    ```
-    """
-
-    def __init__(self, schedule, verbose=0):
-        super(WeightDecayScheduler, self).__init__()
-        self.schedule = schedule
-        self.verbose = verbose
-
-    def on_epoch_begin(self, epoch, logs=None):
-        if not hasattr(self.model.optimizer, 'weight_decay'):
-            raise ValueError('Optimizer must have a "weight_decay" attribute.')
-        try:  # new API
-            weight_decay = float(K.get_value(self.model.optimizer.weight_decay))
-            weight_decay = self.schedule(epoch, weight_decay)
-        except TypeError:  # Support for old API for backward compatibility
-            weight_decay = self.schedule(epoch)
-        if not isinstance(weight_decay, (float, np.float32, np.float64)):
-            raise ValueError('The output of the "schedule" function '
-                             'should be float.')
-        K.set_value(self.model.optimizer.weight_decay, weight_decay)
-        if self.verbose > 0:
-            print('\nEpoch %05d: WeightDecayScheduler reducing weight '
-                  'decay to %s.' % (epoch + 1, weight_decay))
-
-    def on_epoch_end(self, epoch, logs=None):
-        logs = logs or {}
-        logs['weight_decay'] = K.get_value(self.model.optimizer.weight_decay)
 
-        
 data_augmentation = True
 save_dir = os.path.join(os.getcwd(), 'saved_models')
 model_name = 'keras_densenet_capsule_trained_model-r8-r4.h5'
@@ -306,7 +113,7 @@ x = Reshape((-1, 512))(base_model.output)
 x = Capsule(32, 16, 3, True)(x)
 x = Capsule(32, 16, 3, True)(x)
 capsule = Capsule(num_classes, 32, 5, True)(x) 
-output = Lambda(lambda z: K.sqrt(K.sum(K.square(z), 2)))(capsule)
+output = Length(epsilon=0.)(capsule)
 model = Model(inputs=base_model.input, outputs=output)
 
 lr = 1e-4
@@ -0,0 +1,102 @@
+# -*- coding: utf-8 -*-
+"""Augmentation cost per batch: `ImageDataGenerator.random_transform` image
+by image vs. `capsnet.augmentation.BatchAugmentation` (eager and in a
+`tf.function`).
+
+Two checks come first: with the same parameters both give the same batch,
+and over many random draws the mean and standard deviation of every pixel
+agree (relative to the pixel spread of the batch) as closely as two
+independent runs of `ImageDataGenerator` do ('noise').
+
+    python3 benchmark/benchmark_augmentation.py --image-sizes 32 64 128 200 --batch-size 40
+"""
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+import tensorflow as tf
+from tensorflow.keras.preprocessing.image import ImageDataGenerator
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from capsnet.augmentation import AUGMENTATION, BatchAugmentation, transform_matrices  # noqa: E402
+
+
+def keras_augment(datagen, images):
+    return np.stack([datagen.random_transform(image) for image in images])
+
+
+def same_parameters_difference(datagen, images):
+    """Largest difference for parameters drawn by `ImageDataGenerator`."""
+    n, height, width = images.shape[:3]
+    parameters = [datagen.get_random_transform(images.shape[1:]) for _ in range(n)]
+    expected = np.stack([datagen.apply_transform(image, p) for image, p in zip(images, parameters)])
+    matrices = transform_matrices(
+        flip=np.array([p['flip_horizontal'] for p in parameters], bool), height=height, width=width,
+        **{name: np.array([p[name] for p in parameters], float)
+           for name in ('theta', 'tx', 'ty', 'shear', 'zx', 'zy')})
+    channel_shift = np.array([p['channel_shift_intensity'] for p in parameters], np.float32)
+    batched = BatchAugmentation.apply(images, matrices.reshape(n, 9)[:, :8].astype(np.float32),
+                                      channel_shift).numpy()
+    return np.abs(batched - expected).max()
+
+
+def moments(augment, images, draws):
+    outputs = np.stack([augment(images) for _ in range(draws)])
+    return outputs.mean(0), outputs.std(0)
+
+
+def ms_per_batch(augment, images, repeats):
+    augment(images)  # warm-up / trace
+    start = time.perf_counter()
+    for _ in range(repeats):
+        np.asarray(augment(images))
+    return (time.perf_counter() - start) * 1000 / repeats
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--image-sizes', type=int, nargs='+', default=[32, 64, 128, 200])
+    parser.add_argument('--batch-size', type=int, default=40)
+    parser.add_argument('--repeats', type=int, default=5)
+    parser.add_argument('--draws', type=int, default=200, help='random draws for the moments')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    rng = np.random.RandomState(args.seed)
+    datagen = ImageDataGenerator(**AUGMENTATION)
+    augmentation = BatchAugmentation(args.seed)
+    graph_augmentation = tf.function(BatchAugmentation.apply)
+
+    def graph_augment(images):
+        return graph_augmentation(images, *augmentation.random_transforms(*images.shape[:3]))
+
+    print('%-6s %10s %10s %10s %8s %10s %15s %15s' % (
+        'size', 'keras ms', 'batched ms', 'graph ms', 'speedup', 'same-param',
+        'mean diff/noise', 'std diff/noise'))
+    for size in args.image_sizes:
+        # smooth random images, so shifts and rotations change the pixels gradually
+        coarse = rng.uniform(0, 255, (args.batch_size, 8, 8, 3)).astype(np.float32)
+        images = tf.image.resize(coarse, (size, size), method='bicubic').numpy()
+
+        difference = same_parameters_difference(datagen, images[:8])
+        small = images[:4]
+        keras_mean, keras_std = moments(lambda x: keras_augment(datagen, x), small, args.draws)
+        noise_mean, noise_std = moments(lambda x: keras_augment(datagen, x), small, args.draws)
+        batched_mean, batched_std = moments(lambda x: augmentation(x).numpy(), small, args.draws)
+        spread = small.std()
+
+        keras_ms = ms_per_batch(lambda x: keras_augment(datagen, x), images, args.repeats)
+        batched_ms = ms_per_batch(augmentation, images, args.repeats)
+        graph_ms = ms_per_batch(graph_augment, images, args.repeats)
+        print('%-6d %10.1f %10.1f %10.1f %7.1fx %10.1e %7.3f/%.3f %7.3f/%.3f' % (
+            size, keras_ms, batched_ms, graph_ms, keras_ms / min(batched_ms, graph_ms), difference,
+            np.abs(keras_mean - batched_mean).mean() / spread,
+            np.abs(keras_mean - noise_mean).mean() / spread,
+            np.abs(keras_std - batched_std).mean() / spread,
+            np.abs(keras_std - noise_std).mean() / spread))
+
+
+if __name__ == '__main__':
+    main()
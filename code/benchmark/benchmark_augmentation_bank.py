@@ -0,0 +1,90 @@
+# -*- coding: utf-8 -*-
+"""Online augmentation (`ImageDataGenerator`, every epoch) vs. an offline
+augmentation bank (`capsnet.store.build_augmentation_bank`, N variants per
+image, built once): the same model from the same initial weights is trained
+on both and evaluated on the `valid` directory. Reports the one-time build
+time, the training wall-clock and accuracy / F-score / specificity.
+
+    python3 benchmark/benchmark_augmentation_bank.py --dataset 200x200 --variants 8 --epochs 30
+"""
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+from sklearn.metrics import accuracy_score, f1_score
+from tensorflow.keras.optimizers import Adam
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from capsnet import margin_loss  # noqa: E402
+from capsnet.data import flow_from_directory  # noqa: E402
+from capsnet.metrics import specificity_score  # noqa: E402
+from capsnet.models import build_capsnet, preprocess_function  # noqa: E402
+from capsnet.store import StoreIterator, build_augmentation_bank, build_store, store_path  # noqa: E402
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--dataset', default='./')
+    parser.add_argument('--store', default='store')
+    parser.add_argument('--variants', type=int, default=8)
+    parser.add_argument('--backbone', default='densenet121')
+    parser.add_argument('--routings', type=int, default=7)
+    parser.add_argument('--image-size', type=int, default=200)
+    parser.add_argument('--batch-size', type=int, default=40)
+    parser.add_argument('--epochs', type=int, default=30)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--weights', default='imagenet',
+                        help="backbone weights, 'imagenet' or 'none'")
+    args = parser.parse_args()
+
+    image_size = (args.image_size, args.image_size)
+    preprocessing_function = preprocess_function(args.backbone)
+    store = store_path(args.store, 'train', image_size)
+    bank = '%s-bank%d' % (store, args.variants)
+    start = time.perf_counter()
+    if not os.path.exists(store + '.json'):
+        build_store(os.path.join(args.dataset, 'train'), image_size, store)
+    build_augmentation_bank(store, bank, args.variants, seed=args.seed)
+    build_time = time.perf_counter() - start
+
+    loaders = [
+        ('online', flow_from_directory(os.path.join(args.dataset, 'train'), image_size,
+                                       args.batch_size, shuffle=True,
+                                       preprocessing_function=preprocessing_function, augment=True)),
+        ('bank x%d' % args.variants, StoreIterator(bank, args.batch_size, shuffle=True,
+                                                   preprocessing_function=preprocessing_function,
+                                                   seed=args.seed)),
+    ]
+    valid_set = flow_from_directory(os.path.join(args.dataset, 'valid'), image_size,
+                                    args.batch_size, preprocessing_function=preprocessing_function)
+    y_true = valid_set.classes
+
+    weights = None if args.weights == 'none' else args.weights
+    initial_weights = build_capsnet(args.backbone, image_size, valid_set.num_classes, args.routings,
+                                    weights=weights).get_weights()
+    results = []
+    for name, train_set in loaders:
+        print('Augmentation: %s' % name)
+        model = build_capsnet(args.backbone, image_size, valid_set.num_classes, args.routings)
+        model.set_weights(initial_weights)
+        model.compile(loss=margin_loss, optimizer=Adam(learning_rate=1e-4), metrics=['accuracy'])
+        start = time.perf_counter()
+        model.fit(train_set, epochs=args.epochs, verbose=2)
+        train_time = time.perf_counter() - start
+        y_pred = np.argmax(model.predict(valid_set, steps=len(valid_set), verbose=0), axis=1)
+        results.append((name, train_time, accuracy_score(y_true, y_pred),
+                        f1_score(y_true, y_pred, average='weighted'), specificity_score(y_true, y_pred)))
+
+    print('bank build (store + %d variants): %.1f s' % (args.variants, build_time))
+    print('%-10s %10s %10s %10s %10s %12s' % ('training', 'train s', 's/epoch', 'accuracy',
+                                             'F-score', 'specificity'))
+    for name, train_time, accuracy, fscore, specificity in results:
+        print('%-10s %10.1f %10.2f %9.2f%% %9.2f%% %11.2f%%' % (
+            name, train_time, train_time / args.epochs, accuracy * 100, fscore * 100,
+            specificity * 100))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,96 @@
+# -*- coding: utf-8 -*-
+"""Mixed-size crops through the `Input(shape=(None, None, 3))` conv capsule
+model: bucketed execution (`capsnet.bucketing.BucketedPredictor`) vs. one
+graph per image size. Reports traces, the first pass (tracing included),
+a second warm pass and the largest score difference between the two paths.
+
+    python3 benchmark/benchmark_bucketing.py --images 200 --min-size 32 --max-size 200
+"""
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+import tensorflow as tf
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from capsnet.bucketing import DEFAULT_BUCKETS, BucketedPredictor  # noqa: E402
+from capsnet.models import build_conv_capsnet  # noqa: E402
+
+
+class SizePredictor(object):
+    """The unbucketed path: images of the same size are batched together,
+    every size gets its own graph."""
+    def __init__(self, model, batch_size):
+        self.model = model
+        self.batch_size = batch_size
+        self.traces = 0
+        self._predict = tf.function(self._predict_batch)
+
+    def _predict_batch(self, images):
+        self.traces += 1  # runs only while tracing
+        return self.model(images, training=False)
+
+    def predict(self, images):
+        groups = {}
+        for i, image in enumerate(images):
+            groups.setdefault(image.shape, []).append(i)
+        scores = [None] * len(images)
+        for shape, indices in groups.items():
+            for start in range(0, len(indices), self.batch_size):
+                batch = indices[start:start + self.batch_size]
+                x_batch = np.zeros((self.batch_size,) + shape, np.float32)
+                x_batch[:len(batch)] = [images[i] for i in batch]
+                output = self._predict(tf.constant(x_batch)).numpy()
+                for row, i in enumerate(batch):
+                    scores[i] = output[row]
+        return np.stack(scores)
+
+
+def timed(predictor, images):
+    start = time.perf_counter()
+    scores = predictor.predict(images)
+    return scores, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--weights', help='checkpoint of a predict_capsnet-*-best model')
+    parser.add_argument('--images', type=int, default=200)
+    parser.add_argument('--min-size', type=int, default=32)
+    parser.add_argument('--max-size', type=int, default=200)
+    parser.add_argument('--buckets', type=int, nargs='+', default=list(DEFAULT_BUCKETS))
+    parser.add_argument('--batch-size', type=int, default=32)
+    parser.add_argument('--fused', action='store_true')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    rng = np.random.RandomState(args.seed)
+    sizes = rng.randint(args.min_size, args.max_size + 1, size=(args.images, 2))
+    images = [rng.rand(height, width, 3).astype(np.float32) for height, width in sizes]
+
+    bucketed_model = build_conv_capsnet(capsule_mask=True, fused=args.fused)
+    if args.weights is not None:
+        bucketed_model.load_weights(args.weights)
+    model = build_conv_capsnet(fused=args.fused)
+    model.set_weights(bucketed_model.get_weights())
+
+    print('%d images, %d distinct sizes, buckets %s' % (
+        args.images, len(set(map(tuple, sizes))), args.buckets))
+    print('%-10s %8s %12s %12s %12s' % ('path', 'traces', 'first pass s', 'warm pass s',
+                                         'warm img/s'))
+    results = {}
+    for name, predictor in (('per-size', SizePredictor(model, args.batch_size)),
+                            ('bucketed', BucketedPredictor(bucketed_model, args.buckets,
+                                                           args.batch_size))):
+        _, cold = timed(predictor, images)
+        scores, warm = timed(predictor, images)
+        results[name] = scores
+        print('%-10s %8d %12.2f %12.2f %12.1f' % (name, predictor.traces, cold, warm,
+                                                   args.images / warm))
+    print('max score difference: %.2e' % np.abs(results['bucketed'] - results['per-size']).max())
+
+
+if __name__ == '__main__':
+    main()
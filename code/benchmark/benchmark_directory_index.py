@@ -0,0 +1,130 @@
+# -*- coding: utf-8 -*-
+"""Startup listing of an image directory: the `flow_from_directory` scan
+vs. `capsnet.index.DirectoryIndex` (first build with hashing, an update of
+an unchanged tree, an update after adding files to one directory, the same
+with `verify=True`). Runs on --directory, or on a synthetic tree of small
+files. The listing is also compared with `flow_from_directory` on a small
+tree with symlinks (a symlinked class, a symlinked and a cyclic
+subdirectory, a broken image symlink); exits with 1 if any listing differs.
+
+    python3 benchmark/benchmark_directory_index.py --files 50000 --directories 200
+"""
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+from tensorflow.keras.preprocessing.image import ImageDataGenerator
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from capsnet.index import DirectoryIndex  # noqa: E402
+
+
+def synthetic_tree(root, files, directories):
+    # two classes, each with `directories` board folders of small "images"
+    per_directory = max(1, files // (2 * directories))
+    for label in ('defect', 'ok'):
+        for d in range(directories):
+            path = os.path.join(root, label, 'board%04d' % d)
+            os.makedirs(path)
+            for i in range(per_directory):
+                with open(os.path.join(path, '%05d.png' % i), 'wb') as f:
+                    f.write(os.urandom(256))
+
+
+def symlink_tree(root):
+    outside = os.path.join(root, 'outside')
+    tree = os.path.join(root, 'tree')
+    for path in (os.path.join(outside, 'extra'), os.path.join(outside, 'class'),
+                 os.path.join(tree, 'a', 'sub'), os.path.join(tree, 'b')):
+        os.makedirs(path)
+    for path in (os.path.join(outside, 'extra', 'e.png'), os.path.join(outside, 'class', '2.png'),
+                 os.path.join(tree, 'a', '1.png'), os.path.join(tree, 'a', 'sub', '3.png'),
+                 os.path.join(tree, 'b', '1.png')):
+        with open(path, 'wb') as f:
+            f.write(os.urandom(256))
+    os.symlink(os.path.join(outside, 'extra'), os.path.join(tree, 'a', 'link'))
+    os.symlink(os.path.join(tree, 'a'), os.path.join(tree, 'a', 'sub', 'cycle'))
+    os.symlink(os.path.join(tree, 'b', 'missing.png'), os.path.join(tree, 'b', 'broken.png'))
+    os.symlink(os.path.join(outside, 'class'), os.path.join(tree, 'c'))
+    return tree
+
+
+def same_listing(index, root):
+    keras = ImageDataGenerator().flow_from_directory(root, class_mode=None, shuffle=False)
+    return index.listing() == (keras.filenames, keras.classes.tolist(), keras.class_indices)
+
+
+def timed(function):
+    start = time.perf_counter()
+    result = function()
+    return result, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--directory', help='image directory, one subdirectory per class')
+    parser.add_argument('--files', type=int, default=20000)
+    parser.add_argument('--directories', type=int, default=100)
+    args = parser.parse_args()
+
+    root = args.directory
+    scratch = None
+    if root is None:
+        scratch = root = tempfile.mkdtemp()
+        synthetic_tree(root, args.files, args.directories)
+    index_path = os.path.join(tempfile.mkdtemp(), 'index.json')
+    try:
+        keras, keras_time = timed(lambda: ImageDataGenerator().flow_from_directory(
+            root, class_mode=None, shuffle=False))
+        rows = [('flow_from_directory scan', keras_time, None)]
+
+        def update(verify=False):
+            # load, update and save, what a loader does at startup
+            index = DirectoryIndex(root, index_path, verify=verify)
+            stats = index.update()
+            if index.changed:
+                index.save()
+            return index, stats
+
+        for name in ('index build', 'index update, unchanged'):
+            (index, stats), seconds = timed(update)
+            rows.append((name, seconds, stats))
+        changed = sorted(d for d in index.directories if d != '.')[-1]
+        for i in range(10):
+            with open(os.path.join(root, changed, 'new%02d.png' % i), 'wb') as f:
+                f.write(os.urandom(256))
+        (index, stats), seconds = timed(update)
+        rows.append(('index update, 10 new files', seconds, stats))
+        for i in range(10, 20):
+            with open(os.path.join(root, changed, 'new%02d.png' % i), 'wb') as f:
+                f.write(os.urandom(256))
+        (index, stats), seconds = timed(lambda: update(verify=True))
+        rows.append(('  the same, verify=True', seconds, stats))
+        listing, listing_time = timed(index.listing)
+        rows.append(('listing from the index', listing_time, None))
+
+        print('%d files' % len(listing[0]))
+        print('%-28s %10s   %s' % ('step', 'seconds', 'directories listed / reused, files hashed'))
+        for name, seconds, stats in rows:
+            detail = '' if stats is None else '%(listed)d / %(reused)d, %(hashed)d' % stats
+            print('%-28s %10.3f   %s' % (name, seconds, detail))
+        same = same_listing(index, root)
+        print('same order and labels as flow_from_directory: %s' % same)
+        tree = symlink_tree(os.path.dirname(index_path))
+        symlinks = DirectoryIndex(tree, os.path.join(os.path.dirname(index_path), 'tree.json'))
+        symlinks.update()
+        same_symlinks = same_listing(symlinks, tree)
+        print('the same on a tree with symlinks: %s' % same_symlinks)
+    finally:
+        if scratch:
+            shutil.rmtree(scratch)
+        shutil.rmtree(os.path.dirname(index_path))
+    if not (same and same_symlinks):
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,68 @@
+# -*- coding: utf-8 -*-
+"""Loader throughput in images/sec: `flow_from_directory` (decode and resize
+every epoch) vs. `capsnet.store.StoreIterator` on stores written by
+`tools/build_image_store.py` (missing ones are built first), for float32
+batches with the backbone preprocessing and for raw uint8 slices.
+
+    python3 benchmark/benchmark_image_store.py --dataset 200x200 --store store --sizes 32 64 128 200
+"""
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from capsnet.data import flow_from_directory  # noqa: E402
+from capsnet.models import preprocess_function  # noqa: E402
+from capsnet.store import StoreIterator, build_store, store_path  # noqa: E402
+
+
+def images_per_second(iterator, epochs):
+    start = time.perf_counter()
+    for _ in range(epochs):
+        for i in range(len(iterator)):
+            iterator[i]
+        iterator.on_epoch_end()
+    return epochs * iterator.samples / (time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--dataset', default='./')
+    parser.add_argument('--split', default='train')
+    parser.add_argument('--store', default='store')
+    parser.add_argument('--sizes', type=int, nargs='+', default=[32, 64, 128, 200])
+    parser.add_argument('--backbone', default='densenet121')
+    parser.add_argument('--batch-size', type=int, default=40)
+    parser.add_argument('--epochs', type=int, default=2)
+    args = parser.parse_args()
+
+    directory = os.path.join(args.dataset, args.split)
+    preprocessing_function = preprocess_function(args.backbone)
+    print('%-6s %14s %14s %14s %14s %10s' % ('size', 'generator', 'store', 'store shuffle',
+                                             'store uint8', 'max diff'))
+    for size in args.sizes:
+        image_size = (size, size)
+        filepath = store_path(args.store, args.split, image_size)
+        if not os.path.exists(filepath + '.json'):
+            build_store(directory, image_size, filepath)
+
+        generator = flow_from_directory(directory, image_size, args.batch_size,
+                                        preprocessing_function=preprocessing_function)
+        store = StoreIterator(filepath, args.batch_size, preprocessing_function=preprocessing_function)
+        difference = max(np.abs(generator[i][0] - store[i][0]).max() for i in range(len(store)))
+        throughput = [
+            images_per_second(generator, args.epochs),
+            images_per_second(store, args.epochs),
+            images_per_second(StoreIterator(filepath, args.batch_size, shuffle=True,
+                                            preprocessing_function=preprocessing_function),
+                              args.epochs),
+            images_per_second(StoreIterator(filepath, args.batch_size, dtype='uint8'), args.epochs),
+        ]
+        print('%-6d %14.1f %14.1f %14.1f %14.1f %10.2e' % ((size,) + tuple(throughput) + (difference,)))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,135 @@
+# -*- coding: utf-8 -*-
+"""Training step time split into waiting for the batch and computing it,
+for the `ImageDataGenerator` iterator (`capsnet.data.flow_from_directory`)
+and the `tf.data` pipeline (`capsnet.data.dataset_from_directory`), both
+with the `*-da*` augmentation, and the `tf.data` pipeline shipping raw
+uint8 images to a model that preprocesses in the graph
+(`build_capsnet(preprocessing=True)`). The first epoch is reported separately,
+since it decodes the images that later epochs read from the cache.
+
+First, `dataset_from_directory` reads one image of every lossless format of
+`capsnet.index.IMAGE_FORMATS` (png, bmp, ppm, tif, tiff) at the target size
+and must give the pixels of `flow_from_directory`; exits with 1 otherwise.
+
+    python3 benchmark/benchmark_input_pipeline.py --dataset 200x200 --backbone densenet121 --epochs 3
+"""
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+import numpy as np
+import tensorflow as tf
+from PIL import Image
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from capsnet import margin_loss  # noqa: E402
+from capsnet.data import dataset_from_directory, flow_from_directory  # noqa: E402
+from capsnet.models import build_capsnet, preprocess_function  # noqa: E402
+
+
+def check_formats(image_size):
+    """Largest pixel difference of `dataset_from_directory` to
+    `flow_from_directory` over one image per lossless format, or the error
+    `dataset_from_directory` raised."""
+    root = tempfile.mkdtemp()
+    try:
+        rng = np.random.RandomState(0)
+        for label in ('defect', 'ok'):
+            os.makedirs(os.path.join(root, label))
+            for extension in ('png', 'bmp', 'ppm', 'tif', 'tiff'):
+                pixels = rng.randint(0, 256, image_size + (3,), dtype=np.uint8)
+                Image.fromarray(pixels).save(os.path.join(root, label, 'image.' + extension))
+        expected = flow_from_directory(root, image_size, 32)[0][0] * 255
+        try:
+            images = next(iter(dataset_from_directory(root, image_size, 32, dtype='uint8',
+                                                      index=False)))[0]
+        except tf.errors.InvalidArgumentError as e:
+            return e.message
+        return float(np.abs(np.asarray(images, np.float32) - expected).max())
+    finally:
+        shutil.rmtree(root)
+
+
+def step_times(batches, train_step):
+    """(data wait, compute) seconds of every step of one epoch."""
+    times = []
+    iterator = iter(batches)
+    while True:
+        start = time.perf_counter()
+        try:
+            x_batch, y_batch = next(iterator)
+        except StopIteration:
+            return times
+        loaded = time.perf_counter()
+        float(train_step(x_batch, y_batch))
+        times.append((loaded - start, time.perf_counter() - loaded))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--dataset', default='./')
+    parser.add_argument('--backbone', default='densenet121')
+    parser.add_argument('--image-size', type=int, default=200)
+    parser.add_argument('--batch-size', type=int, default=40)
+    parser.add_argument('--epochs', type=int, default=3)
+    args = parser.parse_args()
+
+    image_size = (args.image_size, args.image_size)
+    difference = check_formats(image_size)
+    print('png, bmp, ppm, tif and tiff images, largest pixel difference to '
+          'flow_from_directory: %s' % difference)
+    if isinstance(difference, str) or difference > 1:
+        sys.exit(1)
+    directory = os.path.join(args.dataset, 'train')
+    preprocessing_function = preprocess_function(args.backbone)
+    model = build_capsnet(args.backbone, image_size)
+    # the same network fed raw uint8 images, preprocessing in the graph
+    uint8_model = build_capsnet(args.backbone, image_size, preprocessing=True, rescale=1./255)
+    uint8_model.set_weights(model.get_weights())
+
+    def make_train_step(model):
+        optimizer = tf.keras.optimizers.Adam(1e-4)
+
+        @tf.function
+        def train_step(x_batch, y_batch):
+            with tf.GradientTape() as tape:
+                loss = tf.reduce_mean(margin_loss(y_batch, model(x_batch, training=True)))
+            optimizer.apply_gradients(zip(tape.gradient(loss, model.trainable_variables),
+                                          model.trainable_variables))
+            return loss
+        return train_step
+
+    generator = flow_from_directory(directory, image_size, args.batch_size, shuffle=True,
+                                    preprocessing_function=preprocessing_function, augment=True)
+    dataset = dataset_from_directory(directory, image_size, args.batch_size, shuffle=True,
+                                     preprocessing_function=preprocessing_function, augment=True)
+    uint8_dataset = dataset_from_directory(directory, image_size, args.batch_size, shuffle=True,
+                                           augment=True, dtype='uint8')
+
+    def generator_epoch():
+        for i in range(len(generator)):
+            yield generator[i]
+        generator.on_epoch_end()
+
+    pipelines = (('ImageDataGenerator', generator_epoch, make_train_step(model)),
+                 ('tf.data', lambda: dataset, make_train_step(model)),
+                 ('tf.data uint8', lambda: uint8_dataset, make_train_step(uint8_model)))
+    print('%-34s %12s %12s %12s %10s %10s' % ('pipeline', 'data ms', 'compute ms', 'step ms',
+                                             'img/s', 'MB/batch'))
+    for name, epoch, train_step in pipelines:
+        x_batch, y_batch = next(iter(epoch()))
+        train_step(x_batch, y_batch)  # trace
+        for epochs, label in ((1, 'first epoch'), (args.epochs - 1, 'later epochs')):
+            if epochs < 1:
+                continue
+            times = np.array([t for _ in range(epochs) for t in step_times(epoch(), train_step)])
+            data, compute = times.mean(0) * 1000
+            print('%-34s %12.1f %12.1f %12.1f %10.1f %10.2f' % (
+                '%s, %s' % (name, label), data, compute, data + compute,
+                epochs * generator.samples / times.sum(), np.asarray(x_batch).nbytes / 2**20))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,72 @@
+# -*- coding: utf-8 -*-
+"""Throughput of the non-shared (share_weights=False) capsule transform:
+`K.local_conv1d` (as in the original scripts) vs. the batched matmul of
+`capsnet.ops.grouped_capsule_transform`, with one kernel per input capsule
+and with grouped kernels.
+
+    python3 benchmark/benchmark_local_capsule.py --input-capsules 64 256 1024
+"""
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+import tensorflow as tf
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from capsnet.ops import grouped_capsule_transform  # noqa: E402
+
+
+def local_conv1d_transform(inputs, kernel):
+    return tf.keras.backend.local_conv1d(inputs, kernel, [1], [1])
+
+
+def images_per_sec(transform, inputs, kernel, repeats):
+    @tf.function
+    def step(inputs):
+        with tf.GradientTape() as tape:
+            loss = tf.reduce_sum(tf.square(transform(inputs, kernel)))
+        return tape.gradient(loss, kernel)
+
+    start = time.perf_counter()
+    step(inputs).numpy()  # trace
+    trace_sec = time.perf_counter() - start
+    start = time.perf_counter()
+    for _ in range(repeats):
+        grad = step(inputs)
+    grad.numpy()
+    return repeats * inputs.shape[0] / (time.perf_counter() - start), trace_sec
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--batch-size', type=int, default=40)
+    parser.add_argument('--input-capsules', type=int, nargs='+', default=[64, 256, 1024])
+    parser.add_argument('--input-dim', type=int, default=128)
+    parser.add_argument('--num-capsule', type=int, default=32)
+    parser.add_argument('--dim-capsule', type=int, default=8)
+    parser.add_argument('--groups', type=int, default=16)
+    parser.add_argument('--repeats', type=int, default=20)
+    args = parser.parse_args()
+
+    output_dim = args.num_capsule * args.dim_capsule
+    print('forward + backward of the capsule transform, batch_size=%d' % args.batch_size)
+    print('%8s %-24s %12s %10s %12s' % ('inputs', 'transform', 'params', 'trace s', 'images/sec'))
+    for input_num_capsule in args.input_capsules:
+        inputs = tf.constant(np.random.rand(args.batch_size, input_num_capsule,
+                                            args.input_dim).astype(np.float32))
+        candidates = [
+            ('local_conv1d', local_conv1d_transform, input_num_capsule),
+            ('batched matmul', grouped_capsule_transform, input_num_capsule),
+            ('batched matmul, %d groups' % args.groups, grouped_capsule_transform, args.groups),
+        ]
+        for name, transform, groups in candidates:
+            kernel = tf.Variable(np.random.rand(groups, args.input_dim, output_dim).astype(np.float32))
+            throughput, trace_sec = images_per_sec(transform, inputs, kernel, args.repeats)
+            print('%8d %-24s %12d %10.2f %12.1f' % (input_num_capsule, name,
+                                                   np.prod(kernel.shape), trace_sec, throughput))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,93 @@
+# -*- coding: utf-8 -*-
+"""Peak CPU memory of one training step: the routing loop on the
+transposed `hat_inputs` (loop) vs. `Capsule(..., fused=True)` (fused),
+which permutes inside the XLA cluster and accumulates a single gradient
+for `hat_inputs`.
+
+Every (mode, batch size) runs in its own process and reports its peak RSS,
+so the numbers do not leak into each other.
+
+    python3 benchmark/benchmark_memory.py --batch-sizes 40 80 160 --budget-mb 8000
+    python3 benchmark/benchmark_memory.py --head-only --input-capsules 288
+"""
+import argparse
+import os
+import resource
+import subprocess
+import sys
+
+CODE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+
+
+def worker(args):
+    import numpy as np
+    import tensorflow as tf
+    from tensorflow.keras import layers, models
+    sys.path.insert(0, CODE_DIR)
+    from capsnet import Capsule, Length, margin_loss
+    from capsnet.models import build_capsnet
+
+    fused = args.mode == 'fused'
+    if args.head_only:
+        input_caps = layers.Input(shape=(args.input_capsules, 512))
+        x = Capsule(32, 16, 3, True, fused=fused)(input_caps)
+        x = Capsule(32, 16, 3, True, fused=fused)(x)
+        capsule = Capsule(2, 32, 7, True, fused=fused)(x)
+        output = Length(epsilon=0.)(capsule)
+        model = models.Model(input_caps, output)
+        x_batch = np.random.rand(args.batch_size, args.input_capsules, 512).astype(np.float32)
+    else:
+        model = build_capsnet(args.backbone, (args.image_size, args.image_size), fused=fused)
+        x_batch = np.random.rand(args.batch_size, args.image_size, args.image_size, 3).astype(np.float32)
+    y_batch = tf.keras.utils.to_categorical(np.arange(args.batch_size) % 2, 2)
+    model.compile(loss=margin_loss, optimizer='adam')
+    for _ in range(2):
+        model.train_on_batch(x_batch, y_batch)
+    # ru_maxrss is in KiB on Linux
+    print(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--backbone', default='densenet121')
+    parser.add_argument('--image-size', type=int, default=200)
+    parser.add_argument('--head-only', action='store_true',
+                        help='capsule layers only, on random (batch, input_capsules, 512) features')
+    parser.add_argument('--input-capsules', type=int, default=72)
+    parser.add_argument('--batch-sizes', type=int, nargs='+', default=[20, 40, 80, 120, 160])
+    parser.add_argument('--budget-mb', type=float, default=None,
+                        help='report the largest batch size under this peak RSS')
+    parser.add_argument('--mode', choices=['loop', 'fused'], help=argparse.SUPPRESS)
+    parser.add_argument('--batch-size', type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.mode is not None:
+        worker(args)
+        return
+
+    forwarded = ['--backbone', args.backbone, '--image-size', str(args.image_size),
+                 '--input-capsules', str(args.input_capsules)]
+    if args.head_only:
+        forwarded.append('--head-only')
+
+    print('%10s %14s %14s %8s' % ('batch', 'loop peak MB', 'fused peak MB', 'saved'))
+    largest = {'loop': None, 'fused': None}
+    for batch_size in args.batch_sizes:
+        peak = {}
+        for mode in ('loop', 'fused'):
+            out = subprocess.run([sys.executable, os.path.abspath(__file__), '--mode', mode,
+                                  '--batch-size', str(batch_size)] + forwarded,
+                                 stdout=subprocess.PIPE, stderr=subprocess.DEVNULL,
+                                 universal_newlines=True)
+            peak[mode] = float(out.stdout.split()[-1]) if out.returncode == 0 else float('inf')
+            if args.budget_mb is not None and peak[mode] <= args.budget_mb:
+                largest[mode] = batch_size
+        print('%10d %14.1f %14.1f %7.1f%%' % (batch_size, peak['loop'], peak['fused'],
+                                             (1 - peak['fused'] / peak['loop']) * 100))
+    if args.budget_mb is not None:
+        print('largest batch size under %.0f MB: loop=%s fused=%s' % (
+            args.budget_mb, largest['loop'], largest['fused']))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,80 @@
+# -*- coding: utf-8 -*-
+"""Check the capsule model under a reduced precision policy against float32
+on the `valid` directory, and compare CPU throughput.
+
+Exits with status 1 if the largest score difference exceeds --atol, so it
+can be used as a regression check.
+
+    python3 benchmark/benchmark_mixed_precision.py --weights 200x200/weights-capsnet-XXX.h5 --dataset 200x200
+"""
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+import tensorflow as tf
+from sklearn.metrics import accuracy_score
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from capsnet.data import flow_from_directory  # noqa: E402
+from capsnet.metrics import specificity_score  # noqa: E402
+from capsnet.models import build_capsnet, preprocess_function  # noqa: E402
+
+
+def predict(model, valid_set):
+    model.predict_on_batch(valid_set[0][0])  # trace
+    start = time.perf_counter()
+    scores = model.predict(valid_set, steps=len(valid_set), verbose=0)
+    return scores, valid_set.samples / (time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--weights', help='checkpoint, random initialization if omitted')
+    parser.add_argument('--dataset', default='./')
+    parser.add_argument('--backbone', default='densenet121')
+    parser.add_argument('--routings', type=int, default=7)
+    parser.add_argument('--image-size', type=int, default=200)
+    parser.add_argument('--batch-size', type=int, default=40)
+    parser.add_argument('--policy', default='mixed_bfloat16',
+                        choices=['mixed_bfloat16', 'mixed_float16'])
+    parser.add_argument('--atol', type=float, default=2e-2,
+                        help='largest allowed absolute difference of the scores')
+    args = parser.parse_args()
+
+    image_size = (args.image_size, args.image_size)
+    valid_set = flow_from_directory(os.path.join(args.dataset, 'valid'), image_size,
+                                    args.batch_size,
+                                    preprocessing_function=preprocess_function(args.backbone))
+    y_true = valid_set.classes
+
+    model = build_capsnet(args.backbone, image_size, valid_set.num_classes, args.routings)
+    if args.weights is not None:
+        model.load_weights(args.weights)
+    scores_fp32, ips_fp32 = predict(model, valid_set)
+
+    tf.keras.mixed_precision.set_global_policy(args.policy)
+    reduced = build_capsnet(args.backbone, image_size, valid_set.num_classes, args.routings)
+    tf.keras.mixed_precision.set_global_policy('float32')
+    # variables stay float32 under a mixed policy, so the weights copy as is
+    reduced.set_weights(model.get_weights())
+    scores_reduced, ips_reduced = predict(reduced, valid_set)
+
+    difference = np.abs(scores_reduced.astype(np.float64) - scores_fp32)
+    y_fp32 = np.argmax(scores_fp32, axis=1)
+    y_reduced = np.argmax(scores_reduced, axis=1)
+    print('%-16s %10s %12s %12s' % ('policy', 'accuracy', 'specificity', 'images/sec'))
+    for policy, y_pred, ips in (('float32', y_fp32, ips_fp32),
+                                (args.policy, y_reduced, ips_reduced)):
+        print('%-16s %9.2f%% %11.2f%% %12.1f' % (policy, accuracy_score(y_true, y_pred) * 100,
+                                                 specificity_score(y_true, y_pred) * 100, ips))
+    print('score difference: max %.2e, mean %.2e' % (difference.max(), difference.mean()))
+    print('same prediction: %.2f%%' % (np.mean(y_fp32 == y_reduced) * 100))
+    if difference.max() > args.atol:
+        print('FAILED: max score difference above %g' % args.atol)
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,100 @@
+# -*- coding: utf-8 -*-
+"""One store per resolution (`build_store`, every source image decoded once
+per size) vs. one pyramid store (`build_pyramid`, decoded once for all
+sizes): build time, decoded images, bytes written and equality of every
+split and size, then the time of a rebuild with no new files. A copy of
+the first split with one image overwritten in place is rebuilt as well:
+exits with 1 if that image is not decoded again.
+
+    python3 benchmark/benchmark_pyramid.py --dataset 200x200 --sizes 32 64 128 200
+"""
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+import numpy as np
+from PIL import Image
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from capsnet.store import StoreIterator, build_pyramid, build_store, store_path  # noqa: E402
+
+
+def directory_size(path):
+    return sum(os.path.getsize(os.path.join(root, name))
+               for root, _, names in os.walk(path) for name in names)
+
+
+def check_overwrite(workdir, directory, size, resize):
+    """Build a pyramid of a copy of `directory`, overwrite its first image
+    with a black one and rebuild; True if that row is black."""
+    copy, pyramid = os.path.join(workdir, 'copy'), os.path.join(workdir, 'overwrite')
+    shutil.copytree(directory, copy)
+    build_pyramid(pyramid, {'copy': copy}, [size], resize)
+    filepath = store_path(pyramid, 'copy', (size, size))
+    filename = StoreIterator(filepath, 1).filenames[0]
+    path = os.path.join(copy, filename)
+    # same name and format, a new mtime and (usually) the same directory mtime
+    with Image.open(path) as image:
+        black = Image.new('RGB', image.size)
+        image_format = image.format
+    black.save(path, image_format)
+    os.utime(path, ns=(time.time_ns(), time.time_ns() + 10**9))
+    stats = build_pyramid(pyramid, {'copy': copy}, [size], resize)
+    row = StoreIterator(filepath, 1, dtype='uint8').images[0]
+    print('overwritten image: decoded %d, row mean %.2f' % (stats['decoded'], row.mean()))
+    return stats['decoded'] == 1 and not row.any()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--dataset', default='./')
+    parser.add_argument('--splits', nargs='+', default=['train', 'valid'])
+    parser.add_argument('--sizes', type=int, nargs='+', default=[32, 64, 128, 200])
+    parser.add_argument('--resize', default='pil-bicubic')
+    args = parser.parse_args()
+
+    directories = {split: os.path.join(args.dataset, split) for split in args.splits}
+    workdir = tempfile.mkdtemp()
+    try:
+        stores, pyramid = os.path.join(workdir, 'stores'), os.path.join(workdir, 'pyramid')
+        start = time.perf_counter()
+        for split, directory in directories.items():
+            for size in args.sizes:
+                build_store(directory, (size, size), store_path(stores, split, (size, size)),
+                            resize=args.resize)
+        separate = time.perf_counter() - start
+        decoded = sum(len(StoreIterator(store_path(stores, split, (args.sizes[0],) * 2), 1))
+                      for split in args.splits) * len(args.sizes)
+
+        start = time.perf_counter()
+        stats = build_pyramid(pyramid, directories, args.sizes, args.resize)
+        shared = time.perf_counter() - start
+        start = time.perf_counter()
+        rebuild = build_pyramid(pyramid, directories, args.sizes, args.resize)
+        rebuilt = time.perf_counter() - start
+
+        equal = all(np.array_equal(StoreIterator(store_path(stores, split, (size, size)), 1,
+                                                 dtype='uint8').images,
+                                   StoreIterator(store_path(pyramid, split, (size, size)), 1,
+                                                 dtype='uint8').images)
+                    for split in args.splits for size in args.sizes)
+        print('%-22s %10s %10s %10s' % ('', 'seconds', 'decoded', 'MB'))
+        print('%-22s %10.1f %10d %10.1f' % ('store per size', separate, decoded,
+                                            directory_size(stores) / 2**20))
+        print('%-22s %10.1f %10d %10.1f' % ('pyramid', shared, stats['decoded'],
+                                            directory_size(pyramid) / 2**20))
+        print('%-22s %10.1f %10d' % ('pyramid, no changes', rebuilt, rebuild['decoded']))
+        print('same images: %s' % equal)
+        fresh = check_overwrite(workdir, directories[args.splits[0]], args.sizes[0], args.resize)
+    finally:
+        shutil.rmtree(workdir)
+    if not fresh:
+        print('FAILED: the overwritten image was not decoded again')
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
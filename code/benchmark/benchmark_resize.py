@@ -0,0 +1,111 @@
+# -*- coding: utf-8 -*-
+"""Resize backends of `capsnet.resize`: throughput in images/sec per mode and
+resolution, decoding included (what `build_store` and `export_shards` pay)
+and for the resize alone, then per mode the pixel difference to PIL bicubic
+and, given a trained checkpoint, its accuracy, F-score and specificity on
+`valid` and their change against PIL bicubic.
+
+    python3 benchmark/benchmark_resize.py --dataset 200x200 --sizes 32 64 128 200 \\
+        --weights capsnet-full-size-da.h5 --backbone densenet121 --image-size 200
+"""
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+from PIL import Image
+from sklearn.metrics import accuracy_score, f1_score
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from capsnet import load_capsnet  # noqa: E402
+from capsnet.index import list_directory  # noqa: E402
+from capsnet.metrics import specificity_score  # noqa: E402
+from capsnet.models import build_capsnet, preprocess_function  # noqa: E402
+from capsnet.resize import RESIZE_METHODS, load_images, resize_images  # noqa: E402
+
+
+def load_all(filepaths, image_size, method):
+    return np.concatenate(list(load_images(filepaths, image_size, method)))
+
+
+def resize_only(images, image_size, method, batch_size):
+    """Seconds to resize decoded (n, height, width, 3) source images."""
+    start = time.perf_counter()
+    if method == 'pil-bicubic':
+        for image in images:
+            Image.fromarray(image).resize(image_size[::-1], Image.BICUBIC)
+    else:
+        for i in range(0, len(images), batch_size):
+            resize_images(images[i:i + batch_size], image_size, method).numpy()
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--dataset', default='./')
+    parser.add_argument('--sizes', type=int, nargs='+', default=[32, 64, 128, 200])
+    parser.add_argument('--limit', type=int, default=512, help='train images timed')
+    parser.add_argument('--batch-size', type=int, default=64)
+    parser.add_argument('--weights', help='checkpoint for the accuracy check')
+    parser.add_argument('--backbone', default='densenet121')
+    parser.add_argument('--routings', type=int, default=7)
+    parser.add_argument('--image-size', type=int, default=200)
+    args = parser.parse_args()
+
+    filepaths = list_directory(os.path.join(args.dataset, 'train'))[0][:args.limit]
+    # the resize-only timing needs one source size; take the most common one
+    sources = [np.asarray(Image.open(path).convert('RGB')) for path in filepaths]
+    shapes = [image.shape for image in sources]
+    shape = max(set(shapes), key=shapes.count)
+    sources = np.stack([image for image in sources if image.shape == shape])
+
+    for method in RESIZE_METHODS[1:]:
+        # trace the TensorFlow kernels before timing
+        resize_images(sources[:1], (args.sizes[0], args.sizes[0]), method)
+    print('images/sec, decode + resize (resize only), %d images' % len(filepaths))
+    print('%-6s' % 'size' + ''.join('%24s' % method for method in RESIZE_METHODS))
+    for size in args.sizes:
+        image_size = (size, size)
+        row = []
+        for method in RESIZE_METHODS:
+            start = time.perf_counter()
+            for _ in load_images(filepaths, image_size, method, args.batch_size):
+                pass
+            decode_resize = len(filepaths) / (time.perf_counter() - start)
+            alone = len(sources) / resize_only(sources, image_size, method, args.batch_size)
+            row.append('%12.1f (%9.1f)' % (decode_resize, alone))
+        print('%-6d' % size + ''.join('%24s' % cell for cell in row))
+
+    image_size = (args.image_size, args.image_size)
+    filepaths, _, y_true, class_indices = list_directory(os.path.join(args.dataset, 'valid'))
+    reference = load_all(filepaths, image_size, 'pil-bicubic').astype(np.float32)
+    model = None
+    if args.weights:
+        model = load_capsnet(args.weights, build_fn=lambda: build_capsnet(
+            args.backbone, image_size, len(class_indices), args.routings))
+        preprocessing_function = preprocess_function(args.backbone)
+
+    print('\nvalid at %dx%d' % image_size)
+    print('%-12s %14s %14s %10s %10s %12s' % ('resize', 'mean |diff|', 'max |diff|',
+                                             'accuracy', 'F-score', 'specificity'))
+    baseline = None
+    for method in RESIZE_METHODS:
+        images = load_all(filepaths, image_size, method).astype(np.float32)
+        difference = np.abs(images - reference)
+        line = '%-12s %14.3f %14.1f' % (method, difference.mean(), difference.max())
+        if model is not None:
+            y_pred = np.argmax(model.predict(preprocessing_function(images) * (1. / 255),
+                                             batch_size=args.batch_size, verbose=0), 1)
+            scores = np.array([accuracy_score(y_true, y_pred),
+                               f1_score(y_true, y_pred, average='weighted'),
+                               specificity_score(y_true, y_pred)]) * 100
+            baseline = scores if baseline is None else baseline
+            line += ' %9.2f%% %9.2f%% %11.2f%%' % tuple(scores)
+            if method != 'pil-bicubic':
+                line += '  (%+.2f / %+.2f / %+.2f)' % tuple(scores - baseline)
+        print(line)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,93 @@
+# -*- coding: utf-8 -*-
+"""Check that a `capsnet.store.StoreIterator` resumed from a saved state
+serves the batches of an uninterrupted run: a reference run goes through
+all epochs, a second run stops at --crash-epoch/--crash-step and saves its
+state to JSON, and a new iterator, created without the seed, restores it
+and finishes. Every batch is compared by hash; exits with 1 on a mismatch.
+
+    python3 benchmark/benchmark_resumable_loader.py --dataset 200x200 --store store --augment \\
+        --class-ratio balanced --epochs 3 --crash-epoch 1 --crash-step 5
+"""
+import argparse
+import hashlib
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from capsnet.models import preprocess_function  # noqa: E402
+from capsnet.store import StoreIterator, build_store, store_path  # noqa: E402
+
+
+def batch_hash(batch):
+    digest = hashlib.sha1()
+    for array in batch:
+        digest.update(array.tobytes())
+    return digest.hexdigest()
+
+
+def run(iterator, epochs, stop=None):
+    """Hashes of the batches of the remaining epochs, up to `stop`
+    (epoch, step); returns them and the state there."""
+    hashes = []
+    while iterator.epoch < epochs:
+        for step in range(len(iterator)):
+            if (iterator.epoch, iterator.position + step) == stop:
+                return hashes, iterator.get_state(step)
+            hashes.append(batch_hash(iterator[step]))
+        iterator.on_epoch_end()
+    return hashes, None
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--dataset', default='./')
+    parser.add_argument('--split', default='train')
+    parser.add_argument('--store', default='store')
+    parser.add_argument('--image-size', type=int, default=200)
+    parser.add_argument('--backbone', default='densenet121')
+    parser.add_argument('--batch-size', type=int, default=40)
+    parser.add_argument('--epochs', type=int, default=3)
+    parser.add_argument('--crash-epoch', type=int, default=1)
+    parser.add_argument('--crash-step', type=int, default=5)
+    parser.add_argument('--class-ratio', help="'balanced' for stratified batches")
+    parser.add_argument('--augment', action='store_true')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    image_size = (args.image_size, args.image_size)
+    filepath = store_path(args.store, args.split, image_size)
+    if not os.path.exists(filepath + '.json'):
+        build_store(os.path.join(args.dataset, args.split), image_size, filepath)
+
+    def make_iterator(seed):
+        return StoreIterator(filepath, args.batch_size, shuffle=True, seed=seed,
+                             preprocessing_function=preprocess_function(args.backbone),
+                             class_ratio=args.class_ratio, augment=args.augment)
+
+    start = time.perf_counter()
+    reference, _ = run(make_iterator(args.seed), args.epochs)
+    elapsed = time.perf_counter() - start
+    before, state = run(make_iterator(args.seed), args.epochs, (args.crash_epoch, args.crash_step))
+    if state is None:
+        sys.exit('--crash-epoch/--crash-step is past the end of the run')
+    state = json.loads(json.dumps(state))
+    resumed = make_iterator(None)
+    resumed.set_state(state)
+    start = time.perf_counter()
+    after, _ = run(resumed, args.epochs)
+    resumed_elapsed = time.perf_counter() - start
+
+    matches = before + after == reference
+    print('%d batches in %d epochs, %.1f s; resumed at epoch %d step %d: %d batches, %.1f s, '
+          'state %.1f kB' % (len(reference), args.epochs, elapsed, args.crash_epoch,
+                             args.crash_step, len(after), resumed_elapsed,
+                             len(json.dumps(state)) / 1024.))
+    print('same batches as the uninterrupted run: %s' % matches)
+    if not matches:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
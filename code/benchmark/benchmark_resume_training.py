@@ -0,0 +1,137 @@
+# -*- coding: utf-8 -*-
+"""Check that `capsnet.checkpoint.fit_resumable` continues a run bit for bit:
+the same model, `Lion` optimizer, `ReduceLROnPlateau` / learning-rate /
+weight-decay callbacks and `StoreIterator` (augmented, shuffled) train
+for --epochs without interruption, then again with a crash at
+--crash-epoch/--crash-step and a resume into freshly built objects. The
+weights, optimizer slots, learning rate, weight decay and callback
+counters of both runs are compared; exits with 1 on a difference.
+
+    python3 benchmark/benchmark_resume_training.py --dataset 200x200 --store store --image-size 64 \\
+        --epochs 4 --crash-epoch 2 --crash-step 3
+"""
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+import numpy as np
+import tensorflow as tf
+from tensorflow.keras.callbacks import Callback, LearningRateScheduler, ReduceLROnPlateau
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from capsnet.checkpoint import TrainingCheckpoint, fit_resumable  # noqa: E402
+from capsnet.models import build_capsnet, preprocess_function  # noqa: E402
+from capsnet.optimizers import Lion, WeightDecayScheduler  # noqa: E402
+from capsnet.store import StoreIterator, build_store, store_path  # noqa: E402
+
+
+class Crash(Exception):
+    pass
+
+
+class CrashAt(Callback):
+    """Raise `Crash` before batch `step` of `epoch`, after the checkpoint
+    of the batch before was written."""
+    def __init__(self, epoch, step):
+        super(CrashAt, self).__init__()
+        self.at = (epoch, step)
+        self.epoch = 0
+
+    def on_epoch_begin(self, epoch, logs=None):
+        self.epoch = epoch
+
+    def on_train_batch_begin(self, batch, logs=None):
+        if (self.epoch, batch) == self.at:
+            raise Crash()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--dataset', default='./')
+    parser.add_argument('--store', default='store')
+    parser.add_argument('--backbone', default='densenet121')
+    parser.add_argument('--routings', type=int, default=3)
+    parser.add_argument('--image-size', type=int, default=64)
+    parser.add_argument('--batch-size', type=int, default=8)
+    parser.add_argument('--epochs', type=int, default=4)
+    parser.add_argument('--crash-epoch', type=int, default=2)
+    parser.add_argument('--crash-step', type=int, default=3)
+    parser.add_argument('--decay-epoch', type=int, default=2,
+                        help='epoch of the learning rate / weight decay step')
+    args = parser.parse_args()
+    if hasattr(tf.config.experimental, 'enable_op_determinism'):
+        tf.config.experimental.enable_op_determinism()
+
+    image_size = (args.image_size, args.image_size)
+    stores = {}
+    for split in ('train', 'valid'):
+        stores[split] = store_path(args.store, split, image_size)
+        if not os.path.exists(stores[split] + '.json'):
+            build_store(os.path.join(args.dataset, split), image_size, stores[split])
+    preprocessing_function = preprocess_function(args.backbone)
+    initial_weights = build_capsnet(args.backbone, image_size, 2, args.routings,
+                                    weights=None).get_weights()
+
+    def lr_schedule(epoch):
+        return 1e-4 if epoch < args.decay_epoch else 1e-5
+
+    def wd_schedule(epoch):
+        return 1e-5 if epoch < args.decay_epoch else 1e-6
+
+    def run(directory, resume=False, crash=None, seed=0):
+        model = build_capsnet(args.backbone, image_size, 2, args.routings, weights=None)
+        if not resume:
+            model.set_weights(initial_weights)
+        model.compile(loss='categorical_crossentropy', metrics=['accuracy'],
+                      optimizer=Lion(learning_rate=lr_schedule(0), wd=wd_schedule(0)))
+        train_set = StoreIterator(stores['train'], args.batch_size, shuffle=True, augment=True,
+                                  seed=None if resume else seed,
+                                  preprocessing_function=preprocessing_function)
+        valid_set = StoreIterator(stores['valid'], args.batch_size,
+                                  preprocessing_function=preprocessing_function)
+        reduce_lr = ReduceLROnPlateau(monitor='val_loss', factor=0.5, patience=1, min_lr=1e-7)
+        callbacks = [reduce_lr, LearningRateScheduler(lr_schedule), WeightDecayScheduler(wd_schedule)]
+        checkpoint = TrainingCheckpoint(directory, [reduce_lr], train_set, save_freq=1)
+        try:
+            fit_resumable(model, train_set, args.epochs, checkpoint, resume=resume,
+                          callbacks=callbacks + ([CrashAt(*crash)] if crash else []),
+                          validation_data=valid_set, verbose=0)
+        except Crash:
+            return None
+        optimizer = model.optimizer
+        slots = [optimizer.get_slot(var, 'm').numpy() for var in model.trainable_variables]
+        return (model.get_weights(), slots + [optimizer.iterations.numpy()],
+                [float(tf.keras.backend.get_value(optimizer.lr)),
+                 float(tf.keras.backend.get_value(optimizer.wd)),
+                 reduce_lr.wait, reduce_lr.cooldown_counter, float(reduce_lr.best)])
+
+    workdir = tempfile.mkdtemp()
+    try:
+        start = time.perf_counter()
+        reference = run(os.path.join(workdir, 'reference'))
+        elapsed = time.perf_counter() - start
+        run(os.path.join(workdir, 'crashed'), crash=(args.crash_epoch, args.crash_step))
+        start = time.perf_counter()
+        resumed = run(os.path.join(workdir, 'crashed'), resume=True)
+        resumed_elapsed = time.perf_counter() - start
+    finally:
+        shutil.rmtree(workdir)
+
+    checks = [('weights', all(np.array_equal(a, b) for a, b in zip(reference[0], resumed[0]))),
+              ('Lion slots and iterations',
+               all(np.array_equal(a, b) for a, b in zip(reference[1], resumed[1]))),
+              ('learning rate, weight decay, ReduceLROnPlateau', reference[2] == resumed[2])]
+    print('uninterrupted: %.1f s; resumed from epoch %d step %d: %.1f s' % (
+        elapsed, args.crash_epoch, args.crash_step, resumed_elapsed))
+    for name, same in checks:
+        print('same %s: %s' % (name, same))
+    print('lr, wd, wait, cooldown, best: %s vs %s' % (reference[2], resumed[2]))
+    if not all(same for _, same in checks):
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,77 @@
+# -*- coding: utf-8 -*-
+"""Train the same backbone + capsule model with every routing engine on the
+PCB `train` / `valid` split and report throughput next to accuracy, to pick
+the cheapest engine that keeps the F-score.
+
+    python3 benchmark/benchmark_routing_engines.py --dataset 200x200 --epochs 30
+"""
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+from sklearn.metrics import accuracy_score, f1_score
+from tensorflow.keras.optimizers import Adam
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from capsnet import ROUTING_ENGINES, margin_loss  # noqa: E402
+from capsnet.data import flow_from_directory  # noqa: E402
+from capsnet.metrics import specificity_score  # noqa: E402
+from capsnet.models import build_capsnet, preprocess_function  # noqa: E402
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--dataset', default='./')
+    parser.add_argument('--backbone', default='densenet121')
+    parser.add_argument('--engines', nargs='+', default=sorted(ROUTING_ENGINES),
+                        choices=sorted(ROUTING_ENGINES))
+    parser.add_argument('--routings', type=int, default=7)
+    parser.add_argument('--image-size', type=int, default=200)
+    parser.add_argument('--batch-size', type=int, default=40)
+    parser.add_argument('--epochs', type=int, default=30)
+    parser.add_argument('--fused', action='store_true')
+    parser.add_argument('--weights', default='imagenet',
+                        help="backbone weights, 'imagenet' or 'none'")
+    args = parser.parse_args()
+
+    image_size = (args.image_size, args.image_size)
+    preprocessing_function = preprocess_function(args.backbone)
+    train_set = flow_from_directory(os.path.join(args.dataset, 'train'), image_size,
+                                    args.batch_size, shuffle=True,
+                                    preprocessing_function=preprocessing_function, augment=True)
+    valid_set = flow_from_directory(os.path.join(args.dataset, 'valid'), image_size,
+                                    args.batch_size, preprocessing_function=preprocessing_function)
+    y_true = valid_set.classes
+    weights = None if args.weights == 'none' else args.weights
+
+    results = []
+    for engine in args.engines:
+        print('Routing engine: %s' % engine)
+        model = build_capsnet(args.backbone, image_size, train_set.num_classes, args.routings,
+                              weights=weights, routing=engine, fused=args.fused)
+        model.compile(loss=margin_loss, optimizer=Adam(learning_rate=1e-4), metrics=['accuracy'])
+
+        start = time.perf_counter()
+        model.fit(train_set, epochs=args.epochs, verbose=2)
+        train_ips = args.epochs * train_set.samples / (time.perf_counter() - start)
+
+        model.predict(valid_set, steps=1, verbose=0)  # trace
+        start = time.perf_counter()
+        y_pred = np.argmax(model.predict(valid_set, steps=len(valid_set), verbose=0), axis=1)
+        predict_ips = valid_set.samples / (time.perf_counter() - start)
+
+        results.append((engine, train_ips, predict_ips, accuracy_score(y_true, y_pred),
+                        f1_score(y_true, y_pred, average='weighted'),
+                        specificity_score(y_true, y_pred)))
+
+    print('%-10s %12s %14s %10s %10s %12s' % ('engine', 'train img/s', 'predict img/s',
+                                            'accuracy', 'F-score', 'specificity'))
+    for engine, train_ips, predict_ips, accuracy, fscore, specificity in results:
+        print('%-10s %12.1f %14.1f %9.2f%% %9.2f%% %11.2f%%' % (
+            engine, train_ips, predict_ips, accuracy * 100, fscore * 100, specificity * 100))
+
+
+if __name__ == '__main__':
+    main()
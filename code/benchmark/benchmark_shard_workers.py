@@ -0,0 +1,99 @@
+# -*- coding: utf-8 -*-
+"""Run N local worker processes against sharded TFRecords
+(`tools/export_shards.py`) and check the per-worker split: the workers read
+disjoint sets of images that together cover the dataset, the same ones in
+the same order when run again with the same seed, every shard passes
+its checksum, and every worker gets every class within --tolerance of the
+class proportions of the dataset. Reports images/sec per worker and in
+total.
+
+    python3 benchmark/benchmark_shard_workers.py --shards shards/train-200x200 --workers 4 --epochs 2
+"""
+import argparse
+import multiprocessing
+import os
+import sys
+import time
+
+
+def read_worker(arguments):
+    prefix, worker_index, num_workers, batch_size, epochs, seed = arguments
+    sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+    from capsnet.shards import shard_dataset
+
+    dataset = shard_dataset(prefix, batch_size, worker_index, num_workers, shuffle=True,
+                            seed=seed, dtype='uint8', verify=True, return_filenames=True)
+    start = time.perf_counter()
+    order = []
+    for _ in range(epochs):
+        epoch = []
+        for _, _, filenames in dataset:
+            epoch.extend(name.decode('utf-8') for name in filenames.numpy())
+        order.append(epoch)
+    return order, epochs * dataset.samples / (time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--shards', required=True, help='prefix of the exported shards')
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--batch-size', type=int, default=40)
+    parser.add_argument('--epochs', type=int, default=2)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--tolerance', type=float, default=0.05,
+                        help='largest allowed difference of a class fraction of a worker')
+    args = parser.parse_args()
+
+    sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+    from capsnet.shards import load_manifest
+    manifest = load_manifest(args.shards)
+    every_file = [name for shard in manifest['shards'] for name in shard['filenames']]
+    labels = {name: label for shard in manifest['shards']
+              for name, label in zip(shard['filenames'], shard['classes'])}
+    num_classes = len(manifest['class_indices'])
+
+    def fractions(names):
+        counts = [0] * num_classes
+        for name in names:
+            counts[labels[name]] += 1
+        return [count / max(1, len(names)) for count in counts]
+
+    tasks = [(args.shards, i, args.workers, args.batch_size, args.epochs, args.seed)
+             for i in range(args.workers)]
+    context = multiprocessing.get_context('spawn')
+    runs = []
+    for _ in range(2):
+        with context.Pool(args.workers) as pool:
+            start = time.perf_counter()
+            runs.append(pool.map(read_worker, tasks))
+            elapsed = time.perf_counter() - start
+
+    first, second = runs
+    seen = [set(order[0]) for order, _ in first]
+    disjoint = sum(len(names) for names in seen) == len(set().union(*seen))
+    complete = set().union(*seen) == set(every_file) and all(
+        len(order[0]) == len(set(order[0])) for order, _ in first)
+    repeatable = all(a[0] == b[0] for a, b in zip(first, second))
+    reshuffled = all(order[0] != order[-1] for order, _ in first) if args.epochs > 1 else True
+    expected = fractions(every_file)
+    worker_fractions = [fractions(order[0]) for order, _ in first]
+    balanced = all(min(worker) > 0 and
+                   max(abs(a - b) for a, b in zip(worker, expected)) <= args.tolerance
+                   for worker in worker_fractions)
+
+    print('%-8s %10s %12s  %s' % ('worker', 'images', 'img/s', 'class fractions'))
+    for i, ((order, ips), worker) in enumerate(zip(second, worker_fractions)):
+        print('%-8d %10d %12.1f  %s' % (i, len(order[0]), ips,
+                                        ' '.join('%.3f' % f for f in worker)))
+    print('%-8s %10d %12s  %s' % ('dataset', len(every_file), '',
+                                  ' '.join('%.3f' % f for f in expected)))
+    print('all workers: %.1f img/s reading, %.1f s wall for %d epochs with process startup' % (
+        sum(ips for _, ips in second), elapsed, args.epochs))
+    print('disjoint: %s, complete: %s, repeatable with the seed: %s, reshuffled each epoch: %s, '
+          'balanced: %s' % (disjoint, complete, repeatable, reshuffled, balanced))
+    if not (disjoint and complete and repeatable and balanced):
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
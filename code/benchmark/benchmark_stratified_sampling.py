@@ -0,0 +1,128 @@
+# -*- coding: utf-8 -*-
+"""Epochs until the `valid` specificity reaches a target: uniform shuffling
+vs. class-stratified batches (`StoreIterator(class_ratio=...)`), the same
+model from the same initial weights, on image stores of the dataset. With
+--minority-fraction the training split keeps only that fraction of its
+rarest class, to mimic imbalanced production data.
+
+    python3 benchmark/benchmark_stratified_sampling.py --dataset 200x200 --minority-fraction 0.1 \\
+        --class-ratio balanced --target 0.95 --epochs 50
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+import numpy as np
+from sklearn.metrics import accuracy_score, f1_score
+from tensorflow.keras.callbacks import Callback
+from tensorflow.keras.optimizers import Adam
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from capsnet import margin_loss  # noqa: E402
+from capsnet.metrics import specificity_score  # noqa: E402
+from capsnet.models import build_capsnet, preprocess_function  # noqa: E402
+from capsnet.store import StoreIterator, build_store, open_store, store_path  # noqa: E402
+
+
+def subset_store(store, filepath, fraction, seed):
+    """Copy of `store` keeping `fraction` of the samples of its rarest class."""
+    images, index = open_store(store)
+    classes = np.array(index['classes'])
+    rarest = np.argmin(np.bincount(classes))
+    members = np.flatnonzero(classes == rarest)
+    dropped = np.random.RandomState(seed).permutation(members)[max(1, int(len(members) * fraction)):]
+    keep = np.setdiff1d(np.arange(len(classes)), dropped)
+    np.save(filepath + '.npy', images[keep])
+    index.pop('images', None)
+    index.pop('rows', None)
+    index.update(filenames=[index['filenames'][i] for i in keep], classes=classes[keep].tolist())
+    with open(filepath + '.json', 'w') as f:
+        json.dump(index, f)
+    return np.bincount(classes[keep])
+
+
+def parse_ratio(text):
+    # 'balanced' or 'defect=1,ok=1'
+    if text == 'balanced':
+        return text
+    return {name: float(weight) for name, weight in (item.split('=') for item in text.split(','))}
+
+
+class ValidationHistory(Callback):
+    def __init__(self, valid_set):
+        super(ValidationHistory, self).__init__()
+        self.valid_set = valid_set
+        self.history = []
+
+    def on_epoch_end(self, epoch, logs=None):
+        y_pred = np.argmax(self.model.predict(self.valid_set, steps=len(self.valid_set), verbose=0), 1)
+        y_true = self.valid_set.classes
+        self.history.append((specificity_score(y_true, y_pred), accuracy_score(y_true, y_pred),
+                             f1_score(y_true, y_pred, average='weighted')))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--dataset', default='./')
+    parser.add_argument('--store', default='store')
+    parser.add_argument('--minority-fraction', type=float, default=1.)
+    parser.add_argument('--class-ratio', default='balanced', help="'balanced' or 'defect=1,ok=1'")
+    parser.add_argument('--target', type=float, default=0.95, help='valid specificity to reach')
+    parser.add_argument('--backbone', default='densenet121')
+    parser.add_argument('--routings', type=int, default=7)
+    parser.add_argument('--image-size', type=int, default=200)
+    parser.add_argument('--batch-size', type=int, default=40)
+    parser.add_argument('--epochs', type=int, default=50)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--weights', default='imagenet',
+                        help="backbone weights, 'imagenet' or 'none'")
+    args = parser.parse_args()
+
+    image_size = (args.image_size, args.image_size)
+    preprocessing_function = preprocess_function(args.backbone)
+    stores = {}
+    for split in ('train', 'valid'):
+        stores[split] = store_path(args.store, split, image_size)
+        if not os.path.exists(stores[split] + '.json'):
+            build_store(os.path.join(args.dataset, split), image_size, stores[split])
+    train = stores['train']
+    if args.minority_fraction < 1:
+        train = '%s-minority%g' % (stores['train'], args.minority_fraction)
+        counts = subset_store(stores['train'], train, args.minority_fraction, args.seed)
+        print('training samples per class: %s' % counts.tolist())
+
+    valid_set = StoreIterator(stores['valid'], args.batch_size,
+                              preprocessing_function=preprocessing_function)
+    weights = None if args.weights == 'none' else args.weights
+    initial_weights = build_capsnet(args.backbone, image_size, valid_set.num_classes, args.routings,
+                                    weights=weights).get_weights()
+    samplings = (('uniform', None), ('stratified', parse_ratio(args.class_ratio)))
+    results = []
+    for name, class_ratio in samplings:
+        print('Sampling: %s' % name)
+        train_set = StoreIterator(train, args.batch_size, shuffle=True, seed=args.seed,
+                                  preprocessing_function=preprocessing_function,
+                                  class_ratio=class_ratio)
+        model = build_capsnet(args.backbone, image_size, valid_set.num_classes, args.routings)
+        model.set_weights(initial_weights)
+        model.compile(loss=margin_loss, optimizer=Adam(learning_rate=1e-4), metrics=['accuracy'])
+        history = ValidationHistory(valid_set)
+        start = time.perf_counter()
+        model.fit(train_set, epochs=args.epochs, callbacks=[history], verbose=2)
+        reached = [epoch + 1 for epoch, (specificity, _, _) in enumerate(history.history)
+                   if specificity >= args.target]
+        results.append((name, reached[0] if reached else None, history.history[-1],
+                        time.perf_counter() - start))
+
+    print('%-12s %16s %12s %10s %10s %10s' % ('sampling', 'epochs to %.2f' % args.target,
+                                             'specificity', 'accuracy', 'F-score', 'train s'))
+    for name, epochs, (specificity, accuracy, fscore), seconds in results:
+        print('%-12s %16s %11.2f%% %9.2f%% %9.2f%% %10.1f' % (
+            name, epochs if epochs else '> %d' % args.epochs, specificity * 100, accuracy * 100,
+            fscore * 100, seconds))
+
+
+if __name__ == '__main__':
+    main()
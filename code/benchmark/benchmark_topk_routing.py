@@ -0,0 +1,100 @@
+# -*- coding: utf-8 -*-
+"""Routing cost of top-k coupling (`Capsule(..., top_k=k)`) for
+k in {1, 2, 4, all}: multiply-adds, CPU latency and, given a checkpoint,
+accuracy on the `valid` directory.
+
+    python3 benchmark/benchmark_topk_routing.py
+    python3 benchmark/benchmark_topk_routing.py --weights 200x200/weights-capsnet-XXX.h5 --dataset 200x200
+"""
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+import tensorflow as tf
+from sklearn.metrics import accuracy_score
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from capsnet.data import flow_from_directory  # noqa: E402
+from capsnet.metrics import specificity_score  # noqa: E402
+from capsnet.models import build_capsnet, preprocess_function  # noqa: E402
+from capsnet.routing import (dynamic_routing, fused_dynamic_routing, topk_dynamic_routing,  # noqa: E402
+                             fused_topk_dynamic_routing)
+
+
+def routing_macs(num_capsule, input_num_capsule, dim_capsule, routings, top_k=None):
+    """Multiply-adds of the routing contractions for one sample."""
+    dense = num_capsule * input_num_capsule * dim_capsule
+    if top_k is None or routings == 1:
+        return dense * (2 * routings - 1)
+    sparse = min(top_k, num_capsule) * input_num_capsule * dim_capsule
+    # first weighted sum and the agreement picking the parents stay dense
+    return 2 * dense + sparse * (2 * routings - 3)
+
+
+def latency_ms(fn, repeats):
+    fn()
+    start = time.perf_counter()
+    for _ in range(repeats):
+        o = fn()
+    o.numpy()
+    return (time.perf_counter() - start) * 1000 / repeats
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--batch-size', type=int, default=40)
+    parser.add_argument('--input-capsules', type=int, default=72)
+    parser.add_argument('--repeats', type=int, default=50)
+    parser.add_argument('--top-k', type=int, nargs='+', default=[1, 2, 4])
+    parser.add_argument('--weights', help='checkpoint to evaluate on the valid set')
+    parser.add_argument('--dataset', default='./')
+    parser.add_argument('--backbone', default='densenet121')
+    parser.add_argument('--routings', type=int, default=7)
+    parser.add_argument('--image-size', type=int, default=200)
+    args = parser.parse_args()
+
+    # Capsule(32, 16, 3) on Reshape((-1, 512)) features, the layer with the most parents
+    num_capsule, dim_capsule, routings = 32, 16, 3
+    hat_inputs = tf.constant(np.random.rand(args.batch_size, args.input_capsules,
+                                            num_capsule, dim_capsule).astype(np.float32))
+    candidates = [(str(k), k) for k in args.top_k] + [('all', None)]
+
+    print('Capsule(%d, %d, %d), %d input capsules, batch_size=%d' % (
+        num_capsule, dim_capsule, routings, args.input_capsules, args.batch_size))
+    print('%6s %16s %12s %12s' % ('k', 'routing MACs', 'ms/batch', 'fused ms'))
+    for name, top_k in candidates:
+        if top_k is None:
+            fn = tf.function(lambda: dynamic_routing(hat_inputs, routings, input_major=True))
+            fused = lambda: fused_dynamic_routing(hat_inputs, routings, input_major=True)
+        else:
+            fn = tf.function(lambda: topk_dynamic_routing(hat_inputs, routings, top_k,
+                                                          input_major=True))
+            fused = lambda: fused_topk_dynamic_routing(hat_inputs, routings, top_k,
+                                                       input_major=True)
+        print('%6s %16d %12.3f %12.3f' % (name, routing_macs(num_capsule, args.input_capsules,
+                                                             dim_capsule, routings, top_k),
+                                          latency_ms(fn, args.repeats),
+                                          latency_ms(fused, args.repeats)))
+
+    if args.weights is None:
+        return
+
+    image_size = (args.image_size, args.image_size)
+    valid_set = flow_from_directory(os.path.join(args.dataset, 'valid'), image_size,
+                                    args.batch_size,
+                                    preprocessing_function=preprocess_function(args.backbone))
+    y_true = valid_set.classes
+    print('%6s %10s %12s' % ('k', 'accuracy', 'specificity'))
+    for name, top_k in candidates:
+        model = build_capsnet(args.backbone, image_size, valid_set.num_classes, args.routings,
+                              top_k=top_k)
+        model.load_weights(args.weights)
+        y_pred = np.argmax(model.predict(valid_set, steps=len(valid_set), verbose=0), axis=1)
+        print('%6s %9.2f%% %11.2f%%' % (name, accuracy_score(y_true, y_pred) * 100,
+                                        specificity_score(y_true, y_pred) * 100))
+
+
+if __name__ == '__main__':
+    main()
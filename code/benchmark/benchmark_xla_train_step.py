@@ -0,0 +1,110 @@
+# -*- coding: utf-8 -*-
+"""Compare training and evaluation steps per second of the capsule models
+compiled with and without XLA (`capsnet.models.compile_capsnet`), on
+random images so no dataset is needed.
+
+Both models start from the same weights and train on the same batches;
+the losses of the first --check-steps steps must agree within --rtol, and
+a batch smaller than --batch-size is evaluated to check that the dynamic
+batch dimension compiles. Exits with 1 on a difference.
+
+    python3 benchmark/benchmark_xla_train_step.py --backbones densenet121 resnet50 vgg19 \\
+        --image-size 64 --batch-size 16 --steps 20
+"""
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+from tensorflow.keras.optimizers import Adam
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from capsnet import margin_loss  # noqa: E402
+from capsnet.models import build_capsnet, compile_capsnet  # noqa: E402
+
+
+def run(model, batches, partial, steps, check_steps):
+    """Time the first step (trace and compilation), then `steps` training
+    and evaluation steps; returns the timings and the first losses."""
+    losses = []
+    start = time.perf_counter()
+    losses.append(model.train_on_batch(*batches[0]))
+    first = time.perf_counter() - start
+    for x, y in batches[1:check_steps]:
+        losses.append(model.train_on_batch(x, y))
+    start = time.perf_counter()
+    for step in range(steps):
+        model.train_on_batch(*batches[step % len(batches)])
+    train = steps / (time.perf_counter() - start)
+    model.test_on_batch(*batches[0])  # trace
+    start = time.perf_counter()
+    for step in range(steps):
+        model.test_on_batch(*batches[step % len(batches)])
+    test = steps / (time.perf_counter() - start)
+    partial_loss = model.test_on_batch(*partial)
+    return first, train, test, np.array(losses), partial_loss
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--backbones', nargs='+', default=['densenet121', 'resnet50', 'vgg19'])
+    parser.add_argument('--routings', type=int, default=3)
+    parser.add_argument('--image-size', type=int, default=64)
+    parser.add_argument('--batch-size', type=int, default=16)
+    parser.add_argument('--num-classes', type=int, default=2)
+    parser.add_argument('--steps', type=int, default=20, help='timed steps')
+    parser.add_argument('--check-steps', type=int, default=3,
+                        help='first training steps whose losses are compared')
+    parser.add_argument('--rtol', type=float, default=1e-3,
+                        help='largest allowed relative difference of the losses')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    rng = np.random.RandomState(args.seed)
+    image_size = (args.image_size, args.image_size)
+
+    def batch(batch_size):
+        x = rng.uniform(-1, 1, (batch_size,) + image_size + (3,)).astype(np.float32)
+        y = np.eye(args.num_classes, dtype=np.float32)[
+            rng.randint(args.num_classes, size=batch_size)]
+        return x, y
+
+    batches = [batch(args.batch_size) for _ in range(max(4, args.check_steps))]
+    partial = batch(max(1, args.batch_size // 2 - 1))
+
+    print('%-12s %-4s %10s %12s %12s %10s' % ('backbone', 'xla', 'first (s)', 'train/sec',
+                                               'eval/sec', 'speedup'))
+    failed = False
+    for backbone in args.backbones:
+        reference = build_capsnet(backbone, image_size, args.num_classes, args.routings,
+                                  weights=None)
+        weights = reference.get_weights()
+        results = {}
+        for jit_compile in (False, True):
+            model = build_capsnet(backbone, image_size, args.num_classes, args.routings,
+                                  weights=None)
+            model.set_weights(weights)
+            compile_capsnet(model, jit_compile=jit_compile, loss=margin_loss,
+                            optimizer=Adam(learning_rate=1e-4))
+            results[jit_compile] = run(model, batches, partial, args.steps, args.check_steps)
+            first, train, test = results[jit_compile][:3]
+            speedup = train / results[False][1]
+            print('%-12s %-4s %10.1f %12.2f %12.2f %9.2fx' % (backbone, 'on' if jit_compile
+                                                              else 'off', first, train, test,
+                                                              speedup))
+        losses, xla_losses = results[False][3], results[True][3]
+        difference = np.max(np.abs(xla_losses - losses) / np.maximum(np.abs(losses), 1e-12))
+        partial_difference = (abs(results[True][4] - results[False][4]) /
+                              max(abs(results[False][4]), 1e-12))
+        print('%-12s loss difference: first %d steps %.2e, batch of %d %.2e'
+              % (backbone, args.check_steps, difference, len(partial[0]), partial_difference))
+        if max(difference, partial_difference) > args.rtol:
+            print('FAILED: %s loss difference above %g' % (backbone, args.rtol))
+            failed = True
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,86 @@
+# -*- coding: utf-8 -*-
+"""Accuracy / specificity / latency of early-exit routing vs. full routing
+on the `valid` directory.
+
+    python3 benchmark/evaluate_early_exit.py \\
+        --weights 200x200/weights-capsnet-latest-15-200-full-size-da-densenet121-r8-r6-r5-XX.h5 \\
+        --dataset 200x200 --backbone densenet121 --routings 7 --tol 1e-2 1e-3 1e-4
+"""
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+from sklearn.metrics import accuracy_score
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from capsnet import Capsule  # noqa: E402
+from capsnet.data import flow_from_directory  # noqa: E402
+from capsnet.metrics import specificity_score  # noqa: E402
+from capsnet.models import build_capsnet, preprocess_function  # noqa: E402
+
+
+def run(model, valid_set):
+    """Predict batch by batch, returning scores, ms/batch and the mean
+    routing iterations used by every `Capsule` layer."""
+    capsules = [layer for layer in model.layers if isinstance(layer, Capsule)]
+    scores, elapsed = [], 0.
+    iterations = np.zeros(len(capsules))
+    model.predict_on_batch(valid_set[0][0])  # trace
+    for i in range(len(valid_set)):
+        x_batch, _ = valid_set[i]
+        start = time.perf_counter()
+        scores.append(np.asarray(model.predict_on_batch(x_batch)))
+        elapsed += time.perf_counter() - start
+        iterations += [layer.routing_iterations for layer in capsules]
+    return (np.concatenate(scores), elapsed * 1000 / len(valid_set),
+            iterations / len(valid_set))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--weights', required=True)
+    parser.add_argument('--dataset', default='./')
+    parser.add_argument('--backbone', default='densenet121')
+    parser.add_argument('--routings', type=int, default=7)
+    parser.add_argument('--image-size', type=int, default=200)
+    parser.add_argument('--batch-size', type=int, default=40)
+    parser.add_argument('--tol', type=float, nargs='+', default=[1e-2, 1e-3, 1e-4])
+    parser.add_argument('--no-da', action='store_true',
+                        help='checkpoint was trained with rescale=1./255 only')
+    args = parser.parse_args()
+
+    image_size = (args.image_size, args.image_size)
+    preprocessing_function = None if args.no_da else preprocess_function(args.backbone)
+    valid_set = flow_from_directory(os.path.join(args.dataset, 'valid'), image_size,
+                                    args.batch_size, preprocessing_function=preprocessing_function)
+    y_true = valid_set.classes
+
+    model = build_capsnet(args.backbone, image_size, valid_set.num_classes, args.routings)
+    model.load_weights(args.weights)
+    scores, full_ms, _ = run(model, valid_set)
+    y_pred = np.argmax(scores, axis=1)
+    full_accuracy = accuracy_score(y_true, y_pred)
+    full_specificity = specificity_score(y_true, y_pred)
+
+    print('%-8s %10s %10s %12s %12s %10s  %s' % ('tol', 'accuracy', 'delta', 'specificity',
+                                                'delta', 'ms/batch', 'mean iterations'))
+    print('%-8s %9.2f%% %10s %11.2f%% %12s %10.2f  full' % (
+        'full', full_accuracy * 100, '', full_specificity * 100, '', full_ms))
+    for tol in args.tol:
+        early = build_capsnet(args.backbone, image_size, valid_set.num_classes, args.routings,
+                              early_exit_tol=tol)
+        early.set_weights(model.get_weights())
+        scores, early_ms, iterations = run(early, valid_set)
+        y_pred = np.argmax(scores, axis=1)
+        accuracy = accuracy_score(y_true, y_pred)
+        specificity = specificity_score(y_true, y_pred)
+        print('%-8g %9.2f%% %+9.2f%% %11.2f%% %+11.2f%% %10.2f  %s' % (
+            tol, accuracy * 100, (accuracy - full_accuracy) * 100,
+            specificity * 100, (specificity - full_specificity) * 100, early_ms,
+            ' / '.join('%.2f' % n for n in iterations)))
+
+
+if __name__ == '__main__':
+    main()
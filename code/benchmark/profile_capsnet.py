@@ -0,0 +1,68 @@
+# -*- coding: utf-8 -*-
+"""Where the inference time of a backbone + capsule model goes: backbone,
+capsule transforms and every routing iteration (wall time, FLOPs, tensor
+sizes), compared with the plain CNN of
+`train_capsnet_latest15-200-no-capsule-full-size.py`.
+
+Writes a Chrome trace (open it in chrome://tracing or ui.perfetto.dev) and
+prints a summary table.
+
+    python3 benchmark/profile_capsnet.py --backbone densenet121 --batch-size 40
+"""
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+import tensorflow as tf
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from capsnet.models import BACKBONES, build_capsnet, build_no_capsule  # noqa: E402
+from capsnet.profiling import graph_flops, profile_model  # noqa: E402
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--backbone', default='densenet121', choices=sorted(BACKBONES))
+    parser.add_argument('--weights', help='checkpoint, random initialization if omitted')
+    parser.add_argument('--routings', type=int, default=7)
+    parser.add_argument('--image-size', type=int, default=200)
+    parser.add_argument('--batch-size', type=int, default=40)
+    parser.add_argument('--repeats', type=int, default=5)
+    parser.add_argument('--trace', default='capsnet_profile.json')
+    args = parser.parse_args()
+
+    image_size = (args.image_size, args.image_size)
+    x_batch = np.random.rand(args.batch_size, args.image_size, args.image_size, 3).astype(np.float32)
+
+    model = build_capsnet(args.backbone, image_size, 2, args.routings)
+    if args.weights is not None:
+        model.load_weights(args.weights)
+    profiler, graph = profile_model(model, x_batch, args.repeats)
+    profiler.chrome_trace(args.trace)
+    print('eager, batch_size=%d (trace: %s)' % (args.batch_size, args.trace))
+    print(profiler.summary())
+
+    baseline = build_no_capsule(image_size, 2)
+    run = tf.function(lambda x: baseline(x, training=False))
+    run(x_batch)
+    start = time.perf_counter()
+    for _ in range(args.repeats):
+        scores = run(x_batch)
+    scores.numpy()
+    baseline_ms = (time.perf_counter() - start) * 1000 / args.repeats
+    graph['no-capsule baseline'] = (baseline_ms, graph_flops(lambda x: baseline(x, training=False),
+                                                             tf.TensorSpec(x_batch.shape, tf.float32)))
+
+    model_ms, model_flops = graph['model']
+    print('\ngraph (tf.function), batch_size=%d' % args.batch_size)
+    # shares are relative to the whole capsule model
+    print('%-28s %10s %8s %10s %8s' % ('part', 'ms/batch', 'time', 'GFLOPs', 'FLOPs'))
+    for name, (ms, flops) in graph.items():
+        print('%-28s %10.2f %7.1f%% %10.2f %7.1f%%' % (name, ms, ms / model_ms * 100, flops / 1e9,
+                                                      flops / max(model_flops, 1) * 100))
+
+
+if __name__ == '__main__':
+    main()
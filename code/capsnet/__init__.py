@@ -0,0 +1,10 @@
+# -*- coding: utf-8 -*-
+"""Capsule layers and helpers shared by the training and predict scripts."""
+from .ops import squash, standard_squash, softmax, margin_loss, caps_batch_dot
+from .layers import Capsule, Length, Preprocessing
+from .routing import (ROUTING_ENGINES, dynamic_routing, additive_routing, attention_routing,
+                      static_routing, fused_dynamic_routing, adaptive_dynamic_routing,
+                      dynamic_routing_numpy)
+from .metrics import specificity_score
+from .optimizers import Lion, WeightDecayScheduler
+from .saving import LEGACY_CUSTOM_OBJECTS, load_capsnet, replace_lambda_head, with_preprocessing
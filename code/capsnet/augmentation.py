@@ -0,0 +1,113 @@
+# -*- coding: utf-8 -*-
+"""Batched version of the `ImageDataGenerator` augmentation.
+
+`ImageDataGenerator.random_transform` warps one image at a time, one
+`scipy.ndimage.affine_transform` per channel. `BatchAugmentation` draws the
+same parameters for a whole batch, composes rotation, shift, shear, zoom
+and horizontal flip into one projective transform per image and warps the
+batch with a single `ImageProjectiveTransformV2` op (bilinear, nearest
+fill, like `interpolation_order=1` and `fill_mode='nearest'`); the channel
+shift follows, vectorized. For the same parameters the result equals
+`ImageDataGenerator.apply_transform` up to float rounding.
+"""
+import numpy as np
+import tensorflow as tf
+
+# the real-time data augmentation used by every `*-da*` training script
+AUGMENTATION = dict(rotation_range=20,
+                    width_shift_range=0.1,
+                    height_shift_range=0.1,
+                    shear_range=0.1,
+                    zoom_range=0.1,
+                    channel_shift_range=5,
+                    horizontal_flip=True,
+                    fill_mode='nearest')
+
+
+def transform_matrices(theta, tx, ty, shear, zx, zy, flip, height, width):
+    """(n, 3, 3) matrices mapping output to input (x, y) pixel coordinates,
+    from `get_random_transform` parameters (degrees for `theta` and
+    `shear`, pixels for the shifts), composed like `apply_affine_transform`
+    followed by the horizontal flip."""
+    theta, shear = np.deg2rad(theta), np.deg2rad(shear)
+    n = len(theta)
+    ones, zeros = np.ones(n), np.zeros(n)
+
+    def stack(rows):
+        return np.stack([np.stack(row, -1) for row in rows], 1)
+
+    rotation = stack([[np.cos(theta), -np.sin(theta), zeros],
+                      [np.sin(theta), np.cos(theta), zeros],
+                      [zeros, zeros, ones]])
+    shift = stack([[ones, zeros, tx], [zeros, ones, ty], [zeros, zeros, ones]])
+    shear = stack([[ones, -np.sin(shear), zeros], [zeros, np.cos(shear), zeros],
+                   [zeros, zeros, ones]])
+    zoom = stack([[zx, zeros, zeros], [zeros, zy, zeros], [zeros, zeros, ones]])
+    matrices = rotation @ shift @ shear @ zoom
+
+    # transform_matrix_offset_center, then the flip of the output columns
+    o_x, o_y = height / 2. - 0.5, width / 2. - 0.5
+    offset = np.array([[1, 0, o_x], [0, 1, o_y], [0, 0, 1]])
+    reset = np.array([[1, 0, -o_x], [0, 1, -o_y], [0, 0, 1]])
+    flip = stack([[np.where(flip, -1., 1.), zeros, np.where(flip, width - 1., 0.)],
+                  [zeros, ones, zeros], [zeros, zeros, ones]])
+    return offset @ matrices @ reset @ flip
+
+
+class BatchAugmentation(object):
+    """Random `AUGMENTATION` of (n, height, width, channels) batches.
+
+    # Arguments
+        seed: seeds the NumPy generator of the parameters, so a seeded
+            augmentation repeats the same sequence of batches.
+        kwargs: `ImageDataGenerator` settings replacing `AUGMENTATION`;
+            only the ones listed there are supported.
+    """
+    def __init__(self, seed=None, **kwargs):
+        settings = dict(AUGMENTATION, **kwargs)
+        unsupported = set(settings) - set(AUGMENTATION)
+        if unsupported or settings['fill_mode'] != 'nearest':
+            raise ValueError('Unsupported augmentation settings: %s'
+                             % sorted(unsupported or ['fill_mode']))
+        self.settings = settings
+        self._rng = np.random.RandomState(seed)
+
+    def random_parameters(self, n, height, width):
+        """`get_random_transform` parameters of n images, as arrays."""
+        s, rng = self.settings, self._rng
+        zoom = s['zoom_range']
+        return dict(theta=rng.uniform(-s['rotation_range'], s['rotation_range'], n),
+                    tx=rng.uniform(-s['height_shift_range'], s['height_shift_range'], n) * height,
+                    ty=rng.uniform(-s['width_shift_range'], s['width_shift_range'], n) * width,
+                    shear=rng.uniform(-s['shear_range'], s['shear_range'], n),
+                    zx=rng.uniform(1 - zoom, 1 + zoom, n),
+                    zy=rng.uniform(1 - zoom, 1 + zoom, n),
+                    flip=(rng.random_sample(n) < 0.5) & s['horizontal_flip'],
+                    channel_shift=rng.uniform(-s['channel_shift_range'],
+                                              s['channel_shift_range'], n))
+
+    def random_transforms(self, n, height, width):
+        """(n, 8) float32 projective transforms and (n,) float32 channel
+        shifts, the inputs of `apply`."""
+        parameters = self.random_parameters(n, height, width)
+        channel_shift = parameters.pop('channel_shift')
+        matrices = transform_matrices(height=height, width=width, **parameters)
+        transforms = matrices.reshape(n, 9)[:, :8] / matrices[:, 2:, 2]
+        return transforms.astype(np.float32), channel_shift.astype(np.float32)
+
+    @staticmethod
+    def apply(images, transforms, channel_shift):
+        """Warp a float batch and shift its channels."""
+        images = tf.convert_to_tensor(images, tf.float32)
+        images = tf.raw_ops.ImageProjectiveTransformV2(
+            images=images, transforms=transforms, output_shape=tf.shape(images)[1:3],
+            interpolation='BILINEAR', fill_mode='NEAREST')
+        # apply_channel_shift: clipped to the range of the whole image
+        low = tf.reduce_min(images, axis=[1, 2, 3], keepdims=True)
+        high = tf.reduce_max(images, axis=[1, 2, 3], keepdims=True)
+        shift = tf.reshape(channel_shift, [-1, 1, 1, 1])
+        return tf.clip_by_value(images + shift, low, high)
+
+    def __call__(self, images):
+        n, height, width = images.shape[:3]
+        return self.apply(images, *self.random_transforms(n, height, width))
@@ -0,0 +1,96 @@
+# -*- coding: utf-8 -*-
+"""Bucketed execution of models on `Input(shape=(None, None, 3))`.
+
+Every new image size changes the number of input capsules after
+`Reshape((-1, 128))` and costs a retrace (and an XLA compile with
+`fused=True`); images of different sizes cannot share a batch either.
+`BucketedPredictor` pads every image at the bottom and right to the
+smallest square bucket that holds it, so a batch of mixed sizes runs through
+one graph per bucket. The capsules computed from padding are masked out of
+routing through the model's `capsule_mask` input
+(`build_conv_capsnet(capsule_mask=True)`).
+
+With 'valid' convolutions and pooling, the feature map positions inside
+the extent of the unpadded image only see the image, so for shared
+weights the scores equal those of the unpadded image.
+"""
+import numpy as np
+import tensorflow as tf
+from tensorflow.keras import layers, models
+
+from .layers import Capsule
+
+DEFAULT_BUCKETS = (32, 64, 128, 200)
+
+
+class BucketedPredictor(object):
+    """Predict images of mixed sizes with one traced graph per bucket.
+
+    # Arguments
+        model: model with the inputs (image, capsule_mask).
+        buckets: square bucket sizes; larger images raise a ValueError.
+        batch_size: batches are padded to it, so the batch size does not
+            cause retraces either.
+    """
+    def __init__(self, model, buckets=DEFAULT_BUCKETS, batch_size=32):
+        if len(model.inputs) != 2:
+            raise ValueError('The model needs the inputs (image, capsule_mask).')
+        self.model = model
+        self.buckets = sorted(buckets)
+        self.batch_size = batch_size
+        self.traces = 0
+        capsule = [layer for layer in model.layers if isinstance(layer, Capsule)][0]
+        # the 4D feature map before Reshape((-1, channels))
+        reshape = [layer for layer in model.layers
+                   if isinstance(layer, layers.Reshape) and layer.output is capsule.input][0]
+        self._features = models.Model(model.inputs[0], reshape.input)
+        self._feature_sizes = {}
+        self._predict = tf.function(self._predict_batch)
+
+    def _predict_batch(self, images, mask):
+        self.traces += 1  # runs only while tracing
+        return self.model([images, mask], training=False)
+
+    def feature_size(self, height, width):
+        """(height, width) of the feature map of an image."""
+        if (height, width) not in self._feature_sizes:
+            shape = self._features.compute_output_shape((1, height, width, 3))
+            self._feature_sizes[height, width] = tuple(shape[1:3])
+        return self._feature_sizes[height, width]
+
+    def bucket(self, height, width):
+        for size in self.buckets:
+            if height <= size and width <= size:
+                return size
+        raise ValueError('Image of %dx%d is larger than the largest bucket %d.'
+                         % (height, width, self.buckets[-1]))
+
+    def capsule_mask(self, bucket, height, width):
+        """Flattened (bucket feature height * width,) mask of the capsules
+        that belong to an image of height x width padded to `bucket`."""
+        mask = np.zeros(self.feature_size(bucket, bucket), np.float32)
+        feature_height, feature_width = self.feature_size(height, width)
+        mask[:feature_height, :feature_width] = 1.
+        return mask.reshape(-1)
+
+    def predict(self, images):
+        """Scores of a list of (height, width, 3) images, in their order."""
+        groups = {}
+        for i, image in enumerate(images):
+            groups.setdefault(self.bucket(*image.shape[:2]), []).append(i)
+
+        scores = [None] * len(images)
+        for size, indices in sorted(groups.items()):
+            for start in range(0, len(indices), self.batch_size):
+                batch = indices[start:start + self.batch_size]
+                x_batch = np.zeros((self.batch_size, size, size, 3), np.float32)
+                mask = np.zeros((self.batch_size, int(np.prod(self.feature_size(size, size)))),
+                                np.float32)
+                for row, i in enumerate(batch):
+                    height, width = images[i].shape[:2]
+                    x_batch[row, :height, :width] = images[i]
+                    mask[row] = self.capsule_mask(size, height, width)
+                output = self._predict(tf.constant(x_batch), tf.constant(mask)).numpy()
+                for row, i in enumerate(batch):
+                    scores[i] = output[row]
+        return np.stack(scores)
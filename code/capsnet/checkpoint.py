@@ -0,0 +1,169 @@
+# -*- coding: utf-8 -*-
+"""Training state checkpoints to resume a run where it stopped.
+
+`ModelCheckpoint(save_best_only=True)` keeps the best model; a restart
+from it loses the optimizer slots (`Lion` m, the `AdamW` moments), the
+`ReduceLROnPlateau` counters and the position of the schedules and of the
+data. `TrainingCheckpoint` saves all of it to `directory`:
+
+    ckpt-<n>.index, ckpt-<n>.data-*  weights, optimizer slots, iterations and
+                                     hyperparameters (learning rate, weight
+                                     decay), TensorFlow's global generator
+    state.json                       epoch, step, callback counters, Python
+                                     and NumPy generator states, loader state
+                                     and the checkpoint they belong to
+
+`state.json` is written to a temporary file and renamed once the weights
+are on disk, and the previous weights are kept (`max_to_keep` >= 2), so a
+crash at any point leaves a complete checkpoint to resume from.
+"""
+import json
+import os
+import random
+
+import numpy as np
+import tensorflow as tf
+from tensorflow.keras.callbacks import Callback
+
+from .sampling import random_state, set_random_state
+
+STATE_FILENAME = 'state.json'
+
+# callback attributes that change during training, by class name; the
+# schedulers only depend on the epoch, their values are in the optimizer
+CALLBACK_STATE = {
+    'ReduceLROnPlateau': ('wait', 'cooldown_counter', 'best'),
+    'EarlyStopping': ('wait', 'stopped_epoch', 'best', 'best_epoch'),
+    'ModelCheckpoint': ('best', 'epochs_since_last_save'),
+}
+
+
+def callback_state(callback):
+    names = CALLBACK_STATE.get(type(callback).__name__, ())
+    return {name: float(getattr(callback, name)) if name == 'best' else getattr(callback, name)
+            for name in names if hasattr(callback, name)}
+
+
+class TrainingCheckpoint(Callback):
+    """Save the training state every `period` epochs and, with `save_freq`,
+    every `save_freq` batches, and restore it with `restore` before `fit`.
+
+    # Arguments
+        callbacks: the callbacks whose `CALLBACK_STATE` is saved; their
+            counters are put back when the next `fit` starts, after Keras
+            resets them.
+        loader: the training data, saved mid-epoch as well when it has
+            `get_state(step)` / `set_state` like `capsnet.store.StoreIterator`;
+            any other loader restarts the epoch.
+        max_to_keep: weights kept, at least 2.
+
+    `fit_resumable` restores it and runs `fit` from there.
+    """
+    def __init__(self, directory, callbacks=(), loader=None, period=1, save_freq=None,
+                 max_to_keep=2):
+        super(TrainingCheckpoint, self).__init__()
+        self.directory = directory
+        self.callbacks = list(callbacks)
+        self.loader = loader if hasattr(loader, 'get_state') else None
+        self.period = period
+        self.save_freq = save_freq if self.loader is not None else None
+        self.max_to_keep = max(2, max_to_keep)
+        self._manager = None
+        self._epoch = 0
+        self._pending = None
+
+    def _checkpoint_manager(self, model):
+        if self._manager is None:
+            objects = dict(model=model, optimizer=model.optimizer)
+            try:
+                objects['generator'] = tf.random.get_global_generator()
+            except RuntimeError:
+                # op determinism is on and nothing set a global generator
+                pass
+            checkpoint = tf.train.Checkpoint(**objects)
+            self._manager = tf.train.CheckpointManager(checkpoint, self.directory,
+                                                       self.max_to_keep)
+        return self._manager
+
+    def save(self, epoch, step=None):
+        """Save the state after `step` batches of epoch `epoch`, None at
+        its end."""
+        path = self._checkpoint_manager(self.model).save()
+        version, internal, gauss = random.getstate()
+        state = {'checkpoint': os.path.basename(path),
+                 'epoch': epoch,
+                 'step': step,
+                 'callbacks': [callback_state(callback) for callback in self.callbacks],
+                 'python_random': [version, list(internal), gauss],
+                 'numpy_random': random_state(np.random)}
+        if self.loader is not None:
+            state['loader'] = self.loader.get_state(len(self.loader) if step is None else step)
+        temporary = os.path.join(self.directory, STATE_FILENAME + '.tmp')
+        with open(temporary, 'w') as f:
+            json.dump(state, f)
+        os.replace(temporary, os.path.join(self.directory, STATE_FILENAME))
+
+    def restore(self, model):
+        """Restore the last state into the compiled `model`, the callbacks
+        and the loader; returns the epoch to resume, 0 without a state."""
+        filepath = os.path.join(self.directory, STATE_FILENAME)
+        if not os.path.exists(filepath):
+            return 0
+        with open(filepath) as f:
+            state = json.load(f)
+        # optimizer slots are restored when the optimizer creates them
+        self._checkpoint_manager(model).checkpoint.restore(
+            os.path.join(self.directory, state['checkpoint']))
+        version, internal, gauss = state['python_random']
+        random.setstate((version, tuple(internal), gauss))
+        set_random_state(np.random, state['numpy_random'])
+        if self.loader is not None:
+            self.loader.set_state(state['loader'])
+            if state['step'] is None:
+                self.loader.on_epoch_end()
+        self._pending = state['callbacks']
+        return state['epoch'] + (state['step'] is None)
+
+    def on_train_begin(self, logs=None):
+        self._checkpoint_manager(self.model)
+
+    def on_epoch_begin(self, epoch, logs=None):
+        self._epoch = epoch
+        # after every on_train_begin, which resets the counters
+        if self._pending is not None:
+            for callback, values in zip(self.callbacks, self._pending):
+                for name, value in values.items():
+                    setattr(callback, name, value)
+            self._pending = None
+
+    def on_train_batch_end(self, batch, logs=None):
+        if self.save_freq and (batch + 1) % self.save_freq == 0:
+            self.save(self._epoch, batch + 1)
+
+    def on_epoch_end(self, epoch, logs=None):
+        if (epoch + 1) % self.period == 0:
+            self.save(epoch)
+
+    def on_train_end(self, logs=None):
+        # a second `fit` resets the counters again
+        self._pending = [callback_state(callback) for callback in self.callbacks]
+
+
+def fit_resumable(model, train_set, epochs, checkpoint, resume=False, callbacks=(), **kwargs):
+    """`model.fit(train_set, epochs=epochs, ...)` with `checkpoint` after
+    `callbacks`, from the state `checkpoint` saved when `resume` is set.
+    Batches keep the order of the loader (`shuffle=False`). Returns the
+    history of the last `fit`."""
+    initial_epoch = checkpoint.restore(model) if resume else 0
+    callbacks = list(callbacks) + [checkpoint]
+    history = None
+    if getattr(train_set, 'position', 0):
+        # Keras fixes the batches of an epoch when `fit` starts: finish the
+        # interrupted one on its own
+        history = model.fit(train_set, epochs=initial_epoch + 1, initial_epoch=initial_epoch,
+                            callbacks=callbacks, shuffle=False, **kwargs)
+        initial_epoch += 1
+    if initial_epoch < epochs:
+        history = model.fit(train_set, epochs=epochs, initial_epoch=initial_epoch,
+                            callbacks=callbacks, shuffle=False, **kwargs)
+    return history
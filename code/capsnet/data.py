@@ -0,0 +1,159 @@
+# -*- coding: utf-8 -*-
+"""Input pipelines for the PCB `train` / `valid` directories."""
+import numpy as np
+import tensorflow as tf
+from tensorflow.keras.preprocessing.image import ImageDataGenerator, img_to_array, load_img
+
+from .augmentation import AUGMENTATION, BatchAugmentation
+from .index import list_directory
+from .resize import resize_images
+from .sampling import StratifiedSampler, class_weights
+
+# the `capsnet.index.IMAGE_FORMATS` `tf.io.decode_image` reads; the others
+# (ppm, tif, tiff) are decoded by PIL like `flow_from_directory` does
+DECODE_IMAGE_FORMATS = ('.bmp', '.jpeg', '.jpg', '.png')
+
+
+def _load_img(path):
+    return img_to_array(load_img(path.decode('utf-8')), dtype='uint8')
+
+
+def flow_from_directory(directory,
+                        image_size,
+                        batch_size,
+                        shuffle=False,
+                        preprocessing_function=None,
+                        augment=False):
+    """`ImageDataGenerator(...).flow_from_directory(...)` with the settings
+    of the training scripts: rescale=1./255, bicubic resize, categorical
+    labels, and `AUGMENTATION` when `augment` is set."""
+    datagen = ImageDataGenerator(preprocessing_function=preprocessing_function,
+                                 rescale=1./255,
+                                 **(AUGMENTATION if augment else {}))
+    return datagen.flow_from_directory(directory,
+                                       target_size=image_size,
+                                       interpolation='bicubic',
+                                       class_mode='categorical',
+                                       shuffle=shuffle,
+                                       batch_size=batch_size)
+
+
+def dataset_from_directory(directory,
+                           image_size,
+                           batch_size,
+                           shuffle=False,
+                           preprocessing_function=None,
+                           augment=False,
+                           cache=True,
+                           seed=None,
+                           dtype='float32',
+                           index=None,
+                           class_ratio=None,
+                           resize='bicubic'):
+    """`flow_from_directory` as a `tf.data.Dataset` of (x, one-hot y)
+    batches: decoding, resizing and augmentation run in parallel
+    (`AUTOTUNE`), the decoded images are cached and batches prefetched.
+    Augmentation is `capsnet.augmentation.BatchAugmentation`, and
+    `preprocessing_function` is called on whole batches.
+
+    The files, their order, `classes`, `class_indices`, `filenames`,
+    `samples` and `num_classes` are those of `flow_from_directory` and are
+    set on the returned dataset; `len()` is the number of batches, so
+    `model.fit`, `model.predict(ds, steps=len(ds))` and the metrics code
+    take it in place of the iterator.
+
+    # Arguments
+        cache: True caches in memory, a string caches to that file, False
+            decodes every epoch.
+        seed: seeds the shuffling and the augmentation.
+        dtype: 'uint8' skips `preprocessing_function` and the rescale and
+            ships the (augmented) images as raw uint8, for models that
+            preprocess in the graph (`build_capsnet(preprocessing=True)`);
+            a quarter of the bytes of float32 batches.
+        index: where the file index is kept, see
+            `capsnet.index.list_directory`; False rescans the directory.
+        class_ratio: 'balanced' or {class name: weight} draws
+            class-stratified batches (`capsnet.sampling.StratifiedSampler`)
+            instead of shuffling: every class is cached once and cycled
+            through in a new order each pass, so oversampling copies no
+            images. An epoch keeps its number of batches.
+        resize: 'bicubic', 'bilinear' or 'area', see `capsnet.resize`.
+
+    The resize is TensorFlow's (antialiased) rather than PIL's, so pixels
+    differ slightly from `flow_from_directory`. Files `tf.io.decode_image`
+    cannot read (ppm, tif) are decoded by PIL.
+    """
+    filepaths, filenames, classes, class_indices = list_directory(directory, index)
+    num_classes = len(class_indices)
+    AUTOTUNE = tf.data.experimental.AUTOTUNE
+
+    def decode_pil(path):
+        image = tf.numpy_function(_load_img, [path], tf.uint8)
+        image.set_shape([None, None, 3])
+        return image
+
+    def load(path, label, native):
+        image = tf.cond(native,
+                        lambda: tf.io.decode_image(tf.io.read_file(path), channels=3,
+                                                   expand_animations=False),
+                        lambda: decode_pil(path))
+        return resize_images(image, image_size, resize), tf.one_hot(label, num_classes)
+
+    def random_transforms(n):
+        return augmentation.random_transforms(n, image_size[0], image_size[1])
+
+    def draw(images, labels):
+        transforms, channel_shift = tf.numpy_function(random_transforms, [tf.shape(images)[0]],
+                                                      [tf.float32, tf.float32])
+        return images, labels, transforms, channel_shift
+
+    def transform(images, labels, transforms=None, channel_shift=None):
+        images = tf.cast(images, tf.float32)
+        if augment:
+            images = augmentation.apply(images, transforms, channel_shift)
+        if dtype == 'uint8':
+            return tf.cast(tf.clip_by_value(tf.round(images), 0, 255), tf.uint8), labels
+        if preprocessing_function is not None:
+            images = preprocessing_function(images)
+        return images * (1. / 255), labels
+
+    def decoded(rows, suffix=''):
+        dataset = tf.data.Dataset.from_tensor_slices((
+            [filepaths[i] for i in rows], classes[rows],
+            np.array([filepaths[i].lower().endswith(DECODE_IMAGE_FORMATS) for i in rows],
+                     dtype=bool)))
+        dataset = dataset.map(load, num_parallel_calls=AUTOTUNE)
+        if cache:
+            dataset = dataset.cache('' if cache is True else cache + suffix)
+        return dataset
+
+    if class_ratio is None:
+        dataset = decoded(np.arange(len(filepaths)))
+        if shuffle:
+            dataset = dataset.shuffle(len(filepaths), seed=seed, reshuffle_each_iteration=True)
+        dataset = dataset.batch(batch_size)
+    else:
+        sampler = StratifiedSampler(classes, batch_size,
+                                    class_weights(class_ratio, class_indices, classes), seed)
+        members = [np.flatnonzero(classes == c) for c in range(num_classes)]
+        per_class = [decoded(rows, '-%d' % c).shuffle(max(1, len(rows)), seed=seed,
+                                                      reshuffle_each_iteration=True).repeat()
+                     for c, rows in enumerate(members)]
+        choices = tf.data.Dataset.from_generator(sampler.epoch_classes, output_types=tf.int64,
+                                                 output_shapes=())
+        dataset = tf.data.experimental.choose_from_datasets(per_class, choices)
+        dataset = dataset.batch(batch_size).apply(
+            tf.data.experimental.assert_cardinality(sampler.steps))
+    if augment:
+        # the parameters are drawn in batch order, so a seed repeats them
+        augmentation = BatchAugmentation(seed)
+        dataset = dataset.map(draw)
+    dataset = dataset.map(transform, num_parallel_calls=AUTOTUNE).prefetch(AUTOTUNE)
+
+    dataset.classes = classes
+    dataset.class_indices = class_indices
+    dataset.filenames = filenames
+    dataset.samples = len(filenames)
+    dataset.num_classes = num_classes
+    dataset.batch_size = batch_size
+    return dataset
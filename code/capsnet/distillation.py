@@ -0,0 +1,134 @@
+# -*- coding: utf-8 -*-
+"""Routing-free students of trained capsule models.
+
+A student has the graph and the weights of its teacher, with every
+`Capsule` switched to one of two routing-free modes:
+
+    'static'       learned coupling coefficients (`routing='static'`),
+                   initialized from the mean coupling coefficients of the
+                   teacher's last routing iteration
+    'single-pass'  `routings=1`, i.e. uniform coupling
+
+and is then fine-tuned on the teacher's scores with `distill`.
+"""
+import numpy as np
+import tensorflow as tf
+from tensorflow.keras import models
+
+from .layers import Capsule
+from .ops import margin_loss
+from .profiling import RoutingProfiler
+
+STUDENT_MODES = ('static', 'single-pass')
+
+
+class CouplingRecorder(RoutingProfiler):
+    """Sums the coupling coefficients of the last routing iteration per
+    `Capsule` layer; only eager calls of the dynamic routing loop report
+    them (not `fused`, `top_k` or the other engines)."""
+    def __init__(self):
+        super(CouplingRecorder, self).__init__()
+        self.sums = {}
+        self.counts = {}
+
+    def record(self, start, layer_name, name, flops, *tensors):
+        pass
+
+    def iteration(self, start, layer, i, hat_inputs, c, o, b=None):
+        if i == layer.routings - 1:
+            self.sums[layer.name] = self.sums.get(layer.name, 0.) + tf.reduce_sum(c, 0).numpy()
+            self.counts[layer.name] = self.counts.get(layer.name, 0) + c.shape[0]
+
+    def means(self):
+        return {name: total / self.counts[name] for name, total in self.sums.items()}
+
+
+def mean_coupling(model, x_batches):
+    """Mean coupling coefficients, (num_capsule, input_num_capsule) per
+    `Capsule` layer name, of `model` over the batches in `x_batches`.
+
+    Raises ValueError if a `Capsule` reported none, i.e. runs an engine
+    other than the dynamic routing loop (`fused`, `top_k`, ...) or
+    `x_batches` is empty.
+    """
+    recorder = CouplingRecorder()
+    recorder.attach(model)
+    try:
+        for x_batch in x_batches:
+            model(x_batch, training=False)
+    finally:
+        recorder.detach(model)
+    means = recorder.means()
+    missing = [layer.name for layer in model.layers
+               if isinstance(layer, Capsule) and layer.name not in means]
+    if missing:
+        raise ValueError('No coupling coefficients recorded for the Capsule layers %s: only '
+                         'the unfused dynamic routing loop reports them' % ', '.join(missing))
+    return means
+
+
+def routing_free_student(teacher, mode='static', coupling=None):
+    """Copy of `teacher` whose `Capsule` layers do not route.
+
+    # Arguments
+        mode: one of `STUDENT_MODES`.
+        coupling: `mean_coupling` of the teacher, used to initialize the
+            static coupling; layers without an entry start uniform.
+    """
+    if mode not in STUDENT_MODES:
+        raise ValueError('Unknown student mode: %s' % mode)
+    coupling = coupling or {}
+
+    def clone_layer(layer):
+        config = layer.get_config()
+        if isinstance(layer, Capsule):
+            config.update({'early_exit_tol': None, 'top_k': None})
+            if mode == 'static':
+                config.update({'routing': 'static', 'fused': False})
+            else:
+                config['routings'] = 1
+        return layer.__class__.from_config(config)
+
+    student = models.clone_model(teacher, clone_function=clone_layer)
+    for source, target in zip(teacher.layers, student.layers):
+        if not isinstance(source, Capsule):
+            target.set_weights(source.get_weights())
+            continue
+        target.kernel.assign(source.kernel)
+        if mode == 'static' and source.name in coupling:
+            target.coupling_logits.assign(np.log(coupling[source.name] + 1e-7))
+    return student
+
+
+def distill(teacher, student, train_set, epochs=5, alpha=0.5, learning_rate=1e-4,
+            train_backbone=False):
+    """Fine-tune `student` on `alpha * margin_loss(labels) + (1 - alpha) *
+    mean squared error to the teacher's scores`.
+
+    Only the `Capsule` weights are trained unless `train_backbone`; the
+    student shares the teacher's backbone weights, so they are already
+    right. Returns the mean loss of every epoch.
+    """
+    if train_backbone:
+        variables = student.trainable_variables
+    else:
+        variables = [w for layer in student.layers if isinstance(layer, Capsule)
+                     for w in layer.trainable_weights]
+    optimizer = tf.keras.optimizers.Adam(learning_rate=learning_rate)
+
+    @tf.function
+    def train_step(x_batch, y_batch):
+        target = teacher(x_batch, training=False)
+        with tf.GradientTape() as tape:
+            scores = student(x_batch, training=train_backbone)
+            loss = tf.reduce_mean(alpha * margin_loss(y_batch, scores) + (1 - alpha) *
+                                  tf.reduce_mean(tf.square(scores - target), -1))
+        optimizer.apply_gradients(zip(tape.gradient(loss, variables), variables))
+        return loss
+
+    history = []
+    for _ in range(epochs):
+        losses = [float(train_step(*train_set[i])) for i in range(len(train_set))]
+        train_set.on_epoch_end()
+        history.append(np.mean(losses))
+    return history
@@ -0,0 +1,197 @@
+# -*- coding: utf-8 -*-
+"""Persistent file index of the PCB image directories.
+
+`flow_from_directory` lists and stats every file of `train` / `valid` each
+time it is called. `DirectoryIndex` keeps path, class, size, mtime and
+content hash of every image in a JSON file (by default
+`<directory>/.capsnet-index.json`). An update stats every directory but
+lists and stats the files only of those whose mtime changed, i.e. where
+files were added, removed or renamed, and hashes only new files and files
+whose size or mtime changed there. A file overwritten in place keeps the
+mtime of its directory: `verify=True` stats every file to catch it too,
+for about the cost of a `flow_from_directory` scan (`build_pyramid`, which
+keys its rows by the hashes, does). The index is saved only when the
+files changed. `listing` returns the files in the order and with the
+labels of `flow_from_directory`; `list_directory` is what the loaders of
+this package start from.
+"""
+import hashlib
+import json
+import os
+
+import numpy as np
+from tensorflow.keras.preprocessing.image import ImageDataGenerator
+
+INDEX_FILENAME = '.capsnet-index.json'
+# `DirectoryIterator.white_list_formats`
+IMAGE_FORMATS = ('png', 'jpg', 'jpeg', 'bmp', 'ppm', 'tif', 'tiff')
+# matched like `DirectoryIterator`, with the dot
+IMAGE_EXTENSIONS = tuple('.' + extension for extension in IMAGE_FORMATS)
+
+
+def file_hash(path, chunk_size=2**20):
+    digest = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class DirectoryIndex(object):
+    """Index of `directory`, one subdirectory per class.
+
+    # Arguments
+        filepath: JSON file of the index, `<directory>/.capsnet-index.json`
+            by default.
+        hash_files: compute content hashes (otherwise they are None).
+        verify: stat the files of unchanged directories as well, to catch
+            files overwritten in place.
+    """
+    def __init__(self, directory, filepath=None, hash_files=True, verify=False):
+        self.directory = directory
+        self.filepath = filepath or os.path.join(directory, INDEX_FILENAME)
+        self.hash_files = hash_files
+        self.verify = verify
+        # relative directory -> {'mtime', 'dirs': [...], 'files': {name: [size, mtime, hash]}}
+        self.directories = {}
+        self.changed = False
+        if os.path.exists(self.filepath):
+            with open(self.filepath) as f:
+                self.directories = json.load(f)['directories']
+
+    def update(self):
+        """Bring the index up to date; returns the number of directories
+        listed, directories reused and files hashed."""
+        stats = {'listed': 0, 'reused': 0, 'hashed': 0}
+        self.changed = not self.directories
+        directories = {}
+        pending = ['.']
+        while pending:
+            relative = pending.pop()
+            path = os.path.normpath(os.path.join(self.directory, relative))
+            mtime = os.stat(path).st_mtime_ns
+            previous = self.directories.get(relative)
+            if previous is None or previous['mtime'] != mtime:
+                dirs, names = self._list(relative, path)
+                entry = {'mtime': mtime, 'dirs': dirs,
+                         'files': self._stat(path, names, previous, stats)}
+                stats['listed'] += 1
+            else:
+                entry = previous
+                if self.verify:
+                    entry = dict(previous, files=self._stat(path, previous['files'], previous,
+                                                            stats))
+                stats['reused'] += 1
+            # a new mtime alone is not saved: saving the index changes
+            # that of its own directory
+            self.changed |= previous is None or (previous['dirs'], previous['files']) != (
+                entry['dirs'], entry['files'])
+            directories[relative] = entry
+            pending.extend(os.path.join(relative, name) if relative != '.' else name
+                           for name in entry['dirs'])
+        self.changed |= set(directories) != set(self.directories)
+        self.directories = directories
+        return stats
+
+    def _list(self, relative, path):
+        # what `flow_from_directory` walks: class directories are followed
+        # when they are symlinks (`os.path.isdir`), below them it is
+        # `os.walk(followlinks=False)`: symlinked directories are skipped
+        # and everything else, broken symlinks included, is a file
+        dirs, names = [], []
+        for item in os.scandir(path):
+            if relative == '.':
+                if item.is_dir():
+                    dirs.append(item.name)
+            elif item.is_dir():
+                if not item.is_symlink():
+                    dirs.append(item.name)
+            elif item.name.lower().endswith(IMAGE_EXTENSIONS):
+                names.append(item.name)
+        return sorted(dirs), names
+
+    def _stat(self, path, names, previous, stats):
+        previous_files = previous['files'] if previous else {}
+        files = {}
+        for name in names:
+            filepath = os.path.join(path, name)
+            try:
+                stat = os.stat(filepath)
+            except FileNotFoundError:
+                if not os.path.islink(filepath):
+                    # removed within the mtime resolution of the directory
+                    continue
+                # a broken symlink, listed by Keras as well
+                stat = os.lstat(filepath)
+            known = previous_files.get(name)
+            if known and known[:2] == [stat.st_size, stat.st_mtime_ns]:
+                files[name] = known
+                continue
+            digest = None
+            if self.hash_files and os.path.exists(filepath):
+                digest = file_hash(filepath)
+                stats['hashed'] += 1
+            files[name] = [stat.st_size, stat.st_mtime_ns, digest]
+        return files
+
+    def save(self):
+        # written next to the index and renamed, so a crash never leaves half a file
+        temporary = self.filepath + '.tmp'
+        with open(temporary, 'w') as f:
+            json.dump({'directory': os.path.abspath(self.directory),
+                       'directories': self.directories}, f)
+        os.replace(temporary, self.filepath)
+
+    @property
+    def class_indices(self):
+        return {name: i for i, name in enumerate(sorted(self.directories['.']['dirs']))}
+
+    def listing(self):
+        """(filenames relative to the directory, classes, class_indices) in
+        the order of `flow_from_directory(..., shuffle=False)`."""
+        filenames, classes = [], []
+        class_indices = self.class_indices
+        for name, label in sorted(class_indices.items(), key=lambda item: item[1]):
+            # os.walk roots sorted by path, then file names sorted
+            roots = sorted((relative for relative in self.directories
+                            if relative == name or relative.startswith(name + os.sep)),
+                           key=lambda relative: os.path.join(self.directory, relative))
+            for root in roots:
+                for filename in sorted(self.directories[root]['files']):
+                    filenames.append(os.path.join(root, filename))
+                    classes.append(label)
+        return filenames, classes, class_indices
+
+    def entries(self):
+        """{relative path: (class name, size, mtime in ns, hash)}."""
+        return {os.path.join(relative, name): (relative.split(os.sep)[0],) + tuple(entry)
+                for relative, directory in self.directories.items() if relative != '.'
+                for name, entry in directory['files'].items()}
+
+
+def index_directory(directory, filepath=None, hash_files=True, verify=False):
+    """Load and update the index of `directory`, and save it if the files
+    changed."""
+    index = DirectoryIndex(directory, filepath, hash_files, verify)
+    index.update()
+    if index.changed:
+        index.save()
+    return index
+
+
+def list_directory(directory, index=None):
+    """(filepaths, filenames, classes, class_indices) of the images of
+    `directory`, as in `flow_from_directory(..., shuffle=False)`.
+
+    # Arguments
+        index: None uses (and updates) the index in the directory, a
+            string the index at that path, False scans like Keras.
+    """
+    if index is False:
+        iterator = ImageDataGenerator().flow_from_directory(directory, class_mode=None,
+                                                            shuffle=False)
+        return iterator.filepaths, iterator.filenames, iterator.classes, iterator.class_indices
+    filenames, classes, class_indices = index_directory(directory, index).listing()
+    print('Found %d images belonging to %d classes.' % (len(filenames), len(class_indices)))
+    return ([os.path.join(directory, filename) for filename in filenames], filenames,
+            np.array(classes, dtype='int32'), class_indices)
@@ -0,0 +1,321 @@
+# -*- coding: utf-8 -*-
+import tensorflow as tf
+from tensorflow.keras import layers, activations
+
+from .ops import squash, standard_squash, softmax, length, grouped_capsule_transform
+from .routing import (ROUTING_ENGINES, FUSED_ROUTING_ENGINES, adaptive_dynamic_routing,
+                      topk_dynamic_routing, fused_topk_dynamic_routing, static_routing)
+
+
+# activations that are referred to by name in `Capsule(activation=...)`
+CAPSULE_ACTIVATIONS = {
+    'squash': squash,
+    'standard_squash': standard_squash,
+}
+
+
+class _IterationCounter(object):
+    # Plain holder so Keras does not track the variable as a layer weight,
+    # which would break `load_weights` on existing checkpoints.
+    def __init__(self, initial):
+        self.variable = tf.Variable(initial, trainable=False, dtype=tf.int32)
+
+
+@tf.keras.utils.register_keras_serializable(package='capsnet')
+class Capsule(layers.Layer):
+    """ A Capsule Implement with Pure Keras
+    There are two vesions of Capsule.
+    One is like dense layer (for the fixed-shape input),
+    and the other is like timedistributed dense (for various length input).
+    The input shape of Capsule must be (batch_size,
+                                        input_num_capsule,
+                                        input_dim_capsule
+                                       )
+    and the output shape is (batch_size,
+                             num_capsule,
+                             dim_capsule
+                            )
+    With `fused=True` the routing loop runs as a single XLA-compiled
+    kernel (see `capsnet.routing.fused_dynamic_routing`), the result
+    matches the Python loop within float32 tolerance. It also takes
+    `hat_inputs` before the permute, so no transposed copy is made and the
+    backward pass accumulates one gradient for `hat_inputs` instead of one
+    per iteration; this is what lowers peak training memory.
+    Without shared weights, `weight_groups=g` lets input capsule i use
+    kernel i % g, which bounds the parameters and allows a dynamic
+    input_num_capsule; by default every input capsule has its own kernel.
+    `routing` picks the routing engine: 'dynamic' (the default, described in
+    `call`), 'additive' (standard routing) or 'attention' (a single
+    non-iterative pass), see `capsnet.routing.ROUTING_ENGINES`, or 'static'
+    (no routing, learned coupling coefficients, see
+    `capsnet.routing.static_routing`; needs a fixed input_num_capsule).
+    `top_k=k` makes every input capsule send its prediction to its k
+    strongest parents only (dynamic engine).
+    With `early_exit_tol` set, inference (training=False) stops routing once
+    the coupling coefficients change by less than the tolerance, and
+    `routing_iterations` holds the iterations used by the last batch.
+    Setting `profiler` to a `capsnet.profiling.RoutingProfiler` records the
+    transform and every routing iteration of eager calls.
+    `mask` (batch_size, input_num_capsule) removes the input capsules where
+    it is 0 from routing, e.g. those computed from padding.
+    Capsule Implement is from https://github.com/bojone/Capsule/
+    Capsule Paper: https://arxiv.org/abs/1710.09829
+    """
+    def __init__(self,
+                 num_capsule,
+                 dim_capsule,
+                 routings=3,
+                 share_weights=True,
+                 activation='squash',
+                 fused=False,
+                 early_exit_tol=None,
+                 weight_groups=None,
+                 routing='dynamic',
+                 top_k=None,
+                 **kwargs):
+        super(Capsule, self).__init__(**kwargs)
+        self.num_capsule = num_capsule
+        self.dim_capsule = dim_capsule
+        self.routings = routings
+        self.share_weights = share_weights
+        self.fused = fused
+        self.early_exit_tol = early_exit_tol
+        self.weight_groups = weight_groups
+        if routing not in ROUTING_ENGINES and routing != 'static':
+            raise ValueError('Unknown routing engine: %s' % routing)
+        if early_exit_tol is not None and routing != 'dynamic':
+            raise ValueError('early_exit_tol needs the dynamic routing engine.')
+        if top_k is not None and (routing != 'dynamic' or early_exit_tol is not None):
+            raise ValueError('top_k needs the dynamic routing engine without early exit.')
+        self.routing = routing
+        self.top_k = top_k
+        self._iterations = _IterationCounter(routings)
+        # a `capsnet.profiling.RoutingProfiler`, not part of the config
+        self.profiler = None
+        if isinstance(activation, dict) and activation.get('class_name') == 'function':
+            # plain function serialized by the per-script copies of this layer
+            activation = activation['config']
+        if activation in CAPSULE_ACTIVATIONS:
+            self.activation = CAPSULE_ACTIVATIONS[activation]
+        else:
+            self.activation = activations.get(activation)
+
+    def build(self, input_shape):
+        input_dim_capsule = input_shape[-1]
+        if self.share_weights:
+            self.kernel = self.add_weight(
+                name='capsule_kernel',
+                shape=(1, input_dim_capsule,
+                       self.num_capsule * self.dim_capsule),
+                initializer='glorot_uniform',
+                trainable=True)
+        else:
+            input_num_capsule = self.weight_groups or input_shape[-2]
+            if input_num_capsule is None:
+                raise ValueError("Input Shape must be defied if weights not shared "
+                                 "and weight_groups is not set.")
+            self.kernel = self.add_weight(
+                name='capsule_kernel',
+                shape=(input_num_capsule, input_dim_capsule,
+                       self.num_capsule * self.dim_capsule),
+                initializer='glorot_uniform',
+                trainable=True)
+        if self.routing == 'static':
+            if input_shape[-2] is None:
+                raise ValueError("Input Shape must be defined for the static routing.")
+            self.coupling_logits = self.add_weight(
+                name='coupling_logits',
+                shape=(self.num_capsule, input_shape[-2]),
+                initializer='zeros',
+                trainable=True)
+
+    @property
+    def routing_iterations(self):
+        return int(self._iterations.variable.numpy())
+
+    def call(self, inputs, training=None, mask=None):
+        """Following the routing algorithm from Hinton's paper,
+        but replace b = b + <u,v> with b = <u,v>.
+        This change can improve the feature representation of Capsule.
+        However, you can replace
+            b = K.batch_dot(outputs, hat_inputs, [2, 3])
+        with
+            b += K.batch_dot(outputs, hat_inputs, [2, 3])
+        to realize a standard routing.
+        """
+        early_exit = self.early_exit_tol is not None and not training
+        if mask is not None:
+            # a zero input capsule has a zero prediction, so it adds nothing
+            # to the weighted sums and its agreement stays 0
+            inputs = inputs * tf.cast(mask, inputs.dtype)[:, :, None]
+        # the profiler times eager calls only, a traced graph runs as usual
+        profiler = self.profiler if tf.executing_eagerly() else None
+        if profiler is not None:
+            start = profiler.start()
+
+        if self.share_weights:
+            hat_inputs = tf.keras.backend.conv1d(inputs, self.kernel)
+        else:
+            hat_inputs = grouped_capsule_transform(inputs, self.kernel)
+
+        # the batch stays -1 and the input capsules are static when known,
+        # so the traced shapes hold for any batch size and XLA (which
+        # compiles once per concrete batch size) gets a constant reshape
+        input_num_capsule = inputs.shape[1]
+        if input_num_capsule is None:
+            input_num_capsule = tf.shape(inputs)[1]
+        hat_inputs = tf.reshape(hat_inputs,
+                                (-1, input_num_capsule,
+                                 self.num_capsule, self.dim_capsule))
+
+        if profiler is None:
+            return self._route(hat_inputs, early_exit)
+        profiler.transform(start, self, inputs, hat_inputs)
+        start = profiler.start()
+        o = self._route(hat_inputs, early_exit, profiler)
+        profiler.routing(start, self, hat_inputs, o)
+        return o
+
+    def _route(self, hat_inputs, early_exit, profiler=None):
+        if self.routing == 'static':
+            return static_routing(hat_inputs, self.coupling_logits, self.activation,
+                                  input_major=True)
+        if self.top_k is not None:
+            routing = fused_topk_dynamic_routing if self.fused else topk_dynamic_routing
+            return routing(hat_inputs, self.routings, self.top_k, self.activation,
+                           input_major=True)
+        if self.fused and not early_exit:
+            return FUSED_ROUTING_ENGINES[self.routing](
+                hat_inputs, self.routings, self.activation, input_major=True)
+        if self.routing != 'dynamic':
+            return ROUTING_ENGINES[self.routing](
+                hat_inputs, self.routings, self.activation, input_major=True)
+
+        hat_inputs = tf.transpose(hat_inputs, (0, 2, 1, 3))
+
+        if early_exit:
+            o, iterations = adaptive_dynamic_routing(
+                hat_inputs, self.routings, self.early_exit_tol, self.activation)
+            self._iterations.variable.assign(iterations)
+            return o
+
+        b = tf.zeros_like(hat_inputs[:, :, :, 0])
+        for i in range(self.routings):
+            if profiler is not None:
+                start = profiler.start()
+            c = softmax(b, 1)
+            o = self.activation(
+                tf.squeeze(tf.matmul(tf.expand_dims(c, 2), hat_inputs), 2))
+            if i < self.routings - 1:
+                b = tf.squeeze(tf.matmul(tf.expand_dims(o, 2), hat_inputs,
+                                         transpose_b=True), 2)
+            if profiler is not None:
+                profiler.iteration(start, self, i, hat_inputs, c, o,
+                                   b if i < self.routings - 1 else None)
+
+        return o
+
+    def compute_output_shape(self, input_shape):
+        return (None, self.num_capsule, self.dim_capsule)
+
+    def compute_mask(self, inputs, mask=None):
+        # the output capsules are never masked
+        return None
+
+    def get_config(self):
+        for name, function in CAPSULE_ACTIVATIONS.items():
+            if self.activation is function:
+                activation = name
+                break
+        else:
+            activation = activations.serialize(self.activation)
+        config = super(Capsule, self).get_config()
+        config.update({'num_capsule': self.num_capsule,
+                       'dim_capsule': self.dim_capsule,
+                       'routings': self.routings,
+                       'share_weights': self.share_weights,
+                       'activation': activation,
+                       'fused': self.fused,
+                       'early_exit_tol': self.early_exit_tol,
+                       'weight_groups': self.weight_groups,
+                       'routing': self.routing,
+                       'top_k': self.top_k})
+        return config
+
+
+@tf.keras.utils.register_keras_serializable(package='capsnet')
+class Length(layers.Layer):
+    """
+    Compute the length of vectors. This is used to compute a Tensor that has the
+    same shape with y_true in margin_loss. Using this layer as model's output can
+    directly predict labels by using `y_pred = np.argmax(model.predict(x), 1)`
+    inputs: shape=[None, num_vectors, dim_vector]
+    output: shape=[None, num_vectors]
+    The length is computed and returned in float32, also under a mixed
+    precision policy.
+    `Length(epsilon=0.)` is the `Lambda(lambda z: K.sqrt(K.sum(K.square(z), 2)))`
+    head of the scripts, with the same result, but it survives `model.save`
+    and SavedModel export.
+    source: https://github.com/XifengGuo/CapsNet-Keras/
+    """
+    def __init__(self, epsilon=None, **kwargs):
+        super(Length, self).__init__(**kwargs)
+        self.epsilon = epsilon
+
+    def call(self, inputs, **kwargs):
+        return length(inputs, -1, self.epsilon)
+
+    def compute_output_shape(self, input_shape):
+        return input_shape[:-1]
+
+    def get_config(self):
+        config = super(Length, self).get_config()
+        config['epsilon'] = self.epsilon
+        return config
+
+
+# `tf.keras.applications.imagenet_utils.preprocess_input` modes as
+# (reverse channels, per-channel scale, per-channel offset) on RGB 0..255
+PREPROCESSING = {
+    'caffe': (True, (1., 1., 1.), (-103.939, -116.779, -123.68)),
+    'torch': (False, tuple(1. / (255. * s) for s in (0.229, 0.224, 0.225)),
+              tuple(-m / s for m, s in zip((0.485, 0.456, 0.406), (0.229, 0.224, 0.225)))),
+    'tf': (False, (1. / 127.5,) * 3, (-1.,) * 3),
+}
+
+
+@tf.keras.utils.register_keras_serializable(package='capsnet')
+class Preprocessing(layers.Layer):
+    """
+    The backbone's `preprocess_input` followed by `* rescale` as one
+    per-channel multiply-add in the graph, so the input pipeline can feed
+    raw uint8 images.
+    mode: 'caffe' (ResNet50, VGG19), 'torch' (DenseNet121) or 'tf'
+        (InceptionV3, MobileNetV2), see `capsnet.models.PREPROCESSING_MODES`.
+    rescale: 1./255 reproduces `ImageDataGenerator(preprocessing_function=
+        preprocess_input, rescale=1./255)`, the pipeline the existing
+        checkpoints were trained with; 1. is `preprocess_input` alone.
+    """
+    def __init__(self, mode, rescale=1., **kwargs):
+        super(Preprocessing, self).__init__(**kwargs)
+        if mode not in PREPROCESSING:
+            raise ValueError('Unknown preprocessing mode: %s' % mode)
+        self.mode = mode
+        self.rescale = rescale
+        self.reverse, scale, offset = PREPROCESSING[mode]
+        self.scale = [s * rescale for s in scale]
+        self.offset = [o * rescale for o in offset]
+
+    def call(self, inputs, **kwargs):
+        x = tf.cast(inputs, self.compute_dtype)
+        if self.reverse:  # RGB -> BGR
+            x = x[..., ::-1]
+        return x * tf.constant(self.scale, x.dtype) + tf.constant(self.offset, x.dtype)
+
+    def compute_output_shape(self, input_shape):
+        return input_shape
+
+    def get_config(self):
+        config = super(Preprocessing, self).get_config()
+        config.update({'mode': self.mode, 'rescale': self.rescale})
+        return config
@@ -0,0 +1,21 @@
+# -*- coding: utf-8 -*-
+from sklearn.metrics import confusion_matrix
+
+
+def specificity_score(y_true, y_pred, labels=None, pos_label=1, average='binary'):
+    """
+    Compute the specificity score.
+    """
+    cm = confusion_matrix(y_true, y_pred, labels=labels)
+    tn, fp, fn, tp = cm.ravel()
+    if average == 'micro':
+        specificity = tn / (tn + fp)
+    elif average == 'macro':
+        specificity = (tn / (tn + fp) + tp / (tp + fn)) / 2
+    elif average == 'weighted':
+        specificity = (tn / (tn + fp) * (tn + fn) + tp / (tp + fn) * (fp + tp)) / (tn + fp + fn + tp)
+    elif average == 'binary':
+        specificity = tn / (tn + fp)
+    else:
+        raise ValueError("Unsupported average type.")
+    return specificity
@@ -0,0 +1,165 @@
+# -*- coding: utf-8 -*-
+"""Model builders for the backbone + capsule experiments.
+
+The layer stacks match the scripts (`build_capsnet`:
+`train_capsnet_latest15-200-full-size-*`, `build_conv_capsnet`:
+`predict_capsnet-*-best`) so that the `weights-capsnet-*.h5` checkpoints of
+those scripts load into them.
+"""
+import inspect
+
+import tensorflow as tf
+from tensorflow.keras import layers, models
+from tensorflow.keras.applications.densenet import DenseNet121
+from tensorflow.keras.applications.densenet import preprocess_input as preinput_densenet121
+from tensorflow.keras.applications.resnet50 import ResNet50
+from tensorflow.keras.applications.resnet50 import preprocess_input as preinput_resnet50
+from tensorflow.keras.applications.vgg19 import VGG19
+from tensorflow.keras.applications.vgg19 import preprocess_input as preinput_vgg19
+
+from .layers import Capsule, Length, Preprocessing
+
+BACKBONES = {
+    'densenet121': (DenseNet121, preinput_densenet121),
+    'resnet50': (ResNet50, preinput_resnet50),
+    'vgg19': (VGG19, preinput_vgg19),
+}
+
+# `capsnet.layers.Preprocessing` mode of each backbone's `preprocess_input`
+PREPROCESSING_MODES = {
+    'densenet121': 'torch',
+    'resnet50': 'caffe',
+    'vgg19': 'caffe',
+    'inception_v3': 'tf',
+    'mobilenet_v2': 'tf',
+}
+
+
+def build_capsnet(backbone='densenet121',
+                  image_size=(200, 200),
+                  num_classes=2,
+                  routings=7,
+                  weights=None,
+                  preprocessing=False,
+                  rescale=1.,
+                  **capsule_kwargs):
+    """Backbone -> Reshape((-1, 512)) -> Capsule(32, 16, 3) x2
+    -> Capsule(num_classes, 32, routings) -> vector length.
+
+    # Arguments
+        backbone: one of `BACKBONES`.
+        weights: backbone weights, 'imagenet' for a fresh training run,
+            None when a checkpoint is loaded afterwards.
+        preprocessing: take raw uint8 images and run the backbone's
+            `preprocess_input` (times `rescale`) in the graph, as a
+            `Preprocessing` layer; the input pipeline must then only
+            resize (and augment). `rescale=1./255` matches the pipelines
+            of the existing checkpoints, whose weights load either way.
+        capsule_kwargs: extra `Capsule` arguments (e.g. `fused`),
+            applied to all three capsule layers.
+    """
+    if backbone not in BACKBONES:
+        raise ValueError('Unknown backbone: %s' % backbone)
+    application, _ = BACKBONES[backbone]
+
+    if preprocessing:
+        input_image = layers.Input(shape=(image_size[0], image_size[1], 3), dtype='uint8')
+        x = Preprocessing(PREPROCESSING_MODES[backbone], rescale)(input_image)
+    else:
+        input_image = x = layers.Input(shape=(image_size[0], image_size[1], 3))
+    base_model = application(include_top=False, weights=weights, input_tensor=x)
+
+    x = layers.Reshape((-1, 512))(base_model.output)
+    x = Capsule(32, 16, 3, True, **capsule_kwargs)(x)
+    x = Capsule(32, 16, 3, True, **capsule_kwargs)(x)
+    capsule = Capsule(num_classes, 32, routings, True, **capsule_kwargs)(x)
+    # the scores are float32, also under a mixed precision policy
+    output = Length(epsilon=0.)(capsule)
+    return models.Model(inputs=input_image, outputs=output)
+
+
+def _conv_stack(input_image):
+    # the plain Conv2D stack of the scripts that do not use a pretrained backbone
+    x = layers.Conv2D(64, (3, 3), activation='relu')(input_image)
+    x = layers.BatchNormalization()(x)
+
+    x = layers.Conv2D(64, (3, 3), activation='relu')(x)
+    x = layers.BatchNormalization()(x)
+    x = layers.MaxPooling2D((2, 2), strides=(2, 2))(x)
+
+    x = layers.Conv2D(128, (3, 3), activation='relu')(x)
+    x = layers.BatchNormalization()(x)
+    x = layers.MaxPooling2D((2, 2), strides=(2, 2))(x)
+
+    x = layers.Conv2D(128, (3, 3), activation='relu')(x)
+    x = layers.BatchNormalization()(x)
+
+    x = layers.Conv2D(128, (3, 3), activation='relu')(x)
+    x = layers.BatchNormalization()(x)
+    return x
+
+
+def build_no_capsule(image_size=(200, 200), num_classes=2):
+    """The plain CNN of `train_capsnet_latest15-200-no-capsule-full-size`,
+    the baseline the capsule models are compared with."""
+    input_image = layers.Input(shape=(image_size[0], image_size[1], 3))
+    x = _conv_stack(input_image)
+    x = layers.Flatten()(x)
+    output = layers.Dense(num_classes, activation='softmax', name='softmax')(x)
+    return models.Model(inputs=input_image, outputs=output)
+
+
+def build_conv_capsnet(num_classes=2, routings=5, capsule_mask=False, **capsule_kwargs):
+    """Conv2D stack -> Reshape((-1, 128)) -> Capsule(32, 8, 3) x2
+    -> Capsule(num_classes, 16, routings) -> vector length, on
+    `Input(shape=(None, None, 3))`: the model of the `predict_capsnet-*-best`
+    scripts, which runs at every resolution.
+
+    # Arguments
+        capsule_mask: add a second input, (batch_size, input_num_capsule),
+            that is 1 for the capsules of the feature map and 0 for those
+            computed from padding, see `capsnet.bucketing`.
+        capsule_kwargs: extra `Capsule` arguments, applied to all three
+            capsule layers.
+    """
+    input_image = layers.Input(shape=(None, None, 3))
+    x = _conv_stack(input_image)
+    x = layers.Reshape((-1, 128))(x)
+    if capsule_mask:
+        mask = layers.Input(shape=(None,), name='capsule_mask')
+        x = Capsule(32, 8, 3, True, **capsule_kwargs)(x, mask=mask)
+        inputs = [input_image, mask]
+    else:
+        x = Capsule(32, 8, 3, True, **capsule_kwargs)(x)
+        inputs = input_image
+    x = Capsule(32, 8, 3, True, **capsule_kwargs)(x)
+    capsule = Capsule(num_classes, 16, routings, True, **capsule_kwargs)(x)
+    output = Length(epsilon=0.)(capsule)
+    return models.Model(inputs=inputs, outputs=output)
+
+
+def compile_capsnet(model, jit_compile=False, **kwargs):
+    """`model.compile(**kwargs)`; with `jit_compile` the whole train, test
+    and predict steps (backbone, routing, loss, gradients and optimizer
+    update) are compiled by XLA. Otherwise they run as a plain
+    `tf.function`, with XLA routing only in `Capsule(..., fused=True)`
+    layers. Keras without the `jit_compile` argument of `compile` gets the
+    steps wrapped in `tf.function(jit_compile=True)`.
+
+    XLA compiles once per batch shape: a last batch smaller than
+    `batch_size` costs one more compilation per function.
+    """
+    if not jit_compile:
+        model.compile(**kwargs)
+    elif 'jit_compile' in inspect.signature(model.compile).parameters:
+        model.compile(jit_compile=True, **kwargs)
+    else:
+        model.compile(**kwargs)
+        model.train_step = tf.function(model.train_step, jit_compile=True)
+        model.test_step = tf.function(model.test_step, jit_compile=True)
+        model.predict_step = tf.function(model.predict_step, jit_compile=True)
+    return model
+
+
+def preprocess_function(backbone):
+    return BACKBONES[backbone][1]
@@ -0,0 +1,90 @@
+# -*- coding: utf-8 -*-
+import tensorflow as tf
+
+
+# Under a mixed_float16 / mixed_bfloat16 policy the capsule tensors arrive
+# in reduced precision. The norms, the softmax and the loss are computed in
+# float32 (epsilon=1e-7 is below the float16 resolution and exp() over- or
+# underflows there); the contractions stay in the compute dtype.
+
+
+@tf.keras.utils.register_keras_serializable(package='capsnet')
+def squash(x, axis=-1):
+    x32 = tf.cast(x, tf.float32)
+    s_squared_norm = tf.reduce_sum(
+        tf.square(x32), axis, keepdims=True) + tf.keras.backend.epsilon()
+    scale = tf.sqrt(s_squared_norm) / (0.5 + s_squared_norm)
+    return tf.cast(scale * x32, x.dtype)
+
+
+@tf.keras.utils.register_keras_serializable(package='capsnet')
+def standard_squash(x, axis=-1):
+    """The squash of the capsule paper, |s|^2 / (1 + |s|^2) * s / |s|, used
+    by the `train_capsnet_origin2v1-*` scripts."""
+    x32 = tf.cast(x, tf.float32)
+    s_squared_norm = tf.reduce_sum(
+        tf.square(x32), axis, keepdims=True) + tf.keras.backend.epsilon()
+    scale = tf.sqrt(s_squared_norm) / (1.0 + s_squared_norm)
+    return tf.cast(scale * x32, x.dtype)
+
+
+@tf.keras.utils.register_keras_serializable(package='capsnet')
+def softmax(x, axis=-1):
+    x32 = tf.cast(x, tf.float32)
+    ex = tf.exp(x32 - tf.reduce_max(x32, axis=axis, keepdims=True))
+    return tf.cast(ex / tf.reduce_sum(ex, axis=axis, keepdims=True), x.dtype)
+
+
+def length(x, axis=-1, epsilon=None):
+    """Vector length in float32, `Length` and the model heads use it."""
+    if epsilon is None:
+        epsilon = tf.keras.backend.epsilon()
+    x32 = tf.cast(x, tf.float32)
+    return tf.sqrt(tf.reduce_sum(tf.square(x32), axis) + epsilon)
+
+
+@tf.keras.utils.register_keras_serializable(package='capsnet')
+def margin_loss(y_true, y_pred):
+    y_true = tf.cast(y_true, tf.float32)
+    y_pred = tf.cast(y_pred, tf.float32)
+    lamb, margin = 0.5, 0.1
+    return tf.reduce_sum(y_true * tf.square(tf.keras.backend.relu(1 - margin - y_pred)) + lamb * (
+        1 - y_true) * tf.square(tf.keras.backend.relu(y_pred - margin)), axis=-1)
+
+
+def caps_batch_dot(x, y):
+    x = tf.expand_dims(x, 2)
+    if tf.keras.backend.int_shape(x)[3] is not None:
+        y = tf.transpose(y, (0, 1, 3, 2))
+    o = tf.matmul(x, y)
+    return tf.squeeze(o, 2)
+
+
+def grouped_capsule_transform(inputs, kernel):
+    """Non-shared capsule transform as one batched matmul.
+
+    Input capsule i is transformed by kernel[i % groups], where
+    groups = kernel.shape[0]. With groups == input_num_capsule this is
+    exactly `K.local_conv1d(inputs, kernel, [1], [1])`, fewer groups bound
+    the parameter count and also work when input_num_capsule is only
+    known at run time.
+
+    inputs: (batch_size, input_num_capsule, input_dim_capsule)
+    kernel: (groups, input_dim_capsule, num_capsule * dim_capsule)
+    output: (batch_size, input_num_capsule, num_capsule * dim_capsule)
+    """
+    groups, input_dim_capsule, output_dim = tf.keras.backend.int_shape(kernel)
+    batch_size = tf.shape(inputs)[0]
+    input_num_capsule = tf.shape(inputs)[1]
+    # pad to a multiple of groups so the capsules fold into (rows, groups)
+    padding = (groups - input_num_capsule % groups) % groups
+    x = tf.pad(inputs, [[0, 0], [0, padding], [0, 0]])
+    x = tf.reshape(x, (batch_size, -1, groups, input_dim_capsule))
+    rows = tf.shape(x)[1]
+    # (groups, batch_size * rows, input_dim) @ (groups, input_dim, output_dim);
+    # spelled out because the gradient of the equivalent einsum is ~2x slower
+    x = tf.reshape(tf.transpose(x, (2, 0, 1, 3)), (groups, -1, input_dim_capsule))
+    hat_inputs = tf.reshape(tf.matmul(x, kernel), (groups, batch_size, rows, output_dim))
+    hat_inputs = tf.reshape(tf.transpose(hat_inputs, (1, 2, 0, 3)),
+                            (batch_size, -1, output_dim))
+    return hat_inputs[:, :input_num_capsule]
@@ -0,0 +1,140 @@
+# -*- coding: utf-8 -*-
+"""`Lion` and `WeightDecayScheduler` of the `*-reduce_lr-r6*` training
+scripts, importable by the tools and `capsnet.checkpoint`."""
+import numpy as np
+import tensorflow as tf
+from tensorflow.keras import backend as K
+from tensorflow.keras.callbacks import Callback
+
+# tf.keras.optimizers.Optimizer is the new optimizer since TF 2.11
+OptimizerV2 = getattr(tf.keras.optimizers, 'legacy', tf.keras.optimizers).Optimizer
+
+
+@tf.keras.utils.register_keras_serializable(package='capsnet')
+class Lion(OptimizerV2):
+    r"""Optimizer that implements the Lion algorithm."""
+
+    def __init__(self,
+                 learning_rate=0.0001,
+                 beta_1=0.9,
+                 beta_2=0.99,
+                 wd=0,
+                 name='lion',
+                 **kwargs):
+        """Construct a new Lion optimizer."""
+
+        super(Lion, self).__init__(name, **kwargs)
+        self._set_hyper('learning_rate', kwargs.get('lr', learning_rate))
+        self._set_hyper('beta_1', beta_1)
+        self._set_hyper('beta_2', beta_2)
+        self._set_hyper('wd', wd)
+
+    def _create_slots(self, var_list):
+        # Create slots for the first and second moments.
+        # Separate for-loops to respect the ordering of slot variables from v1.
+        for var in var_list:
+            self.add_slot(var, 'm')
+
+    def _prepare_local(self, var_device, var_dtype, apply_state):
+        super(Lion, self)._prepare_local(var_device, var_dtype, apply_state)
+
+        beta_1_t = tf.identity(self._get_hyper('beta_1', var_dtype))
+        beta_2_t = tf.identity(self._get_hyper('beta_2', var_dtype))
+        wd_t = tf.identity(self._get_hyper('wd', var_dtype))
+        lr = apply_state[(var_device, var_dtype)]['lr_t']
+        apply_state[(var_device, var_dtype)].update(
+            dict(
+                lr=lr,
+                beta_1_t=beta_1_t,
+                one_minus_beta_1_t=1 - beta_1_t,
+                beta_2_t=beta_2_t,
+                one_minus_beta_2_t=1 - beta_2_t,
+                wd_t=wd_t))
+
+    @tf.function(jit_compile=True)
+    def _resource_apply_dense(self, grad, var, apply_state=None):
+        var_device, var_dtype = var.device, var.dtype.base_dtype
+        coefficients = ((apply_state or {}).get((var_device, var_dtype)) or
+                        self._fallback_apply_state(var_device, var_dtype))
+
+        m = self.get_slot(var, 'm')
+        var_t = var.assign_sub(
+            coefficients['lr_t'] *
+            (tf.math.sign(m * coefficients['beta_1_t'] +
+                          grad * coefficients['one_minus_beta_1_t']) +
+             var * coefficients['wd_t']))
+        with tf.control_dependencies([var_t]):
+            return m.assign(m * coefficients['beta_2_t'] +
+                            grad * coefficients['one_minus_beta_2_t'])
+
+    @tf.function(jit_compile=True)
+    def _resource_apply_sparse(self, grad, var, indices, apply_state=None):
+        var_device, var_dtype = var.device, var.dtype.base_dtype
+        coefficients = ((apply_state or {}).get((var_device, var_dtype)) or
+                        self._fallback_apply_state(var_device, var_dtype))
+
+        m = self.get_slot(var, 'm')
+        m_t = m.assign(m * coefficients['beta_1_t'])
+        m_scaled_g_values = grad * coefficients['one_minus_beta_1_t']
+        m_t = m_t.scatter_add(tf.IndexedSlices(m_scaled_g_values, indices))
+        var_t = var.assign_sub(coefficients['lr'] *
+                               (tf.math.sign(m_t) + var * coefficients['wd_t']))
+
+        with tf.control_dependencies([var_t]):
+            m_t = m_t.scatter_add(tf.IndexedSlices(-m_scaled_g_values, indices))
+            m_t = m_t.assign(m_t * coefficients['beta_2_t'] /
+                             coefficients['beta_1_t'])
+            m_scaled_g_values = grad * coefficients['one_minus_beta_2_t']
+            return m_t.scatter_add(tf.IndexedSlices(m_scaled_g_values, indices))
+
+    def get_config(self):
+        config = super(Lion, self).get_config()
+        config.update({
+            'learning_rate': self._serialize_hyperparameter('learning_rate'),
+            'beta_1': self._serialize_hyperparameter('beta_1'),
+            'beta_2': self._serialize_hyperparameter('beta_2'),
+            'wd': self._serialize_hyperparameter('wd'),
+        })
+        return config
+
+
+class WeightDecayScheduler(Callback):
+    """Weight Decay Scheduler, `LearningRateScheduler` for the weight decay:
+    `weight_decay` of `AdamW` or `wd` of `Lion`.
+
+    Arguments:
+        schedule: a function that takes an epoch index as input
+            (integer, indexed from 0) and returns a new
+            weight decay as output (float).
+        verbose: int. 0: quiet, 1: update messages.
+    """
+
+    def __init__(self, schedule, verbose=0):
+        super(WeightDecayScheduler, self).__init__()
+        self.schedule = schedule
+        self.verbose = verbose
+
+    def _hyper(self):
+        for name in ('weight_decay', 'wd'):
+            if hasattr(self.model.optimizer, name):
+                return name
+        raise ValueError('Optimizer must have a "weight_decay" or "wd" attribute.')
+
+    def on_epoch_begin(self, epoch, logs=None):
+        name = self._hyper()
+        try:  # new API
+            weight_decay = float(K.get_value(getattr(self.model.optimizer, name)))
+            weight_decay = self.schedule(epoch, weight_decay)
+        except TypeError:  # Support for old API for backward compatibility
+            weight_decay = self.schedule(epoch)
+        if not isinstance(weight_decay, (float, np.float32, np.float64)):
+            raise ValueError('The output of the "schedule" function '
+                             'should be float.')
+        K.set_value(getattr(self.model.optimizer, name), weight_decay)
+        if self.verbose > 0:
+            print('\nEpoch %05d: WeightDecayScheduler reducing weight '
+                  'decay to %s.' % (epoch + 1, weight_decay))
+
+    def on_epoch_end(self, epoch, logs=None):
+        logs = logs or {}
+        logs['weight_decay'] = K.get_value(getattr(self.model.optimizer, self._hyper()))
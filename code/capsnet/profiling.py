@@ -0,0 +1,212 @@
+# -*- coding: utf-8 -*-
+"""Per-layer and per-routing-iteration cost of capsule models.
+
+With a `RoutingProfiler` attached, every eager `Capsule` call records the
+transform, each routing iteration and the whole routing as events holding
+wall time, FLOPs and the size of the tensors they produced. Traced graphs
+(`model.predict`, `fused=True`) are not split, so profile with eager calls;
+`profile_model` does that for a model and adds the backbone and graph-mode
+timings for comparison.
+
+FLOPs count a multiply-add as 2 and elementwise ops once per element, like
+the TensorFlow profiler; top-k and early-exit routing are counted as full
+dense routing, an upper bound.
+"""
+import json
+import time
+
+import numpy as np
+import tensorflow as tf
+from tensorflow.keras import models
+from tensorflow.python.framework.convert_to_constants import convert_variables_to_constants_v2
+
+from .layers import Capsule
+
+
+def _nbytes(*tensors):
+    return sum(int(np.prod(t.shape)) * t.dtype.size for t in tensors if t is not None)
+
+
+def _sync(*tensors):
+    # eager ops may still run asynchronously (GPU), fetching waits for them
+    for t in tensors:
+        if t is not None:
+            t.numpy()
+
+
+def iteration_flops(batch_size, num_capsule, input_num_capsule, dim_capsule, last=False):
+    """FLOPs of one dynamic routing iteration: softmax, weighted sum,
+    squash and, except for the last iteration, the agreement."""
+    couplings = batch_size * num_capsule * input_num_capsule
+    flops = 5 * couplings + 2 * couplings * dim_capsule
+    flops += batch_size * num_capsule * (3 * dim_capsule + 3)
+    if not last:
+        flops += 2 * couplings * dim_capsule
+    return flops
+
+
+def routing_flops(layer, batch_size, input_num_capsule):
+    routings = 1 if layer.routing in ('attention', 'static') else layer.routings
+    flops = sum(iteration_flops(batch_size, layer.num_capsule, input_num_capsule,
+                                layer.dim_capsule, last=i == routings - 1)
+                for i in range(routings))
+    if layer.routing == 'attention':
+        # agreement with the summed predictions
+        flops += 4 * batch_size * layer.num_capsule * input_num_capsule * layer.dim_capsule
+    return flops
+
+
+def graph_flops(function, input_spec):
+    """FLOPs of `function` traced for `input_spec`, from the TensorFlow profiler."""
+    concrete = tf.function(function).get_concrete_function(input_spec)
+    frozen = convert_variables_to_constants_v2(concrete)
+    options = tf.compat.v1.profiler.ProfileOptionBuilder(
+        tf.compat.v1.profiler.ProfileOptionBuilder.float_operation()).with_empty_output().build()
+    return tf.compat.v1.profiler.profile(frozen.graph, options=options).total_float_ops
+
+
+class RoutingProfiler(object):
+    """Collects timed events, see the module docstring.
+
+    # Example
+        profiler = RoutingProfiler()
+        profiler.attach(model)
+        model(x_batch, training=False)
+        profiler.detach(model)
+        profiler.chrome_trace('capsnet_profile.json')
+        print(profiler.summary())
+    """
+    def __init__(self):
+        self.events = []
+        self._origin = time.perf_counter()
+
+    def attach(self, model):
+        for layer in model.layers:
+            if isinstance(layer, Capsule):
+                layer.profiler = self
+
+    def detach(self, model):
+        for layer in model.layers:
+            if isinstance(layer, Capsule):
+                layer.profiler = None
+
+    def start(self):
+        return time.perf_counter()
+
+    def record(self, start, layer_name, name, flops, *tensors):
+        _sync(*tensors)
+        end = time.perf_counter()
+        self.events.append({'layer': layer_name, 'name': name,
+                            'start': start - self._origin, 'duration': end - start,
+                            'flops': int(flops), 'bytes': _nbytes(*tensors)})
+
+    # hooks called by `Capsule.call`
+
+    def transform(self, start, layer, inputs, hat_inputs):
+        batch_size, input_num_capsule, input_dim_capsule = inputs.shape
+        flops = 2 * batch_size * input_num_capsule * input_dim_capsule * (
+            layer.num_capsule * layer.dim_capsule)
+        self.record(start, layer.name, 'transform', flops, hat_inputs)
+
+    def iteration(self, start, layer, i, hat_inputs, c, o, b=None):
+        batch_size, num_capsule, input_num_capsule, dim_capsule = hat_inputs.shape
+        flops = iteration_flops(batch_size, num_capsule, input_num_capsule, dim_capsule,
+                                last=b is None)
+        self.record(start, layer.name, 'iteration %d' % (i + 1), flops, c, o, b)
+
+    def routing(self, start, layer, hat_inputs, o):
+        batch_size, input_num_capsule = hat_inputs.shape[:2]
+        self.record(start, layer.name, 'routing',
+                    routing_flops(layer, batch_size, input_num_capsule), o)
+
+    def chrome_trace(self, filepath):
+        """Write the events in the Chrome trace format (chrome://tracing,
+        https://ui.perfetto.dev)."""
+        trace = [{'name': '%s/%s' % (event['layer'], event['name']),
+                  'ph': 'X', 'pid': 0, 'tid': 0,
+                  'ts': event['start'] * 1e6, 'dur': event['duration'] * 1e6,
+                  'args': {'flops': event['flops'], 'bytes': event['bytes']}}
+                 for event in self.events]
+        with open(filepath, 'w') as f:
+            json.dump({'traceEvents': trace, 'displayTimeUnit': 'ms'}, f)
+
+    def table(self):
+        """Events of the same layer and name merged: (layer, name, calls,
+        mean ms, FLOPs, MB), in the order they first ran."""
+        rows = {}
+        for event in self.events:
+            key = (event['layer'], event['name'])
+            if key not in rows:
+                rows[key] = [0, 0., event['flops'], event['bytes']]
+            rows[key][0] += 1
+            rows[key][1] += event['duration']
+        return [(layer, name, calls, total * 1000 / calls, flops, nbytes / 2 ** 20)
+                for (layer, name), (calls, total, flops, nbytes) in rows.items()]
+
+    def summary(self):
+        lines = ['%-28s %-14s %6s %10s %10s %10s' % ('layer', 'stage', 'calls', 'mean ms',
+                                                      'MFLOPs', 'MB')]
+        for layer, name, calls, ms, flops, mb in self.table():
+            lines.append('%-28s %-14s %6d %10.3f %10.1f %10.2f' % (layer, name, calls, ms,
+                                                                    flops / 1e6, mb))
+        return '\n'.join(lines)
+
+
+def _graph_ms(function, x, repeats):
+    function(x)  # trace
+    start = time.perf_counter()
+    for _ in range(repeats):
+        y = function(x)
+    _sync(y)
+    return (time.perf_counter() - start) * 1000 / repeats
+
+
+def profile_model(model, x_batch, repeats=5, profiler=None):
+    """Profile a backbone + capsule model on `x_batch`.
+
+    The backbone (everything before the first `Capsule`) and the capsule
+    head are run eagerly `repeats` times with the profiler attached, the
+    backbone is recorded as one event. Returns the profiler and a dict of
+    graph-mode (tf.function) ms per batch and FLOPs for 'backbone', every
+    capsule layer and 'model'.
+    """
+    profiler = profiler or RoutingProfiler()
+    capsules = [layer for layer in model.layers if isinstance(layer, Capsule)]
+    if not capsules:
+        raise ValueError('The model has no Capsule layer.')
+    x_batch = tf.convert_to_tensor(x_batch)
+    spec = tf.TensorSpec(x_batch.shape, x_batch.dtype)
+    backbone = models.Model(model.inputs, capsules[0].input)
+    head = models.Model(capsules[0].input, model.outputs)
+
+    backbone_flops = graph_flops(lambda x: backbone(x, training=False), spec)
+    head_flops = graph_flops(lambda x: head(x, training=False),
+                             tf.TensorSpec((x_batch.shape[0],) + tuple(capsules[0].input_shape[1:])))
+
+    features = backbone(x_batch, training=False)
+    head(features, training=False)  # warm up the eager kernels
+    profiler.attach(model)
+    try:
+        for _ in range(repeats):
+            start = profiler.start()
+            features = backbone(x_batch, training=False)
+            profiler.record(start, 'backbone', 'forward', backbone_flops, features)
+            start = profiler.start()
+            scores = head(features, training=False)
+            profiler.record(start, 'capsule head', 'forward', head_flops, scores)
+    finally:
+        profiler.detach(model)
+
+    graph = {'backbone': (_graph_ms(tf.function(lambda x: backbone(x, training=False)),
+                                    x_batch, repeats), backbone_flops)}
+    inputs = models.Model(model.inputs, [layer.input for layer in capsules])(x_batch, training=False)
+    if len(capsules) == 1:
+        inputs = [inputs]
+    for layer, layer_input in zip(capsules, inputs):
+        layer_spec = tf.TensorSpec(layer_input.shape, layer_input.dtype)
+        graph[layer.name] = (_graph_ms(tf.function(lambda x, layer=layer: layer(x)), layer_input,
+                                       repeats),
+                             graph_flops(lambda x, layer=layer: layer(x), layer_spec))
+    graph['model'] = (_graph_ms(tf.function(lambda x: model(x, training=False)), x_batch, repeats),
+                      graph_flops(lambda x: model(x, training=False), spec))
+    return profiler, graph
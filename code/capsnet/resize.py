@@ -0,0 +1,68 @@
+# -*- coding: utf-8 -*-
+"""Resize backends of the loaders.
+
+`flow_from_directory(interpolation='bicubic')` resizes one image at a time
+with PIL, the most expensive CPU step of the pipelines at 200x200.
+`load_images` decodes with PIL as before but resizes every run of images
+of the same source size as one batch with `tf.image.resize`:
+
+    'pil-bicubic'  PIL, one image at a time: the pixels of flow_from_directory
+    'bicubic'      Keys cubic, antialiased when downscaling
+    'bilinear'     triangle filter, antialiased when downscaling
+    'area'         average of the covered source pixels
+
+The batched modes differ from PIL by a few grey levels;
+`benchmark/benchmark_resize.py` measures what that costs in accuracy.
+"""
+import numpy as np
+import tensorflow as tf
+from PIL import Image
+from tensorflow.keras.preprocessing.image import img_to_array, load_img
+
+RESIZE_METHODS = ('pil-bicubic', 'bicubic', 'bilinear', 'area')
+
+
+def resize_images(images, size, method='bicubic'):
+    """Resize an (n, height, width, 3) batch or a single image with one
+    `tf.image.resize` op; returns uint8."""
+    if method not in RESIZE_METHODS[1:]:
+        raise ValueError('Unknown batched resize method: %s' % method)
+    images = tf.image.resize(images, size, method=method, antialias=True)
+    return tf.cast(tf.clip_by_value(tf.round(images), 0, 255), tf.uint8)
+
+
+def resize_image(image, size, method='pil-bicubic'):
+    """Resize one decoded PIL image (`load_img(path)`) to `size`; returns a
+    uint8 array. 'pil-bicubic' is `load_img(path, target_size=size,
+    interpolation='bicubic')`."""
+    if method == 'pil-bicubic':
+        if image.size != (size[1], size[0]):
+            image = image.resize((size[1], size[0]), Image.BICUBIC)
+        return img_to_array(image, dtype=np.uint8)
+    return resize_images(img_to_array(image, dtype=np.uint8), size, method).numpy()
+
+
+def load_images(filepaths, image_size, method='pil-bicubic', batch_size=64):
+    """Yield the images of `filepaths` resized to `image_size`, in order,
+    as uint8 (n, height, width, 3) arrays of at most `batch_size` images."""
+    if method not in RESIZE_METHODS:
+        raise ValueError('Unknown resize method: %s' % method)
+
+    def finish(run):
+        if method == 'pil-bicubic':
+            return np.stack(run)
+        return resize_images(np.stack(run), image_size, method).numpy()
+
+    run = []
+    for path in filepaths:
+        if method == 'pil-bicubic':
+            image = load_img(path, target_size=image_size, interpolation='bicubic')
+        else:
+            image = load_img(path)
+        image = img_to_array(image, dtype=np.uint8)
+        if run and (len(run) == batch_size or image.shape != run[0].shape):
+            yield finish(run)
+            run = []
+        run.append(image)
+    if run:
+        yield finish(run)
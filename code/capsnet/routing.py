@@ -0,0 +1,195 @@
+# -*- coding: utf-8 -*-
+"""Dynamic routing kernels shared by the `Capsule` layer.
+
+Unless noted otherwise `hat_inputs` has the layout (batch_size,
+num_capsule, input_num_capsule, dim_capsule), i.e. the layout produced
+by `Capsule.call` after the permute.
+"""
+import numpy as np
+import tensorflow as tf
+
+from .ops import squash, softmax
+
+
+def dynamic_routing(hat_inputs, routings, activation=squash, input_major=False):
+    """Routing-by-agreement with b = <u,v> (not b += <u,v>),
+    written with einsum so every iteration is two contractions.
+
+    The first iteration starts from b = 0, so its coupling coefficients
+    are uniform and the weighted sum reduces to a mean over the input
+    capsules; the softmax is skipped there.
+
+    With `input_major=True`, `hat_inputs` is taken as it comes out of the
+    capsule transform, (batch_size, input_num_capsule, num_capsule,
+    dim_capsule), and the permute happens here. Inside the XLA cluster of
+    `fused_dynamic_routing` it is folded into the contractions, so no
+    transposed copy of `hat_inputs` is materialized.
+    """
+    if input_major:
+        hat_inputs = tf.transpose(hat_inputs, (0, 2, 1, 3))
+    num_capsule = tf.cast(tf.shape(hat_inputs)[1], hat_inputs.dtype)
+    o = activation(tf.reduce_sum(hat_inputs, 2) / num_capsule)
+    for _ in range(routings - 1):
+        b = tf.einsum('bnd,bnid->bni', o, hat_inputs)
+        c = softmax(b, 1)
+        o = activation(tf.einsum('bni,bnid->bnd', c, hat_inputs))
+    return o
+
+
+def additive_routing(hat_inputs, routings, activation=squash, input_major=False):
+    """Standard routing from Hinton's paper, b = b + <u,v>."""
+    if input_major:
+        hat_inputs = tf.transpose(hat_inputs, (0, 2, 1, 3))
+    num_capsule = tf.cast(tf.shape(hat_inputs)[1], hat_inputs.dtype)
+    o = activation(tf.reduce_sum(hat_inputs, 2) / num_capsule)
+    b = tf.zeros_like(hat_inputs[:, :, :, 0])
+    for _ in range(routings - 1):
+        b += tf.einsum('bnd,bnid->bni', o, hat_inputs)
+        c = softmax(b, 1)
+        o = activation(tf.einsum('bni,bnid->bnd', c, hat_inputs))
+    return o
+
+
+def attention_routing(hat_inputs, routings=1, activation=squash, input_major=False):
+    """Non-iterative self-attention routing (Efficient-CapsNet,
+    https://arxiv.org/abs/2101.12491), `routings` is ignored.
+
+    The agreement of a prediction with all predictions for the same output
+    capsule, sum_k <u_i, u_k> / sqrt(dim_capsule), is computed as
+    <u_i, sum_k u_k> so the cost stays linear in input_num_capsule.
+    """
+    if input_major:
+        hat_inputs = tf.transpose(hat_inputs, (0, 2, 1, 3))
+    dim_capsule = tf.cast(tf.shape(hat_inputs)[-1], hat_inputs.dtype)
+    b = tf.einsum('bnd,bnid->bni', tf.reduce_sum(hat_inputs, 2), hat_inputs)
+    c = softmax(b / tf.sqrt(dim_capsule), 1)
+    return activation(tf.einsum('bni,bnid->bnd', c, hat_inputs))
+
+
+def topk_dynamic_routing(hat_inputs, routings, top_k, activation=squash, input_major=False):
+    """Dynamic routing where every input capsule only couples to its
+    `top_k` strongest parents.
+
+    The parents are picked once, from the agreement after the first
+    (uniform) iteration; from then on only the selected (input, parent)
+    pairs are gathered, and the weighted sums are scattered back with
+    `unsorted_segment_sum`, so both contractions cost top_k / num_capsule
+    of the dense ones. The coupling coefficients are the softmax over the
+    selected parents; with top_k >= num_capsule this is `dynamic_routing`.
+    """
+    if not input_major:
+        hat_inputs = tf.transpose(hat_inputs, (0, 2, 1, 3))
+    # (batch_size, input_num_capsule, num_capsule, dim_capsule) from here on
+    batch_size = tf.shape(hat_inputs)[0]
+    num_capsule, dim_capsule = tf.keras.backend.int_shape(hat_inputs)[2:]
+    top_k = min(top_k, num_capsule)
+    o = activation(tf.reduce_sum(hat_inputs, 1) / num_capsule)
+    if routings == 1:
+        return o
+
+    # the one dense agreement; broadcast-multiply + reduce avoids the
+    # transposed copy einsum makes of the input-major `hat_inputs`
+    b = tf.reduce_sum(o[:, None] * hat_inputs, -1)
+    if top_k == 1:
+        parents = tf.argmax(b, -1, output_type=tf.int32)[..., None]
+        b = tf.gather(b, parents, batch_dims=2)
+    else:
+        b, parents = tf.math.top_k(b, top_k)
+    hat_inputs = tf.gather(hat_inputs, parents, axis=2, batch_dims=2)
+    segment_ids = parents + num_capsule * tf.range(batch_size)[:, None, None]
+    for i in range(routings - 1):
+        c = softmax(b, -1)
+        s = tf.math.unsorted_segment_sum(c[..., None] * hat_inputs, segment_ids,
+                                         batch_size * num_capsule)
+        o = activation(tf.reshape(s, (batch_size, num_capsule, dim_capsule)))
+        if i < routings - 2:
+            b = tf.reduce_sum(tf.gather(o, parents, batch_dims=1) * hat_inputs, -1)
+    return o
+
+
+def static_routing(hat_inputs, coupling_logits, activation=squash, input_major=False):
+    """Routing-free single pass with learned coupling coefficients.
+
+    coupling_logits: (num_capsule, input_num_capsule), softmaxed over the
+    output capsules like `b` in dynamic routing, so zeros give the first
+    dynamic iteration and the log of mean coupling coefficients of a
+    trained model reproduces them. Not in `ROUTING_ENGINES` since the
+    logits are weights of the layer.
+    """
+    c = tf.cast(softmax(coupling_logits, 0), hat_inputs.dtype)
+    if input_major:
+        return activation(tf.einsum('ni,bind->bnd', c, hat_inputs))
+    return activation(tf.einsum('ni,bnid->bnd', c, hat_inputs))
+
+
+ROUTING_ENGINES = {
+    'dynamic': dynamic_routing,
+    'additive': additive_routing,
+    'attention': attention_routing,
+}
+
+# `routings`, `activation` and `input_major` are Python values, so each
+# combination is traced once and the unrolled loop is compiled by XLA into
+# one cluster.
+fused_dynamic_routing = tf.function(dynamic_routing, jit_compile=True)
+FUSED_ROUTING_ENGINES = {
+    name: tf.function(engine, jit_compile=True) for name, engine in ROUTING_ENGINES.items()
+}
+FUSED_ROUTING_ENGINES['dynamic'] = fused_dynamic_routing
+fused_topk_dynamic_routing = tf.function(topk_dynamic_routing, jit_compile=True)
+
+
+def squash_numpy(x, axis=-1):
+    s_squared_norm = np.sum(np.square(x), axis, keepdims=True) + 1e-7
+    scale = np.sqrt(s_squared_norm) / (0.5 + s_squared_norm)
+    return scale * x
+
+
+def softmax_numpy(x, axis=-1):
+    ex = np.exp(x - np.max(x, axis=axis, keepdims=True))
+    return ex / np.sum(ex, axis=axis, keepdims=True)
+
+
+def dynamic_routing_numpy(hat_inputs, routings):
+    """Pure NumPy reference of the loop in `Capsule.call`, used to check
+    the TensorFlow kernels. Computes in float64.
+    """
+    hat_inputs = np.asarray(hat_inputs, dtype=np.float64)
+    b = np.zeros(hat_inputs.shape[:3])
+    for i in range(routings):
+        c = softmax_numpy(b, 1)
+        o = squash_numpy(np.einsum('bni,bnid->bnd', c, hat_inputs))
+        if i < routings - 1:
+            b = np.einsum('bnd,bnid->bni', o, hat_inputs)
+    return o
+
+
+def adaptive_dynamic_routing(hat_inputs, routings, tol, activation=squash):
+    """Same routing as `dynamic_routing`, but stops as soon as the
+    coupling coefficients c = softmax(b, 1) move by less than `tol`
+    (max absolute change over the whole batch) between two iterations.
+
+    # Returns
+        (outputs, iterations): `iterations` is the number of weighted sums
+        actually computed, between 1 and `routings`.
+    """
+    num_capsule = tf.cast(tf.shape(hat_inputs)[1], hat_inputs.dtype)
+    c = tf.ones_like(hat_inputs[:, :, :, 0]) / num_capsule
+    o = activation(tf.reduce_sum(hat_inputs, 2) / num_capsule)
+
+    def cond(i, o, c, converged):
+        return tf.logical_and(i < routings, tf.logical_not(converged))
+
+    def body(i, o, c, converged):
+        b = tf.einsum('bnd,bnid->bni', o, hat_inputs)
+        c_next = softmax(b, 1)
+        converged = tf.reduce_max(tf.abs(c_next - c)) < tol
+        o = tf.cond(converged,
+                    lambda: o,
+                    lambda: activation(tf.einsum('bni,bnid->bnd', c_next, hat_inputs)))
+        i = i + tf.cast(tf.logical_not(converged), tf.int32)
+        return i, o, c_next, converged
+
+    iterations, o, _, _ = tf.while_loop(
+        cond, body, (tf.constant(1), o, c, tf.constant(False)))
+    return o, iterations
@@ -0,0 +1,102 @@
+# -*- coding: utf-8 -*-
+"""Class-stratified batches for imbalanced defect / no-defect splits.
+
+`flow_from_directory(shuffle=True)` draws batches uniformly, so a rare
+defect class shows up in few batches. `StratifiedSampler` gives every
+batch a fixed share of each class. It only deals out indices: a class
+smaller than its share is oversampled by going through it again in a new
+order, never by copying images. `StoreIterator(class_ratio=...)` and
+`dataset_from_directory(class_ratio=...)` take it.
+"""
+import numpy as np
+
+
+def random_state(rng):
+    """The state of a `np.random.RandomState`, as JSON-serializable lists."""
+    name, keys, position, has_gauss, cached_gaussian = rng.get_state()
+    return [name, keys.tolist(), int(position), int(has_gauss), float(cached_gaussian)]
+
+
+def set_random_state(rng, state):
+    name, keys, position, has_gauss, cached_gaussian = state
+    rng.set_state((name, np.array(keys, dtype=np.uint32), position, has_gauss, cached_gaussian))
+
+
+def class_weights(class_ratio, class_indices, classes):
+    """Per class index weights of `class_ratio`: 'balanced' (equal shares),
+    None (the class frequencies of `classes`) or {class name: weight}."""
+    num_classes = len(class_indices)
+    if class_ratio is None:
+        weights = np.bincount(classes, minlength=num_classes).astype(float)
+    elif class_ratio == 'balanced':
+        weights = np.ones(num_classes)
+    else:
+        unknown = set(class_ratio) - set(class_indices)
+        if unknown:
+            raise ValueError('Unknown classes in class_ratio: %s' % sorted(unknown))
+        weights = np.zeros(num_classes)
+        for name, weight in class_ratio.items():
+            weights[class_indices[name]] = weight
+    return weights / weights.sum()
+
+
+class StratifiedSampler(object):
+    """Batches of indices into `classes` with a fixed class mix.
+
+    # Arguments
+        classes: class index of every sample.
+        ratio: share of every class index in a batch; batch_size * share
+            is rounded down and the remaining places are drawn with these
+            probabilities.
+        steps: batches per epoch, by default as many as uniform shuffling
+            (`len(classes) // batch_size`, at least 1).
+    """
+    def __init__(self, classes, batch_size, ratio, seed=None, steps=None):
+        self.classes = np.asarray(classes)
+        self.batch_size = batch_size
+        self.ratio = np.asarray(ratio, dtype=float)
+        self.steps = steps or max(1, len(self.classes) // batch_size)
+        self._rng = np.random.RandomState(seed)
+        self._members = [np.flatnonzero(self.classes == c) for c in range(len(self.ratio))]
+        for c, members in enumerate(self._members):
+            if self.ratio[c] > 0 and not len(members):
+                raise ValueError('Class %d has a share but no samples.' % c)
+        self._queues = [np.empty(0, dtype=int) for _ in self._members]
+
+    def _take(self, c, n):
+        # the next n members of class c, reshuffling each pass through it
+        while len(self._queues[c]) < n:
+            self._queues[c] = np.concatenate([self._queues[c], self._rng.permutation(self._members[c])])
+        taken, self._queues[c] = self._queues[c][:n], self._queues[c][n:]
+        return taken
+
+    def get_state(self):
+        """Generator and per-class queues, JSON-serializable."""
+        return {'rng': random_state(self._rng), 'queues': [queue.tolist() for queue in self._queues]}
+
+    def set_state(self, state):
+        set_random_state(self._rng, state['rng'])
+        self._queues = [np.array(queue, dtype=int) for queue in state['queues']]
+
+    def class_counts(self):
+        """Samples of every class in the next batch."""
+        counts = np.floor(self.ratio * self.batch_size).astype(int)
+        remainder = self.batch_size - counts.sum()
+        if remainder:
+            counts += np.bincount(self._rng.choice(len(self.ratio), remainder, p=self.ratio),
+                                  minlength=len(self.ratio))
+        return counts
+
+    def epoch_classes(self):
+        """Class index of every place of one epoch's batches, for pipelines
+        that draw the samples of each class themselves."""
+        return np.concatenate([self._rng.permutation(np.repeat(np.arange(len(self.ratio)), counts))
+                               for counts in (self.class_counts() for _ in range(self.steps))])
+
+    def epoch(self):
+        """(steps, batch_size) sample indices of one epoch."""
+        batches = np.empty((self.steps, self.batch_size), dtype=int)
+        for step in range(self.steps):
+            batch = np.concatenate([self._take(c, n) for c, n in enumerate(self.class_counts())])
+            batches[step] = self._rng.permutation(batch)
+        return batches
@@ -0,0 +1,139 @@
+# -*- coding: utf-8 -*-
+"""Loading `weights-capsnet-*.h5` checkpoints.
+
+Checkpoints written by the scripts store the capsule layers under their bare
+class name (`Capsule`, `Length`) and the loss as `margin_loss`, while the
+layers of this package are registered as `capsnet>Capsule` and so on.
+`load_capsnet` maps the old names onto the package, so a checkpoint loads in
+one call instead of rebuilding the graph and calling `load_weights`.
+`replace_lambda_head` swaps their `Lambda` output for `Length`, which, unlike
+a Python lambda, survives SavedModel export and graph freezing.
+`with_preprocessing` puts the input preprocessing of a checkpoint in front
+of it, so it can be fed raw uint8 images.
+"""
+import h5py
+import numpy as np
+from tensorflow.keras import backend, layers, models
+
+from .layers import Capsule, Length, Preprocessing
+from .optimizers import Lion
+from .ops import squash, standard_squash, softmax, margin_loss, caps_batch_dot
+
+# the `custom_objects` every script passed to `load_model`
+LEGACY_CUSTOM_OBJECTS = {
+    'Capsule': Capsule,
+    'Length': Length,
+    'squash': squash,
+    'standard_squash': standard_squash,
+    'softmax': softmax,
+    'margin_loss': margin_loss,
+    'caps_batch_dot': caps_batch_dot,
+    # optimizer of the `*-reduce_lr-r6*` checkpoints
+    'Lion': Lion,
+    # global of the marshalled `Lambda(lambda z: K.sqrt(...))` output head
+    'K': backend,
+}
+
+
+def _capsule_with_overrides(overrides):
+    """`Capsule` whose `from_config` replaces arguments the old configs did
+    not save or saved ambiguously: the additive routing of
+    `train_capsnet_origin2v1-*` is not in their config, and their squash
+    variant is saved under the same name 'squash'."""
+
+    class LegacyCapsule(Capsule):
+
+        @classmethod
+        def from_config(cls, config):
+            config.update(overrides)
+            return Capsule.from_config(config)
+
+    return LegacyCapsule
+
+
+def load_capsnet(filepath, build_fn=None, compile=False, custom_objects=None,
+                 **capsule_overrides):
+    """Load a full model saved by one of the training scripts or by
+    `model.save` on a model of this package.
+
+    # Arguments
+        filepath: `.h5` checkpoint.
+        build_fn: optional callable returning the model the checkpoint was
+            trained as, e.g. `lambda: build_capsnet('densenet121')`. Needed
+            for the checkpoints written with `save_weights_only=True`, and
+            used when the saved graph cannot be deserialized, which happens
+            for the `Lambda` output layer when the checkpoint was written by
+            another Python version; the weights are then loaded into
+            `build_fn()`.
+        compile: restore the loss and optimizer as well.
+        custom_objects: extra objects, e.g. a custom optimizer.
+        capsule_overrides: `Capsule` arguments replacing the saved ones, e.g. `routing='additive', activation='standard_squash'`
+            for the `origin2v1` checkpoints.
+    """
+    with h5py.File(filepath, 'r') as f:
+        weights_only = 'model_config' not in f.attrs
+    if weights_only and build_fn is None:
+        raise ValueError('%s holds weights only, build_fn is required' % filepath)
+
+    objects = dict(LEGACY_CUSTOM_OBJECTS)
+    if capsule_overrides:
+        objects['Capsule'] = _capsule_with_overrides(capsule_overrides)
+    objects.update(custom_objects or {})
+    if not weights_only:
+        try:
+            return models.load_model(filepath, custom_objects=objects, compile=compile)
+        except (ValueError, TypeError, SystemError):
+            if build_fn is None:
+                raise
+    model = build_fn()
+    model.load_weights(filepath)
+    return model
+
+
+def _is_length_lambda(layer):
+    """True for the `Lambda(lambda z: K.sqrt(K.sum(K.square(z), 2)))` head,
+    checked on a random probe since the lambda itself cannot be compared."""
+    if not isinstance(layer, layers.Lambda) or len(layer.input_shape) != 3:
+        return False
+    _, num_capsule, dim_capsule = layer.input_shape
+    if num_capsule is None or dim_capsule is None:
+        return False
+    probe = np.random.RandomState(0).randn(2, num_capsule, dim_capsule).astype(np.float32)
+    try:
+        output = np.asarray(layer(probe))
+    except Exception:
+        return False
+    expected = np.sqrt(np.sum(np.square(probe), 2))
+    return output.shape == expected.shape and np.allclose(output, expected, rtol=1e-6)
+
+
+def replace_lambda_head(model):
+    """Copy of `model` with every vector-length `Lambda` replaced by
+    `Length(epsilon=0.)` of the same name, and the same weights.
+
+    Returns the new model and the number of replaced layers.
+    """
+    replaced = []
+
+    def clone_layer(layer):
+        if _is_length_lambda(layer):
+            replaced.append(layer.name)
+            return Length(epsilon=0., name=layer.name)
+        return layer.__class__.from_config(layer.get_config())
+
+    clone = models.clone_model(model, clone_function=clone_layer)
+    clone.set_weights(model.get_weights())
+    return clone, len(replaced)
+
+
+def with_preprocessing(model, mode, rescale=1./255):
+    """`model`, which takes preprocessed float images, behind a
+    `Preprocessing(mode, rescale)` layer, so it takes raw uint8 images.
+
+    The mode is the one the checkpoint was trained with, not necessarily
+    that of its backbone: the `*-da` ResNet50 / VGG19 scripts import
+    DenseNet's `preprocess_input` last and so trained with 'torch'.
+    """
+    input_image = layers.Input(shape=model.input_shape[1:], dtype='uint8')
+    output = model(Preprocessing(mode, rescale)(input_image))
+    return models.Model(inputs=input_image, outputs=output)
@@ -0,0 +1,199 @@
+# -*- coding: utf-8 -*-
+"""Sharded TFRecord copies of the PCB image directories for many readers.
+
+`export_shards` decodes and resizes a directory like `build_store` and
+writes fixed-size TFRecord shards
+
+    <prefix>-00000-of-00012.tfrecord ...  records of (uint8 image, label, filename)
+    <prefix>.json                         image size, class_indices, seed and
+                                          order of the rows and, per shard,
+                                          records, labels and SHA-256
+
+The records are not in the class-sorted `flow_from_directory` order: the
+images of every class are shuffled with `seed` and spread evenly over the
+rows, so every shard, and every worker, gets about the class proportions
+of the dataset. Every record carries the CRC32C of the TFRecord format,
+checked on read; `verify_shards` checks the SHA-256 of whole shards.
+`shard_dataset` streams the shards of one worker, interleaved in
+parallel: worker i of n reads shards i, i + n, ..., so the split depends
+only on the manifest.
+"""
+import hashlib
+import json
+import os
+
+import numpy as np
+import tensorflow as tf
+
+from .index import list_directory
+from .resize import load_images
+
+
+def _sha256(path, chunk_size=2**20):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def interleaved_order(classes, seed=0):
+    """Indices of `classes` with the members of every class shuffled and
+    spread evenly: any run of rows has about the class proportions of the
+    whole."""
+    rng = np.random.RandomState(seed)
+    indices, positions = [], []
+    for c in np.unique(classes):
+        members = rng.permutation(np.flatnonzero(classes == c))
+        indices.append(members)
+        # the k-th of n members sits at (k + offset) / n, offset random in [0, 1)
+        positions.append((np.arange(len(members)) + rng.uniform()) / len(members))
+    if not indices:
+        return np.zeros(0, dtype='int64')
+    indices, positions = np.concatenate(indices), np.concatenate(positions)
+    return indices[np.argsort(positions, kind='stable')]
+
+
+def export_shards(directory, image_size, prefix, shard_size=1024, index=None,
+                  resize='pil-bicubic', seed=0):
+    """Write the images of `directory` (one subdirectory per class),
+    resized like `build_store(..., resize=resize)`, to shards of
+    `shard_size` records in the `interleaved_order(classes, seed)` of the
+    `flow_from_directory(shuffle=False)` rows. Returns the manifest."""
+    filepaths, filenames, classes, class_indices = list_directory(directory, index)
+    if os.path.dirname(prefix):
+        os.makedirs(os.path.dirname(prefix), exist_ok=True)
+    order = interleaved_order(classes, seed)
+    num_shards = max(1, -(-len(filepaths) // shard_size))
+    shards = []
+    for shard in range(num_shards):
+        path = '%s-%05d-of-%05d.tfrecord' % (prefix, shard, num_shards)
+        rows = order[shard * shard_size:(shard + 1) * shard_size]
+        images = (image for batch in load_images([filepaths[i] for i in rows], image_size, resize)
+                  for image in batch)
+        with tf.io.TFRecordWriter(path) as writer:
+            for i, image in zip(rows, images):
+                feature = {
+                    'image': tf.train.Feature(bytes_list=tf.train.BytesList(value=[image.tobytes()])),
+                    'label': tf.train.Feature(int64_list=tf.train.Int64List(value=[classes[i]])),
+                    'filename': tf.train.Feature(bytes_list=tf.train.BytesList(
+                        value=[filenames[i].encode('utf-8')])),
+                }
+                writer.write(tf.train.Example(features=tf.train.Features(feature=feature))
+                             .SerializeToString())
+        shards.append({'file': os.path.basename(path),
+                       'records': len(rows),
+                       'classes': [int(classes[i]) for i in rows],
+                       'filenames': [filenames[i] for i in rows],
+                       'sha256': _sha256(path)})
+    manifest = {'directory': os.path.abspath(directory),
+                'image_size': list(image_size),
+                'resize': resize,
+                'class_indices': class_indices,
+                'samples': len(filepaths),
+                'seed': seed,
+                'order': order.tolist(),
+                'shards': shards}
+    with open(prefix + '.json', 'w') as f:
+        json.dump(manifest, f)
+    return manifest
+
+
+def load_manifest(prefix):
+    with open(prefix + '.json') as f:
+        return json.load(f)
+
+
+def worker_shards(manifest, worker_index=0, num_workers=1):
+    """The shards read by worker `worker_index` of `num_workers`."""
+    if not 0 <= worker_index < num_workers:
+        raise ValueError('worker_index must be in [0, %d).' % num_workers)
+    if len(manifest['shards']) < num_workers:
+        raise ValueError('%d shards cannot be split across %d workers; export with a smaller '
+                         'shard_size.' % (len(manifest['shards']), num_workers))
+    return manifest['shards'][worker_index::num_workers]
+
+
+def verify_shards(prefix, shards=None):
+    """Raise a ValueError for every shard whose SHA-256 does not match."""
+    manifest = load_manifest(prefix)
+    root = os.path.dirname(prefix)
+    for shard in shards or manifest['shards']:
+        if _sha256(os.path.join(root, shard['file'])) != shard['sha256']:
+            raise ValueError('Checksum mismatch: %s' % shard['file'])
+
+
+def shard_dataset(prefix,
+                  batch_size,
+                  worker_index=0,
+                  num_workers=1,
+                  shuffle=False,
+                  preprocessing_function=None,
+                  seed=None,
+                  dtype='float32',
+                  verify=False,
+                  cycle_length=8,
+                  return_filenames=False):
+    """`tf.data.Dataset` of (x, one-hot y) batches from the shards of one
+    worker, like `capsnet.data.dataset_from_directory`: `classes`,
+    `class_indices`, `filenames`, `samples` and `num_classes` are set on
+    it and `len()` is the number of batches.
+
+    # Arguments
+        shuffle: shuffle the shard order and the records (with a buffer of
+            one shard) each epoch, reading `cycle_length` shards at a
+            time; without it the shards are read in order, the order of
+            `classes` and `filenames`.
+        dtype: 'uint8' skips `preprocessing_function` and the 1/255 rescale.
+        verify: check the SHA-256 of the worker's shards first.
+        return_filenames: batches are (x, y, filenames), to audit what a
+            worker read; not for `model.fit`.
+    """
+    manifest = load_manifest(prefix)
+    shards = worker_shards(manifest, worker_index, num_workers)
+    if verify:
+        verify_shards(prefix, shards)
+    height, width = manifest['image_size']
+    num_classes = len(manifest['class_indices'])
+    records = max(shard['records'] for shard in shards)
+    AUTOTUNE = tf.data.experimental.AUTOTUNE
+    features = {'image': tf.io.FixedLenFeature([], tf.string),
+                'label': tf.io.FixedLenFeature([], tf.int64),
+                'filename': tf.io.FixedLenFeature([], tf.string)}
+
+    def parse(serialized):
+        example = tf.io.parse_example(serialized, features)
+        images = tf.reshape(tf.io.decode_raw(example['image'], tf.uint8), [-1, height, width, 3])
+        labels = tf.one_hot(example['label'], num_classes)
+        if dtype != 'uint8':
+            images = tf.cast(images, tf.float32)
+            if preprocessing_function is not None:
+                images = preprocessing_function(images)
+            images = images * (1. / 255)
+        if return_filenames:
+            return images, labels, example['filename']
+        return images, labels
+
+    files = [os.path.join(os.path.dirname(prefix), shard['file']) for shard in shards]
+    dataset = tf.data.Dataset.from_tensor_slices(files)
+    if shuffle:
+        dataset = dataset.shuffle(len(files), seed=seed, reshuffle_each_iteration=True)
+        dataset = dataset.interleave(tf.data.TFRecordDataset, cycle_length=cycle_length,
+                                     num_parallel_calls=AUTOTUNE, deterministic=True)
+        dataset = dataset.shuffle(records, seed=seed, reshuffle_each_iteration=True)
+    else:
+        dataset = dataset.interleave(tf.data.TFRecordDataset, cycle_length=1,
+                                     num_parallel_calls=AUTOTUNE, deterministic=True)
+    samples = sum(shard['records'] for shard in shards)
+    dataset = dataset.batch(batch_size).apply(
+        tf.data.experimental.assert_cardinality(-(-samples // batch_size)))
+    dataset = dataset.map(parse, num_parallel_calls=AUTOTUNE).prefetch(AUTOTUNE)
+
+    dataset.classes = np.array([label for shard in shards for label in shard['classes']],
+                               dtype='int32')
+    dataset.filenames = [filename for shard in shards for filename in shard['filenames']]
+    dataset.class_indices = manifest['class_indices']
+    dataset.samples = samples
+    dataset.num_classes = num_classes
+    dataset.batch_size = batch_size
+    return dataset
@@ -0,0 +1,354 @@
+# -*- coding: utf-8 -*-
+"""Decoded and resized copies of the PCB image directories.
+
+`flow_from_directory` decodes and bicubic-resizes every image again in
+every epoch. `build_store` does it once per resolution and writes
+
+    <filepath>.npy   uint8 (samples, height, width, 3), memory-mappable
+    <filepath>.json  filenames, classes and class_indices
+
+with the file order and labels of `flow_from_directory(..., shuffle=False)`.
+`StoreIterator` serves batches from it like a `DirectoryIterator`.
+
+`build_augmentation_bank` pays the `*-da*` augmentation once as well: it
+writes `variants` augmented copies of a store as a uint8
+(variants, samples, height, width, 3) array, one contiguous chunk per
+variant. A `StoreIterator` on a bank serves every image in a different
+variant each epoch, rotating through all of them.
+
+`build_pyramid` decodes every source image once for all resolutions, the
+32/64/128/200 of the experiments, into one store keyed by content hash
+
+    <root>/pyramid.json               build, sizes, resize, the level of every
+                                      size and the hash of every row
+    <root>/pyramid-<build>-200x200.npy
+                                      uint8 (images, 200, 200, 3), one per size
+    <root>/train-200x200.json ...     the usual index of a split at a size,
+                                      with the `images` it reads and their `rows`
+
+so `StoreIterator(store_path(root, split, image_size))` reads any size of
+any split. Identical files share a row, and a rebuild decodes only the
+files whose hash is new. A rebuild writes new levels next to the old ones,
+then replaces the indexes of the splits and `pyramid.json` last: a crash
+at any point leaves every index with the levels it was written for, and
+the next build reads the levels `pyramid.json` names. Levels no index
+reads any more are deleted.
+"""
+import glob
+import json
+import os
+
+import numpy as np
+from tensorflow.keras.preprocessing.image import load_img
+from tensorflow.keras.utils import Sequence
+
+from .augmentation import BatchAugmentation
+from .index import file_hash, index_directory, list_directory
+from .resize import load_images, resize_image
+from .sampling import StratifiedSampler, class_weights, random_state, set_random_state
+
+PYRAMID_FILENAME = 'pyramid.json'
+
+
+def store_path(root, split, image_size):
+    """e.g. `store_path('cache', 'train', (200, 200))` -> 'cache/train-200x200'."""
+    return os.path.join(root, '%s-%dx%d' % (split, image_size[0], image_size[1]))
+
+
+def build_store(directory, image_size, filepath, index=None, resize='pil-bicubic'):
+    """Decode and resize the images of `directory` (one subdirectory per
+    class) and write them to `filepath`.npy/.json. The default `resize`
+    gives exactly the images of `flow_from_directory(target_size=image_size,
+    interpolation='bicubic')`, a batched mode of `capsnet.resize` is faster.
+    The files come from `capsnet.index.list_directory(directory, index)`."""
+    filepaths, filenames, classes, class_indices = list_directory(directory, index)
+    if os.path.dirname(filepath):
+        os.makedirs(os.path.dirname(filepath), exist_ok=True)
+    images = np.lib.format.open_memmap(filepath + '.npy', mode='w+', dtype=np.uint8,
+                                       shape=(len(filepaths), image_size[0], image_size[1], 3))
+    start = 0
+    for batch in load_images(filepaths, image_size, resize):
+        images[start:start + len(batch)] = batch
+        start += len(batch)
+    images.flush()
+    del images
+    with open(filepath + '.json', 'w') as f:
+        json.dump({'directory': os.path.abspath(directory),
+                   'image_size': list(image_size),
+                   'resize': resize,
+                   'filenames': filenames,
+                   'classes': classes.tolist(),
+                   'class_indices': class_indices}, f)
+
+
+def _write_json(filepath, data):
+    # written next to the file and renamed, so a crash never leaves half of it
+    with open(filepath + '.tmp', 'w') as f:
+        json.dump(data, f)
+    os.replace(filepath + '.tmp', filepath)
+
+
+def build_pyramid(root, directories, sizes, resize='pil-bicubic', index=None):
+    """Write the images of `directories` ({split: directory}) at every size
+    of `sizes` (square) to the pyramid store at `root`, reusing the rows of
+    the images already there. Rows are keyed by the hashes of
+    `capsnet.index` (updated with `verify=True`), recomputed for every file
+    whose size or mtime changed.
+    Returns the number of images, decoded and reused."""
+    sizes = sorted(set(sizes))
+    pyramid = os.path.join(root, PYRAMID_FILENAME)
+    previous = {'sizes': sizes, 'resize': resize, 'hashes': []}
+    if os.path.exists(pyramid):
+        with open(pyramid) as f:
+            previous = json.load(f)
+    # rows in order of first appearance, so most splits are a block of rows
+    hashes, rows, splits, sources = [], {}, {}, {}
+    for split, directory in directories.items():
+        if index is not False:
+            # every file stat-ed: one overwritten in place gets a new hash
+            entries = index_directory(directory, index, verify=True).entries()
+        filepaths, filenames, classes, class_indices = list_directory(directory, index)
+        if index is False:
+            digests = [file_hash(path) for path in filepaths]
+        else:
+            digests = [entries[filename][3] or file_hash(path)
+                       for filename, path in zip(filenames, filepaths)]
+        for path, digest in zip(filepaths, digests):
+            if digest not in rows:
+                rows[digest] = len(hashes)
+                hashes.append(digest)
+                sources[digest] = path
+        splits[split] = {'directory': os.path.abspath(directory),
+                         'filenames': filenames,
+                         'classes': classes.tolist(),
+                         'class_indices': class_indices,
+                         'rows': [rows[digest] for digest in digests]}
+
+    reusable = previous['resize'] == resize and set(sizes) <= set(previous['sizes'])
+    known = {digest: row for row, digest in enumerate(previous['hashes'])} if reusable else {}
+    # the levels of pyramids written before there were builds have no build
+    previous_levels = previous.get('levels', {str(size): 'pyramid-%dx%d.npy' % (size, size)
+                                              for size in previous['sizes']})
+    os.makedirs(root, exist_ok=True)
+    # a build number no file has, not even those of a crashed build
+    build = previous.get('build', 0) + 1
+    while glob.glob(os.path.join(root, 'pyramid-%d-*' % build)):
+        build += 1
+    filenames = {str(size): 'pyramid-%d-%dx%d.npy' % (build, size, size) for size in sizes}
+    levels = {}
+    for size in sizes:
+        levels[size] = np.lib.format.open_memmap(
+            os.path.join(root, filenames[str(size)]), mode='w+', dtype=np.uint8,
+            shape=(len(hashes), size, size, 3))
+        if known:
+            old = np.load(os.path.join(root, previous_levels[str(size)]), mmap_mode='r')
+            for digest in hashes:
+                if digest in known:
+                    levels[size][rows[digest]] = old[known[digest]]
+            del old
+    decoded = 0
+    for digest in hashes:
+        if digest in known:
+            continue
+        image = load_img(sources[digest])
+        for size in sizes:
+            levels[size][rows[digest]] = resize_image(image, (size, size), resize)
+        decoded += 1
+    for size in sizes:
+        levels[size].flush()
+    # the memory maps are closed once no reference is left
+    levels.clear()
+
+    for split, entry in splits.items():
+        for size in sizes:
+            _write_json(store_path(root, split, (size, size)) + '.json',
+                        dict(entry, image_size=[size, size], resize=resize,
+                             images=filenames[str(size)]))
+    _write_json(pyramid, {'build': build, 'sizes': sizes, 'resize': resize,
+                          'levels': filenames, 'hashes': hashes})
+
+    # the levels of older builds that the index of no split reads
+    referenced = set(filenames.values())
+    for filepath in glob.glob(os.path.join(root, '*.json')):
+        if os.path.basename(filepath) != PYRAMID_FILENAME:
+            with open(filepath) as f:
+                referenced.add(json.load(f).get('images'))
+    for filepath in glob.glob(os.path.join(root, 'pyramid-*.npy')):
+        if os.path.basename(filepath) not in referenced:
+            os.remove(filepath)
+    return {'images': len(hashes), 'decoded': decoded, 'reused': len(hashes) - decoded}
+
+
+def open_store(filepath):
+    """(images, index) of the store at `filepath`, the images memory-mapped.
+    For a split of a pyramid, the images are its rows of the pyramid: a
+    view of the memory map when they are a block of it, else a copy."""
+    with open(filepath + '.json') as f:
+        index = json.load(f)
+    images = np.load(os.path.join(os.path.dirname(filepath), index['images'])
+                     if 'images' in index else filepath + '.npy', mmap_mode='r')
+    if 'rows' in index:
+        rows = np.array(index['rows'], dtype=np.int64)
+        if len(rows) and np.array_equal(rows, np.arange(rows[0], rows[0] + len(rows))):
+            images = images[rows[0]:rows[0] + len(rows)]
+        else:
+            images = images[rows]
+    return images, index
+
+
+def build_augmentation_bank(store, filepath, variants, seed=None, batch_size=64):
+    """Write `variants` copies of the store at `store`, each augmented with
+    `capsnet.augmentation.BatchAugmentation` (the `AUGMENTATION` settings),
+    to `filepath`.npy/.json."""
+    images, index = open_store(store)
+    augmentation = BatchAugmentation(seed)
+    bank = np.lib.format.open_memmap(filepath + '.npy', mode='w+', dtype=np.uint8,
+                                     shape=(variants,) + images.shape)
+    for variant in range(variants):
+        for start in range(0, len(images), batch_size):
+            x_batch = augmentation(images[start:start + batch_size].astype(np.float32)).numpy()
+            bank[variant, start:start + batch_size] = np.clip(np.round(x_batch), 0, 255)
+    bank.flush()
+    del bank
+    index.pop('images', None)
+    index.pop('rows', None)
+    index.update(variants=variants, seed=seed)
+    with open(filepath + '.json', 'w') as f:
+        json.dump(index, f)
+
+
+class StoreIterator(Sequence):
+    """Batches (x, one-hot y) from a store, a drop-in for the
+    `DirectoryIterator` of `flow_from_directory`: it has `classes`,
+    `class_indices`, `filenames`, `samples`, `num_classes` and
+    `on_epoch_end`.
+
+    On an augmentation bank, image i is served in variant
+    (offset_i + epoch) % variants, with a random offset per image.
+
+    `get_state` and `set_state` save and restore the epoch, the position
+    in it, the shuffle order and the generators as a JSON-serializable
+    dict, so a run that died resumes with the batches it would have seen.
+    Keras fixes the batches of an epoch when `fit` starts and shuffles
+    those of a `Sequence` unless `shuffle=False`, so resume with
+
+        train_set.set_state(state)
+        if train_set.position:  # the rest of the interrupted epoch
+            model.fit(train_set, epochs=train_set.epoch + 1,
+                      initial_epoch=train_set.epoch, shuffle=False)
+        model.fit(train_set, epochs=EPOCHS, initial_epoch=train_set.epoch, shuffle=False)
+
+    # Arguments
+        class_ratio: 'balanced' or {class name: weight} draws class-stratified
+            batches with `capsnet.sampling.StratifiedSampler` instead of
+            shuffling; an epoch keeps its number of batches.
+        augment: `AUGMENTATION` on the fly with `BatchAugmentation`, seeded
+            by (seed, epoch, batch index): a batch is the same whenever and
+            by whichever worker it is read.
+        preprocessing_function, rescale: applied like `ImageDataGenerator`
+            does, the function first; x is float32.
+        dtype: 'uint8' skips both and returns slices of the memory map
+            itself, without copying, when not shuffling.
+        seed: seeds the shuffling, the sampler and the augmentation; None
+            draws one, part of the state.
+    """
+    def __init__(self, filepath, batch_size, shuffle=False, preprocessing_function=None,
+                 rescale=1./255, dtype='float32', seed=None, class_ratio=None, augment=False):
+        self.images, index = open_store(filepath)
+        self.filenames = index['filenames']
+        self.classes = np.array(index['classes'], dtype=np.int32)
+        self.class_indices = index['class_indices']
+        self.samples = self.n = len(self.classes)
+        self.num_classes = len(self.class_indices)
+        self.image_shape = self.images.shape[-3:]
+        self.batch_size = batch_size
+        self.shuffle = shuffle
+        self.preprocessing_function = preprocessing_function
+        self.rescale = rescale
+        self.dtype = dtype
+        self.augment = augment
+        self._labels = np.eye(self.num_classes, dtype=np.float32)
+        self.seed = np.random.randint(2**31 - 1) if seed is None else seed
+        self._rng = np.random.RandomState(self.seed)
+        self.variants = self.images.shape[0] if self.images.ndim == 5 else None
+        if self.variants:
+            self._variant_offset = self._rng.randint(self.variants, size=self.samples)
+        self.sampler = None
+        if class_ratio is not None:
+            self.sampler = StratifiedSampler(
+                self.classes, batch_size, class_weights(class_ratio, self.class_indices, self.classes),
+                seed=self._rng.randint(2**31 - 1))
+        self.epoch = 0
+        # batches of the current epoch served before a restart
+        self.position = 0
+        self.index_array = self._new_order() if shuffle or self.sampler else np.arange(self.samples)
+
+    def __len__(self):
+        if self.sampler:
+            return self.sampler.steps - self.position
+        return (self.samples + self.batch_size - 1) // self.batch_size - self.position
+
+    def _new_order(self):
+        if self.sampler:
+            return self.sampler.epoch().reshape(-1)
+        return self._rng.permutation(self.samples)
+
+    def on_epoch_end(self):
+        self.epoch += 1
+        self.position = 0
+        if self.shuffle or self.sampler:
+            self.index_array = self._new_order()
+
+    def get_state(self, step=0):
+        """State after `step` more batches of the current epoch, e.g. the
+        batches a callback saw since `fit` started."""
+        state = {'seed': self.seed,
+                 'epoch': self.epoch,
+                 'position': self.position + step,
+                 'index_array': self.index_array.tolist(),
+                 'rng': random_state(self._rng)}
+        if self.sampler:
+            state['sampler'] = self.sampler.get_state()
+        if self.variants:
+            state['variant_offset'] = self._variant_offset.tolist()
+        return state
+
+    def set_state(self, state):
+        self.seed = state['seed']
+        self.epoch = state['epoch']
+        self.position = state['position']
+        self.index_array = np.array(state['index_array'], dtype=int)
+        set_random_state(self._rng, state['rng'])
+        if self.sampler:
+            self.sampler.set_state(state['sampler'])
+        if self.variants:
+            self._variant_offset = np.array(state['variant_offset'], dtype=int)
+
+    def __getitem__(self, idx):
+        idx += self.position
+        start = idx * self.batch_size
+        stop = min(start + self.batch_size, len(self.index_array))
+        if self.variants:
+            indices = self.index_array[start:stop]
+            x = self.images[(self._variant_offset[indices] + self.epoch) % self.variants, indices]
+        elif self.shuffle or self.sampler:
+            indices = self.index_array[start:stop]
+            x = self.images[indices]
+        else:
+            indices = slice(start, stop)
+            x = self.images[start:stop]
+        y = self._labels[self.classes[indices]]
+        if self.augment:
+            augmentation = BatchAugmentation(seed=[self.seed, self.epoch, idx])
+            x = augmentation(x.astype(np.float32)).numpy()
+            if self.dtype == 'uint8':
+                return np.clip(np.round(x), 0, 255).astype(np.uint8), y
+        if self.dtype == 'uint8':
+            return x, y
+
+        x = x.astype(self.dtype)
+        if self.preprocessing_function is not None:
+            x = np.stack([self.preprocessing_function(image) for image in x])
+        if self.rescale:
+            x *= self.rescale
+        return x, y
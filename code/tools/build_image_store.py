@@ -0,0 +1,38 @@
+# -*- coding: utf-8 -*-
+"""Decode and resize the `train`/`valid` directories of a dataset once per
+resolution into uint8 stores read by `capsnet.store.StoreIterator`.
+
+    python3 tools/build_image_store.py --dataset 200x200 --sizes 32 64 128 200 --output store
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from capsnet.resize import RESIZE_METHODS  # noqa: E402
+from capsnet.store import build_store, store_path  # noqa: E402
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--dataset', default='./')
+    parser.add_argument('--splits', nargs='+', default=['train', 'valid'])
+    parser.add_argument('--sizes', type=int, nargs='+', default=[32, 64, 128, 200])
+    parser.add_argument('--output', default='store')
+    parser.add_argument('--resize', default='pil-bicubic', choices=RESIZE_METHODS,
+                        help="'pil-bicubic' matches flow_from_directory, the others are batched")
+    args = parser.parse_args()
+
+    for split in args.splits:
+        for size in args.sizes:
+            filepath = store_path(args.output, split, (size, size))
+            start = time.perf_counter()
+            build_store(os.path.join(args.dataset, split), (size, size), filepath,
+                        resize=args.resize)
+            print('%s.npy: %.1f MB in %.1f s' % (filepath, os.path.getsize(filepath + '.npy') / 2**20,
+                                                 time.perf_counter() - start))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,43 @@
+# -*- coding: utf-8 -*-
+"""Decode the `train`/`valid` directories of a dataset once into a pyramid
+store with every resolution of the experiments, keyed by content hash; a
+split at a size is then `capsnet.store.StoreIterator(store_path(output,
+split, (size, size)))`. Run again after adding images: only new files are
+decoded.
+
+    python3 tools/build_pyramid.py --dataset 200x200 --sizes 32 64 128 200 --output pyramid
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from capsnet.resize import RESIZE_METHODS  # noqa: E402
+from capsnet.store import PYRAMID_FILENAME, build_pyramid  # noqa: E402
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--dataset', default='./')
+    parser.add_argument('--splits', nargs='+', default=['train', 'valid'])
+    parser.add_argument('--sizes', type=int, nargs='+', default=[32, 64, 128, 200])
+    parser.add_argument('--output', default='pyramid')
+    parser.add_argument('--resize', default='pil-bicubic', choices=RESIZE_METHODS,
+                        help="'pil-bicubic' matches flow_from_directory, the others are batched")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    stats = build_pyramid(args.output, {split: os.path.join(args.dataset, split)
+                                        for split in args.splits}, args.sizes, args.resize)
+    with open(os.path.join(args.output, PYRAMID_FILENAME)) as f:
+        levels = json.load(f)['levels']
+    size = sum(os.path.getsize(os.path.join(args.output, levels[str(s)])) for s in args.sizes)
+    print('%s: %d images, %d decoded, %d reused, %.1f MB in %.1f s' % (
+        args.output, stats['images'], stats['decoded'], stats['reused'], size / 2**20,
+        time.perf_counter() - start))
+
+
+if __name__ == '__main__':
+    main()
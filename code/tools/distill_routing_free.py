@@ -0,0 +1,127 @@
+# -*- coding: utf-8 -*-
+"""Distill a trained capsnet checkpoint into a routing-free student and
+report its speedup and accuracy gap on the `valid` directory.
+
+The student keeps the teacher's graph and weights; its `Capsule` layers use
+static coupling coefficients initialized from the teacher's (`static`) or
+a single uniform pass (`single-pass`), and are fine-tuned on the teacher's
+scores over the `train` directory.
+
+    python3 tools/distill_routing_free.py --teacher 200x200/weights-capsnet-XXX.h5 --dataset 200x200 \\
+        --mode static --epochs 5 --output 200x200/weights-capsnet-XXX-static.h5
+"""
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+import tensorflow as tf
+from sklearn.metrics import accuracy_score, f1_score
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from capsnet import Capsule, load_capsnet, replace_lambda_head  # noqa: E402
+from capsnet.data import flow_from_directory  # noqa: E402
+from capsnet.distillation import (STUDENT_MODES, distill, mean_coupling,  # noqa: E402
+                                  routing_free_student)
+from capsnet.metrics import specificity_score  # noqa: E402
+from capsnet.models import build_capsnet, preprocess_function  # noqa: E402
+
+
+def evaluate(model, valid_set):
+    """Scores on `valid_set` with ms/batch of the whole model and of the
+    capsule head (first `Capsule` to the output), both in graph mode."""
+    capsules = [layer for layer in model.layers if isinstance(layer, Capsule)]
+    head = tf.keras.models.Model(capsules[0].input, model.outputs)
+    backbone = tf.keras.models.Model(model.inputs, capsules[0].input)
+    model_fn = tf.function(lambda x: model(x, training=False))
+    head_fn = tf.function(lambda x: head(x, training=False))
+
+    scores, model_time, head_time = [], 0., 0.
+    for i in range(len(valid_set)):
+        x_batch = valid_set[i][0]
+        features = backbone(x_batch, training=False)
+        if i == 0:  # trace
+            model_fn(x_batch)
+            head_fn(features)
+        start = time.perf_counter()
+        scores.append(model_fn(x_batch).numpy())
+        model_time += time.perf_counter() - start
+        start = time.perf_counter()
+        head_fn(features).numpy()
+        head_time += time.perf_counter() - start
+    return (np.concatenate(scores), model_time * 1000 / len(valid_set),
+            head_time * 1000 / len(valid_set))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--teacher', required=True, help='checkpoint of the routing model')
+    parser.add_argument('--dataset', default='./')
+    parser.add_argument('--mode', default='static', choices=STUDENT_MODES)
+    parser.add_argument('--epochs', type=int, default=5)
+    parser.add_argument('--alpha', type=float, default=0.5,
+                        help='weight of the label loss against matching the teacher')
+    parser.add_argument('--learning-rate', type=float, default=1e-4)
+    parser.add_argument('--train-backbone', action='store_true')
+    parser.add_argument('--calibration-batches', type=int, default=20,
+                        help='train batches averaged for the initial static coupling')
+    parser.add_argument('--output', help='where to save the student')
+    # checkpoints written with save_weights_only=True are loaded into build_capsnet
+    parser.add_argument('--backbone', default='densenet121')
+    parser.add_argument('--routings', type=int, default=7)
+    parser.add_argument('--image-size', type=int, default=200)
+    parser.add_argument('--batch-size', type=int, default=40)
+    parser.add_argument('--no-da', action='store_true',
+                        help='checkpoint was trained with rescale=1./255 only')
+    args = parser.parse_args()
+
+    image_size = (args.image_size, args.image_size)
+    preprocessing_function = None if args.no_da else preprocess_function(args.backbone)
+    train_set = flow_from_directory(os.path.join(args.dataset, 'train'), image_size,
+                                    args.batch_size, shuffle=True,
+                                    preprocessing_function=preprocessing_function)
+    valid_set = flow_from_directory(os.path.join(args.dataset, 'valid'), image_size,
+                                    args.batch_size, preprocessing_function=preprocessing_function)
+    y_true = valid_set.classes
+
+    teacher = load_capsnet(args.teacher, build_fn=lambda: build_capsnet(
+        args.backbone, image_size, valid_set.num_classes, args.routings))
+    teacher, _ = replace_lambda_head(teacher)
+
+    coupling = None
+    if args.mode == 'static':
+        steps = min(args.calibration_batches, len(train_set))
+        coupling = mean_coupling(teacher, (train_set[i][0] for i in range(steps)))
+    student = routing_free_student(teacher, args.mode, coupling)
+    print('before fine-tuning, max score difference to the teacher: %.4f' % np.abs(
+        student.predict(valid_set[0][0], verbose=0) - teacher.predict(valid_set[0][0], verbose=0)
+    ).max())
+    history = distill(teacher, student, train_set, args.epochs, args.alpha, args.learning_rate,
+                      args.train_backbone)
+    print('distillation loss per epoch: %s' % ' '.join('%.4f' % loss for loss in history))
+
+    results = []
+    for name, model in (('teacher', teacher), ('student (%s)' % args.mode, student)):
+        scores, model_ms, head_ms = evaluate(model, valid_set)
+        y_pred = np.argmax(scores, axis=1)
+        results.append((name, accuracy_score(y_true, y_pred),
+                        f1_score(y_true, y_pred, average='weighted'),
+                        specificity_score(y_true, y_pred), model_ms, head_ms))
+
+    print('%-22s %10s %10s %12s %10s %10s' % ('model', 'accuracy', 'F-score', 'specificity',
+                                             'ms/batch', 'head ms'))
+    for name, accuracy, fscore, specificity, model_ms, head_ms in results:
+        print('%-22s %9.2f%% %9.2f%% %11.2f%% %10.2f %10.2f' % (
+            name, accuracy * 100, fscore * 100, specificity * 100, model_ms, head_ms))
+    teacher_result, student_result = results
+    print('speedup: %.2fx model, %.2fx capsule head; accuracy gap %+.2f%%, specificity gap %+.2f%%' % (
+        teacher_result[4] / student_result[4], teacher_result[5] / student_result[5],
+        (student_result[1] - teacher_result[1]) * 100, (student_result[3] - teacher_result[3]) * 100))
+
+    if args.output:
+        student.save(args.output)
+
+
+if __name__ == '__main__':
+    main()
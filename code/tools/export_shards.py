@@ -0,0 +1,42 @@
+# -*- coding: utf-8 -*-
+"""Export the `train`/`valid` directories of a dataset as sharded TFRecords
+of resized uint8 images, read by `capsnet.shards.shard_dataset`.
+
+    python3 tools/export_shards.py --dataset 200x200 --image-size 200 --shard-size 1024 --output shards
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from capsnet.resize import RESIZE_METHODS  # noqa: E402
+from capsnet.shards import export_shards  # noqa: E402
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--dataset', default='./')
+    parser.add_argument('--splits', nargs='+', default=['train', 'valid'])
+    parser.add_argument('--image-size', type=int, default=200)
+    parser.add_argument('--shard-size', type=int, default=1024, help='records per shard')
+    parser.add_argument('--output', default='shards')
+    parser.add_argument('--seed', type=int, default=0,
+                        help='seed of the class-interleaved record order')
+    parser.add_argument('--resize', default='pil-bicubic', choices=RESIZE_METHODS,
+                        help="'pil-bicubic' matches flow_from_directory, the others are batched")
+    args = parser.parse_args()
+
+    image_size = (args.image_size, args.image_size)
+    for split in args.splits:
+        prefix = os.path.join(args.output, '%s-%dx%d' % (split, args.image_size, args.image_size))
+        start = time.perf_counter()
+        manifest = export_shards(os.path.join(args.dataset, split), image_size, prefix,
+                                 args.shard_size, resize=args.resize, seed=args.seed)
+        print('%s: %d images in %d shards, %.1f s' % (prefix, manifest['samples'],
+                                                     len(manifest['shards']),
+                                                     time.perf_counter() - start))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,82 @@
+# -*- coding: utf-8 -*-
+"""Rewrite `weights-capsnet-*.h5` checkpoints to end with `Length(epsilon=0.)`
+instead of the `Lambda` vector-length head, and optionally export them for
+serving as a SavedModel and as a frozen GraphDef.
+
+    python3 tools/migrate_length_head.py 200x200/weights-capsnet-XXX.h5 --saved-model --frozen
+    python3 tools/migrate_length_head.py 128x128/weights-capsnet-origin2v1-XXX.h5 \\
+        --routing additive --activation standard_squash
+
+The scores of the rewritten model are checked against the original on a
+random batch; the output is `<checkpoint>-length.h5` (and `-length/`,
+`-length.pb`).
+"""
+import argparse
+import os
+import sys
+
+import numpy as np
+import tensorflow as tf
+from tensorflow.python.framework.convert_to_constants import convert_variables_to_constants_v2
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from capsnet import load_capsnet, replace_lambda_head  # noqa: E402
+from capsnet.models import build_capsnet  # noqa: E402
+
+
+def freeze(model, filepath):
+    """Write `model` as one GraphDef with the variables folded into constants."""
+    spec = tf.TensorSpec(model.inputs[0].shape, model.inputs[0].dtype)
+    function = tf.function(lambda x: model(x, training=False)).get_concrete_function(spec)
+    frozen = convert_variables_to_constants_v2(function)
+    tf.io.write_graph(frozen.graph.as_graph_def(), os.path.dirname(filepath) or '.',
+                      os.path.basename(filepath), as_text=False)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('checkpoints', nargs='+')
+    parser.add_argument('--routing', help='Capsule routing of the checkpoint, e.g. additive')
+    parser.add_argument('--activation', help='Capsule activation, e.g. standard_squash')
+    parser.add_argument('--saved-model', action='store_true')
+    parser.add_argument('--frozen', action='store_true')
+    parser.add_argument('--atol', type=float, default=0.,
+                        help='largest allowed absolute difference of the scores')
+    # checkpoints written with save_weights_only=True are loaded into build_capsnet
+    parser.add_argument('--backbone', default='densenet121')
+    parser.add_argument('--image-size', type=int, default=200)
+    parser.add_argument('--num-classes', type=int, default=2)
+    parser.add_argument('--routings', type=int, default=7)
+    args = parser.parse_args()
+
+    overrides = {key: value for key, value in (('routing', args.routing),
+                                                ('activation', args.activation))
+                 if value is not None}
+    failed = False
+    for checkpoint in args.checkpoints:
+        model = load_capsnet(checkpoint, build_fn=lambda: build_capsnet(
+            args.backbone, (args.image_size, args.image_size), args.num_classes,
+            args.routings, **overrides), **overrides)
+        migrated, replaced = replace_lambda_head(model)
+
+        x_batch = np.random.rand(*((4,) + tuple(model.input_shape[1:]))).astype(np.float32)
+        difference = np.abs(migrated.predict(x_batch, verbose=0) - model.predict(x_batch, verbose=0))
+        print('%s: %d Lambda head(s) replaced, max score difference %.2e' % (
+            checkpoint, replaced, difference.max()))
+        if difference.max() > args.atol:
+            print('FAILED: not written')
+            failed = True
+            continue
+
+        stem = os.path.splitext(checkpoint)[0] + '-length'
+        migrated.save(stem + '.h5')
+        if args.saved_model:
+            migrated.save(stem, save_format='tf')
+        if args.frozen:
+            freeze(migrated, stem + '.pb')
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
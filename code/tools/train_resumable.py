@@ -0,0 +1,104 @@
+# -*- coding: utf-8 -*-
+"""Train like `train_capsnet_latest15-200-full-size-da-densenet121-r8-reduce_lr-r6-r5.py`
+(`Lion`, `ReduceLROnPlateau`, learning-rate and weight-decay schedules,
+real-time augmentation) from image stores, saving the full training state
+with `capsnet.checkpoint.TrainingCheckpoint` every --period epochs and every
+--save-freq batches. After a crash, the same command with --resume
+continues from the last state, mid-epoch included.
+
+    python3 tools/train_resumable.py --dataset 200x200 --store store --epochs 350 \\
+        --state state-r6-r5 --save-freq 50 --output 200x200/capsnet-r6-r5 [--resume]
+"""
+import argparse
+import os
+import sys
+
+from tensorflow.keras.callbacks import (CSVLogger, LearningRateScheduler, ModelCheckpoint,
+                                        ReduceLROnPlateau)
+from tensorflow.keras.optimizers import Adam
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from capsnet import margin_loss  # noqa: E402
+from capsnet.checkpoint import TrainingCheckpoint, fit_resumable  # noqa: E402
+from capsnet.models import build_capsnet, compile_capsnet, preprocess_function  # noqa: E402
+from capsnet.optimizers import Lion, WeightDecayScheduler  # noqa: E402
+from capsnet.store import StoreIterator, build_store, store_path  # noqa: E402
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--dataset', default='./')
+    parser.add_argument('--store', default='store')
+    parser.add_argument('--backbone', default='densenet121')
+    parser.add_argument('--routings', type=int, default=7)
+    parser.add_argument('--image-size', type=int, default=200)
+    parser.add_argument('--batch-size', type=int, default=40)
+    parser.add_argument('--epochs', type=int, default=350)
+    parser.add_argument('--optimizer', default='lion', choices=['lion', 'adamw', 'adam'])
+    parser.add_argument('--loss', default='categorical_crossentropy',
+                        choices=['categorical_crossentropy', 'margin'])
+    parser.add_argument('--decay-epoch', type=int, default=20,
+                        help='epoch from which learning rate and weight decay are divided by 10')
+    parser.add_argument('--weights', default='imagenet',
+                        help="backbone weights, 'imagenet' or 'none'")
+    parser.add_argument('--no-da', action='store_true',
+                        help='no real-time augmentation and, like the *-no-da-* scripts, '
+                             'no preprocess_input of the backbone (rescale only)')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--jit-compile', action='store_true',
+                        help='compile the whole train step with XLA')
+    parser.add_argument('--state', default='state', help='directory of the training state')
+    parser.add_argument('--period', type=int, default=1, help='save the state every N epochs')
+    parser.add_argument('--save-freq', type=int, help='and every N batches')
+    parser.add_argument('--resume', action='store_true')
+    parser.add_argument('--output', default='capsnet', help='prefix of the log and weights')
+    args = parser.parse_args()
+
+    def lr_schedule(epoch):
+        return 1e-4 if epoch < args.decay_epoch else 1e-5
+
+    def wd_schedule(epoch):
+        return 1e-5 if epoch < args.decay_epoch else 1e-6
+
+    image_size = (args.image_size, args.image_size)
+    stores = {}
+    for split in ('train', 'valid'):
+        stores[split] = store_path(args.store, split, image_size)
+        if not os.path.exists(stores[split] + '.json'):
+            build_store(os.path.join(args.dataset, split), image_size, stores[split])
+    # the *-no-da-* scripts only rescale, train and valid
+    preprocessing_function = None if args.no_da else preprocess_function(args.backbone)
+    train_set = StoreIterator(stores['train'], args.batch_size, shuffle=True,
+                              augment=not args.no_da, seed=args.seed,
+                              preprocessing_function=preprocessing_function)
+    valid_set = StoreIterator(stores['valid'], args.batch_size,
+                              preprocessing_function=preprocessing_function)
+
+    model = build_capsnet(args.backbone, image_size, train_set.num_classes, args.routings,
+                          weights=None if args.weights == 'none' else args.weights)
+    if args.optimizer == 'lion':
+        optimizer = Lion(learning_rate=lr_schedule(0), beta_1=0.9, beta_2=0.99, wd=wd_schedule(0))
+    elif args.optimizer == 'adamw':
+        from tensorflow_addons.optimizers import AdamW
+        optimizer = AdamW(learning_rate=lr_schedule(0), weight_decay=wd_schedule(0))
+    else:
+        optimizer = Adam(learning_rate=lr_schedule(0))
+    compile_capsnet(model, args.jit_compile, optimizer=optimizer, metrics=['accuracy'],
+                    loss=margin_loss if args.loss == 'margin' else args.loss)
+
+    checkpoint = ModelCheckpoint(args.output + '-{epoch:02d}.h5', monitor='val_accuracy',
+                                 save_best_only=True, verbose=1)
+    reduce_lr = ReduceLROnPlateau(monitor='val_loss', factor=0.5, patience=5, min_lr=1e-5)
+    callbacks = [CSVLogger(args.output + '.csv', append=args.resume), checkpoint, reduce_lr,
+                 LearningRateScheduler(lr_schedule)]
+    if args.optimizer != 'adam':
+        callbacks.append(WeightDecayScheduler(wd_schedule))
+    state = TrainingCheckpoint(args.state, [checkpoint, reduce_lr], train_set, args.period,
+                               args.save_freq)
+    fit_resumable(model, train_set, args.epochs, state, resume=args.resume, callbacks=callbacks,
+                  validation_data=valid_set)
+    model.save(args.output + '.h5')
+
+
+if __name__ == '__main__':
+    main()